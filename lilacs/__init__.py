@@ -3,7 +3,8 @@ warnings.filterwarnings("ignore", message="numpy.dtype size changed")
 warnings.filterwarnings("ignore", message="numpy.ufunc size changed")
 from lilacs.processing.nlp import get_nlp
 from lilacs.processing.nlp.parse import LILACSQuestionParser, BasicTeacher
-from lilacs.memory.nodes.short_term import ConceptDatabase
+from lilacs.memory.nodes.long_term import LongTermMemory
+from lilacs.memory.nodes.traversal import GraphTraversal
 from lilacs.processing.comprehension.NER import spacy_NER_demo as extract_entities
 from lilacs.processing.nlp.parse import normalize
 from lilacs.memory.data_sources.dictionary import extract_dictionary_connections
@@ -28,8 +29,23 @@ class LILACSReactor(object):
     parser = LILACSQuestionParser()
     s2v = None
 
-    def __init__(self, debug=False):
-        self.db = ConceptDatabase(debug=debug)
+    def __init__(self, debug=False, db=None, snapshot=False, policy=None,
+                 embed=None):
+        # the in memory index answers graph questions without reloading,
+        # with a snapshot the mapped file does and no index is built
+        self.db = db or LongTermMemory(debug=debug, indexed=not snapshot)
+        # optional MemoryPolicy of db, concepts the reactor uses count as
+        # seen and the policy runs as questions come in
+        if policy is not None and policy.db is not self.db:
+            raise ValueError("policy must manage the reactor database")
+        self.policy = policy
+        # read only memory mapped graph, shared by all reactor processes
+        self.graph = self.db.load_snapshot() if snapshot else None
+        self._traversal = None
+        self._traversal_version = None
+        # local concept embeddings, when built and the database keeps them
+        if hasattr(self.db, "load_vectors"):
+            self.db.load_vectors(embed=embed)
         self.explanation = []
         self.contexts = []
         self.emotions = []
@@ -241,35 +257,121 @@ class LILACSReactor(object):
 
     # data aquisition
     def get_related_entities(self, subject, sense="auto"):
-        data = get_similar(subject, sense)
         cons = []
+        local = []
+        if hasattr(self.db, "similar_concepts"):
+            local = self.db.similar_concepts(subject)
+        if local:
+            for name, score in local:
+                cons.append((name, (score * 100) - 30))
+            self.status_update("vectors", {"connections": cons})
+            return cons
+        data = get_similar(subject, sense)
         for r in data.get("results"):
             cons.append((r["text"].strip(), (r["score"] * 100) - 30))
         self.status_update("sense2vec", {"connections": cons})
         return cons
 
     def populate_node(self, subject):
-        dbpedia = DbpediaEnquirer()
-        cons = dbpedia.get_dbpedia_cons_for_dblink(subject)
-        for c, t in cons:
-            print((c, t, 55))
-        ents = extract_conceptnet_connections(subject)
-        for c in ents:
-            print(c)
-        ents = extract_wikidata_connections(subject)
-        for c in ents:
-            print(c)
+        # aiohttp is only needed once the reactor goes online
+        from lilacs.memory.data_sources.async_client import run_async, \
+            extract_all_connections_async
+        # dbpedia, conceptnet and wikidata are queried at the same time
+        found = run_async(extract_all_connections_async(
+            subject, sources=["dbpedia", "conceptnet", "wikidata"]))
+        cons = []
+        for source, ents in found.items():
+            if isinstance(ents, Exception):
+                print("** error", source, ents)
+                continue
+            for c in ents:
+                print(c)
+                cons.append(c)
         #ents = self.get_related_entities(subject)
         #for c in ents:
         #    c = ("related", c[0], c[1])
         #    print(c)
+        return cons
 
     # short term memory
     def add_node(self, subject, description="", node_type="idea"):
         self.db.add_concept(subject, description, type=node_type)
+        self.remember(subject)
 
     def add_connection(self, source_name, target_name, con_type="related"):
-        return self.db.add_connection(source_name, target_name, con_type)
+        connection = self.db.add_connection(source_name, target_name, con_type)
+        self.remember(source_name, target_name)
+        return connection
+
+    def remember(self, *names):
+        """
+        mark concepts as seen by the memory policy and run it when due,
+        does nothing without a policy
+        """
+        if self.policy is None:
+            return
+        ids = [i for i in (self.db.concept_id_by_name(n) for n in names)
+               if i is not None]
+        if ids:
+            self.policy.touch(ids)
+        result = self.policy.maintain()
+        if result:
+            self.status_update("memory policy", result)
+
+    def resolve_node(self, name):
+        """
+        concept name for a parsed question subject, the best search hit
+        when no concept has that exact name
+
+        :return: concept name, name unchanged if nothing matches
+        """
+        if self.db.concept_id_by_name(name) is not None:
+            self.remember(name)
+            return name
+        found = self.db.search_concepts(name, limit=1)
+        if found:
+            self.status_update("resolved node", {"query": name,
+                                                 "concept": found[0].name})
+            self.remember(found[0].name)
+            return found[0].name
+        return name
+
+    # graph reasoning, answers "common" and "what of" questions
+    @property
+    def traversal(self):
+        """
+        GraphTraversal shared by every question, over the snapshot or the
+        index of the database. Databases without an index get a private
+        one, reloaded only once the graph changed
+        """
+        if self.graph is not None or \
+                getattr(self.db, "index", None) is not None:
+            if self._traversal is None:
+                self._traversal = GraphTraversal(self.db, snapshot=self.graph)
+            return self._traversal
+        version = self.db.graph_version()
+        if self._traversal is None or version != self._traversal_version:
+            self._traversal = GraphTraversal(self.db)
+            self._traversal_version = version
+        return self._traversal
+
+    def how_related(self, source_name, target_name):
+        source_name = self.resolve_node(source_name)
+        target_name = self.resolve_node(target_name)
+        path = self.traversal.path(source_name, target_name)
+        self.status_update("graph path", {"source": source_name,
+                                          "target": target_name,
+                                          "path": path})
+        return path
+
+    def in_common(self, first_name, second_name):
+        first_name = self.resolve_node(first_name)
+        second_name = self.resolve_node(second_name)
+        common = self.traversal.common_ancestors(first_name, second_name)
+        self.status_update("common ancestors", {"first": first_name,
+                                                "second": second_name,
+                                                "common": common})
+        return [c[0] for c in common]
 
     @property
     def concepts(self):
@@ -0,0 +1,352 @@
+import inspect
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from functools import wraps
+from os import makedirs
+from os.path import dirname, exists
+
+from lilacs.settings import RESPONSE_CACHE, RESPONSE_CACHE_TTL, \
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_MEMORY
+
+# value returned by get for keys that are not cached
+MISSING = object()
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS responses ("
+    "key TEXT PRIMARY KEY, endpoint TEXT NOT NULL, value BLOB NOT NULL, "
+    "size INTEGER NOT NULL, expires REAL, accessed REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_responses_accessed ON responses (accessed)",
+    "CREATE INDEX IF NOT EXISTS ix_responses_expires ON responses (expires)"
+]
+
+
+def _normalize(value, whitespace=False):
+    # keys ignore argument order, and whitespace differences if asked to
+    if whitespace and isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return dict((str(k), _normalize(v, whitespace))
+                    for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v, whitespace) for v in value]
+    return value
+
+
+def request_params(method, url, kwargs):
+    """
+    cache params of an HTTP request, whitespace in the url and the query
+    parameters does not matter, bodies and headers are kept as they are
+    """
+    kwargs = dict(kwargs)
+    if kwargs.get("params"):
+        kwargs["params"] = _normalize(kwargs["params"], whitespace=True)
+    return [method, _normalize(url, whitespace=True), kwargs]
+
+
+class ResponseCache(object):
+    """
+    persistent cache of remote lookups in a single sqlite file
+
+    entries are keyed by endpoint and normalized parameters, values are
+    stored as zlib compressed json and expire after a ttl. Once the file
+    holds more than max_size bytes of values the least recently used
+    entries are evicted. Hits and misses are counted per endpoint
+
+    the most recently used entries are also kept in memory as json text,
+    a hit there skips sqlite and zlib and still hands every caller its own
+    copy of the value
+    """
+
+    def __init__(self, path=RESPONSE_CACHE, ttl=RESPONSE_CACHE_TTL,
+                 max_size=RESPONSE_CACHE_SIZE, level=6,
+                 memory=RESPONSE_CACHE_MEMORY):
+        """
+        :param path: sqlite file, created if missing
+        :param ttl: default seconds an entry is valid, None never expires
+        :param max_size: most bytes of compressed values kept
+        :param level: zlib compression level
+        :param memory: most entries kept in memory, 0 disables it
+        """
+        if dirname(path) and not exists(dirname(path)):
+            makedirs(dirname(path))
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.level = level
+        self.memory = memory
+        self._memory = OrderedDict()  # key -> (json text, expires)
+        self._touched = {}  # key -> last memory hit
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False,
+                                     timeout=5)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        with self._conn:
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+        self.size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def key(endpoint, params):
+        return endpoint + " " + json.dumps(_normalize(params),
+                                           sort_keys=True, default=str)
+
+    def get(self, endpoint, params, default=None):
+        key = self.key(endpoint, params)
+        now = time.time()
+        with self._lock:
+            data, expires = self._memory.get(key, (None, None))
+            if data is not None and (expires is None or expires > now):
+                # access times on disk are written in batches
+                self._memory.move_to_end(key)
+                self._touched[key] = now
+                if len(self._touched) >= self.memory:
+                    self._flush_touched()
+            else:
+                row = self._conn.execute(
+                    "SELECT value, expires FROM responses WHERE key = ?",
+                    (key,)).fetchone()
+                if row is None or (row[1] is not None and row[1] <= now):
+                    self._memory.pop(key, None)
+                    self.misses[endpoint] = self.misses.get(endpoint, 0) + 1
+                    return default
+                with self._conn:
+                    self._conn.execute(
+                        "UPDATE responses SET accessed = ? WHERE key = ?",
+                        (now, key))
+                data = zlib.decompress(row[0]).decode("utf-8")
+                self._remember(key, data, row[1])
+            self.hits[endpoint] = self.hits.get(endpoint, 0) + 1
+        return json.loads(data)
+
+    def _remember(self, key, data, expires):
+        if not self.memory:
+            return
+        self._memory[key] = (data, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory:
+            self._memory.popitem(last=False)
+
+    def set(self, endpoint, params, value, ttl=MISSING):
+        """
+        :param value: anything json can serialize
+        :param ttl: seconds the entry is valid, defaults to the cache ttl
+        """
+        self.set_many(endpoint, [(params, value)], ttl)
+
+    def set_many(self, endpoint, items, ttl=MISSING):
+        """
+        store many entries in one transaction
+
+        :param items: iterable of (params, value)
+        :param ttl: seconds the entries are valid, defaults to the cache ttl
+        """
+        ttl = self.ttl if ttl is MISSING else ttl
+        now = time.time()
+        expires = None if ttl is None else now + ttl
+        with self._lock:
+            with self._conn:
+                for params, value in items:
+                    data = json.dumps(value)
+                    blob = zlib.compress(data.encode("utf-8"), self.level)
+                    key = self.key(endpoint, params)
+                    old = self._conn.execute(
+                        "SELECT size FROM responses WHERE key = ?",
+                        (key,)).fetchone()
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO responses "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, endpoint, sqlite3.Binary(blob), len(blob),
+                         expires, now))
+                    self.size += len(blob) - (old[0] if old else 0)
+                    if key in self._memory:
+                        self._remember(key, data, expires)
+            if self.size > self.max_size:
+                self._evict(now)
+
+    def delete(self, endpoint, params):
+        key = self.key(endpoint, params)
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM responses WHERE key = ?",
+                                   (key,))
+            self._memory.pop(key, None)
+            self._update_size()
+
+    def clear(self, endpoint=None):
+        with self._lock:
+            with self._conn:
+                if endpoint is None:
+                    self._conn.execute("DELETE FROM responses")
+                else:
+                    self._conn.execute(
+                        "DELETE FROM responses WHERE endpoint = ?",
+                        (endpoint,))
+            self._memory.clear()
+            self._update_size()
+
+    def evict(self):
+        """
+        drop expired entries, then least recently used ones while the
+        cache is over max_size
+        """
+        with self._lock:
+            self._evict(time.time())
+
+    def _evict(self, now):
+        self._flush_touched()
+        with self._conn:
+            self._conn.execute("DELETE FROM responses WHERE expires <= ?",
+                               (now,))
+            self._update_size()
+            # leave some room so eviction does not run on every insert
+            target = self.max_size * 0.9
+            while self.size > target:
+                rows = self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed "
+                    "LIMIT 500").fetchall()
+                if not rows:
+                    break
+                freed = 0
+                keys = []
+                for key, size in rows:
+                    keys.append((key,))
+                    freed += size
+                    if self.size - freed <= target:
+                        break
+                self._conn.executemany("DELETE FROM responses WHERE key = ?",
+                                       keys)
+                for key, in keys:
+                    self._memory.pop(key, None)
+                self.size -= freed
+
+    def _flush_touched(self):
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE responses SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._touched.items()])
+        self._touched.clear()
+
+    def _update_size(self):
+        self.size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def stats(self):
+        """
+        :return: dict with entries and bytes stored, hits and misses of
+                 this process in total and per endpoint
+        """
+        with self._lock:
+            entries = dict(self._conn.execute(
+                "SELECT endpoint, COUNT(*) FROM responses GROUP BY endpoint"))
+        endpoints = dict(
+            (endpoint, {"entries": entries.get(endpoint, 0),
+                        "hits": self.hits.get(endpoint, 0),
+                        "misses": self.misses.get(endpoint, 0)})
+            for endpoint in set(entries) | set(self.hits) | set(self.misses))
+        return {"entries": sum(entries.values()),
+                "size": self.size,
+                "hits": sum(self.hits.values()),
+                "misses": sum(self.misses.values()),
+                "endpoints": endpoints}
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    :return: process wide ResponseCache at settings.RESPONSE_CACHE, None
+             when caching is disabled
+    """
+    global _cache
+    if _cache is None and RESPONSE_CACHE:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(RESPONSE_CACHE)
+    return _cache
+
+
+def set_cache(cache):
+    """
+    replace the process wide cache, None disables caching
+    """
+    global _cache
+    _cache = cache
+
+
+def cached(endpoint, ttl=MISSING, cache_empty=False, is_empty=None):
+    """
+    decorator caching the return value of a remote lookup by its
+    arguments, defaults included so f(x) and f(x, default) share an entry,
+    the value must be json serializable. Exceptions are not cached, nor
+    are empty results unless cache_empty is set, lookups swallowing their
+    errors return those
+
+    :param is_empty: callable telling empty results apart, for lookups
+                     returning e.g. a dict of empty lists, defaults to not
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            if cache is None:
+                return func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = [bound.args, bound.kwargs]
+            value = cache.get(endpoint, params, MISSING)
+            if value is MISSING:
+                value = func(*args, **kwargs)
+                empty = is_empty(value) if is_empty else not value
+                if cache_empty or not empty:
+                    cache.set(endpoint, params, value, ttl)
+            return value
+        return wrapper
+    return decorator
+
+
+def _request(endpoint, method, url, ttl, text, kwargs):
+    cache = get_cache()
+    params = request_params(method, url, kwargs)
+    if cache is not None:
+        value = cache.get(endpoint, params, MISSING)
+        if value is not MISSING:
+            return value
+    # only needed on a miss
+    import requests
+    r = requests.request(method, url, **kwargs)
+    value = r.text if text else r.json()
+    # error pages are returned but not cached
+    if cache is not None and r.ok:
+        cache.set(endpoint, params, value, ttl)
+    return value
+
+
+def cached_json(endpoint, method, url, ttl=MISSING, **kwargs):
+    """
+    requests.request(method, url, **kwargs).json() through the cache
+    """
+    return _request(endpoint, method, url, ttl, False, kwargs)
+
+
+def cached_text(endpoint, method, url, ttl=MISSING, **kwargs):
+    """
+    requests.request(method, url, **kwargs).text through the cache
+    """
+    return _request(endpoint, method, url, ttl, True, kwargs)
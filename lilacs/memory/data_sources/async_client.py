@@ -0,0 +1,233 @@
+import asyncio
+import threading
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from lilacs.memory.cache import get_cache, request_params, MISSING
+from lilacs.memory.data_sources.conceptnet import parse_conceptnet, \
+    conceptnet_connections
+from lilacs.memory.data_sources.dbpedia import DbpediaEnquirer
+from lilacs.memory.data_sources.dbpedia_api import KEYWORD_SEARCH_URL, \
+    PREFIX_SEARCH_URL
+from lilacs.memory.data_sources.dictionary import get_dictionary, \
+    extract_dictionary_connections
+from lilacs.memory.data_sources.wikidata import get_wikidata, \
+    extract_wikidata_connections
+
+
+class AsyncSession(object):
+    """
+    pooled HTTP session shared by the async data source clients
+
+    connections are kept alive and reused between requests, every host
+    gets a semaphore so one slow API can not hold all connections, and
+    every request has a timeout. Clients without an HTTP API of their own,
+    wptools and vocabulary, run in a thread under the same limits
+
+        async with AsyncSession() as session:
+            cons = await extract_conceptnet_connections_async("dog", session)
+    """
+
+    def __init__(self, per_host=4, timeout=10, limit=64, keepalive=30):
+        """
+        :param per_host: most concurrent requests to one host
+        :param timeout: seconds a request may take in total
+        :param limit: most open connections
+        :param keepalive: seconds an idle connection is kept open
+        """
+        self.per_host = per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.limit = limit
+        self.keepalive = keepalive
+        self.session = None
+        self._semaphores = {}
+        # worker threads outlive timed out requests, their limits are
+        # taken inside the thread
+        self._thread_semaphores = {}
+        self._lock = threading.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _session(self):
+        # created lazily, aiohttp sessions belong to the running loop
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit, keepalive_timeout=self.keepalive))
+        return self.session
+
+    def _semaphore(self, host):
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.per_host)
+        return self._semaphores[host]
+
+    async def get_json(self, url, params=None, headers=None, endpoint=None):
+        """
+        :param endpoint: look the answer up in the response cache under
+                         this name, shared with cached_json
+        """
+        cache = get_cache() if endpoint else None
+        if cache is not None:
+            kwargs = dict((k, v) for k, v in (("params", params),
+                                              ("headers", headers)) if v)
+            key = request_params("get", url, kwargs)
+            value = cache.get(endpoint, key, MISSING)
+            if value is not MISSING:
+                return value
+        async with self._semaphore(urlsplit(url).netloc):
+            async with self._session().get(url, params=params,
+                                           headers=headers) as r:
+                r.raise_for_status()
+                # some APIs answer json as text/html
+                value = await r.json(content_type=None)
+        if cache is not None:
+            cache.set(endpoint, key, value)
+        return value
+
+    def _thread_semaphore(self, host):
+        with self._lock:
+            if host not in self._thread_semaphores:
+                self._thread_semaphores[host] = threading.BoundedSemaphore(
+                    self.per_host)
+            return self._thread_semaphores[host]
+
+    async def run_blocking(self, host, func, *args):
+        """
+        run a blocking client in a worker thread, counted against host
+
+        the host limit is held by the thread itself, a call that timed out
+        keeps its slot until func returns. Calls that time out while
+        waiting for a slot never run
+        """
+        semaphore = self._thread_semaphore(host)
+        abandoned = threading.Event()
+
+        def call():
+            with semaphore:
+                if abandoned.is_set():
+                    return None
+                return func(*args)
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(None, call),
+                self.timeout.total)
+        except BaseException:
+            abandoned.set()
+            raise
+
+
+def run_async(coroutine):
+    """
+    run a coroutine to completion from synchronous code, inside a running
+    event loop await it instead
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        coroutine.close()
+        raise RuntimeError("run_async called from a running event loop, "
+                           "await the coroutine instead")
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+# conceptnet
+async def get_conceptnet_async(subject, session):
+    obj = await session.get_json('http://api.conceptnet.io/c/en/' + subject,
+                                 endpoint="conceptnet")
+    return parse_conceptnet(obj)
+
+
+async def extract_conceptnet_connections_async(subject, session):
+    return conceptnet_connections(
+        await get_conceptnet_async(subject, session))
+
+
+# dbpedia
+async def dbpedia_keyword_api_async(concept, session, category=""):
+    data = await session.get_json(KEYWORD_SEARCH_URL % (category, concept),
+                                  headers={"Accept": "application/json"},
+                                  endpoint="dbpedia lookup")
+    return data["results"]
+
+
+async def dbpedia_prefix_api_async(concept, session):
+    data = await session.get_json(PREFIX_SEARCH_URL % concept,
+                                  headers={"Accept": "application/json"},
+                                  endpoint="dbpedia lookup")
+    return data["results"]
+
+
+async def extract_dbpedia_connections_async(subject, session,
+                                            dbpedia=None):
+    # SPARQLWrapper is blocking, the query runs in a thread
+    dbpedia = dbpedia or DbpediaEnquirer()
+    cons = await session.run_blocking(
+        "dbpedia.org", dbpedia.get_dbpedia_cons_for_dblink, subject)
+    return [(con_type, target, 55) for con_type, target in cons]
+
+
+# wikidata, through wptools
+async def get_wikidata_async(subject, session):
+    return await session.run_blocking("wikidata.org", get_wikidata, subject)
+
+
+async def extract_wikidata_connections_async(subject, session):
+    return await session.run_blocking("wikidata.org",
+                                      extract_wikidata_connections, subject)
+
+
+# dictionary, through vocabulary
+async def get_dictionary_async(subject, session):
+    return await session.run_blocking("dictionary", get_dictionary, subject)
+
+
+async def extract_dictionary_connections_async(subject, session):
+    return await session.run_blocking("dictionary",
+                                      extract_dictionary_connections, subject)
+
+
+SOURCES = {
+    "dbpedia": extract_dbpedia_connections_async,
+    "conceptnet": extract_conceptnet_connections_async,
+    "wikidata": extract_wikidata_connections_async,
+    "dictionary": extract_dictionary_connections_async
+}
+
+
+async def extract_all_connections_async(subject, session=None, sources=None):
+    """
+    query every source for subject at the same time
+
+    :param sources: names of the SOURCES to query, default all of them
+    :return: dict of source name -> list of (type, target, strength),
+             sources that failed map to the exception they raised
+    """
+    sources = sources or list(SOURCES)
+    own_session = session is None
+    session = session or AsyncSession()
+    try:
+        results = await asyncio.gather(
+            *[SOURCES[source](subject, session) for source in sources],
+            return_exceptions=True)
+    finally:
+        if own_session:
+            await session.close()
+    return dict(zip(sources, results))
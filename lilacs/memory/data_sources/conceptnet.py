@@ -1,8 +1,12 @@
-import requests
+from lilacs.memory.cache import cached_json
 
 
 def extract_conceptnet_connections(subject):
-    connections = get_conceptnet(subject)  # type : [nodes]
+    return conceptnet_connections(get_conceptnet(subject))
+
+
+def conceptnet_connections(connections):
+    # type : [nodes] -> [(type, target, strength)]
     new_cons = []
     for con_type in connections:
         cons = connections[con_type]
@@ -14,6 +18,13 @@ def extract_conceptnet_connections(subject):
 
 def get_conceptnet(subject):
     # get knowledge about
+    obj = cached_json("conceptnet", "get",
+                      'http://api.conceptnet.io/c/en/' + subject)
+    return parse_conceptnet(obj)
+
+
+def parse_conceptnet(obj):
+    # api.conceptnet.io json -> type : [nodes]
     parents = []
     capable = []
     has = []
@@ -37,7 +48,6 @@ def get_conceptnet(subject):
                 words[idx] = ""
         return " ".join(words).strip()
 
-    obj = requests.get('http://api.conceptnet.io/c/en/' + subject).json()
     for edge in obj["edges"]:
         r, s, t = edge["@id"].split(",")
         if not s.startswith("/c/en/") or not t.startswith("/c/en/"):
@@ -1,15 +1,119 @@
 from __future__ import print_function
 from lilacs.settings import SPOTLIGHT_URL
 import spotlight
-import requests
 import sys
 import os
 import hashlib
+import json
 import pickle
 import re
 from SPARQLWrapper import SPARQLWrapper, JSON
 from SPARQLWrapper.SPARQLExceptions import QueryBadFormed
 from lilacs.memory.data_sources.resources import OWL_FILE
+from lilacs.memory.cache import cached, cached_json, get_cache, MISSING
+
+SPARQL_URL = 'http://dbpedia.org/sparql'
+# response cache endpoints, results are stored under the sha256 of the query
+SPARQL_CACHE = "dbpedia sparql"
+ONTOLOGY_TYPE_CACHE = "dbpedia ontology type"
+# one pickle file per query, used before the response cache
+PICKLE_CACHE = os.path.join(os.path.dirname(os.path.realpath(__file__)), '.dbpedia_cache')
+
+
+def query_key(query):
+    """
+    sha256 hex digest of a query or dblink, also the file name it had in the pickle cache
+    """
+    if isinstance(query, str):
+        query = query.encode('utf-8')
+    return hashlib.sha256(query).hexdigest()
+
+
+def _cache_lookup(name, key, cache, endpoint, default):
+    cache = cache or get_cache()
+    if cache is None:
+        return default
+    return cache.get(name, [endpoint, query_key(key)], default)
+
+
+def cached_query(query, cache=None, endpoint=SPARQL_URL, default=None):
+    """
+    @param query: SPARQL query
+    @param cache: ResponseCache to look in, defaults to the process wide one
+    @return: the result bindings stored for query, default if it was never run
+    @rtype: list
+    """
+    return _cache_lookup(SPARQL_CACHE, query, cache, endpoint, default)
+
+
+def cached_ontology_type(dblink, cache=None, endpoint=SPARQL_URL, default=None):
+    """
+    @param dblink: the dbpedia link
+    @param cache: ResponseCache to look in, defaults to the process wide one
+    @return: the deepest ontology label stored for dblink, default if it was never looked up
+    @rtype: string
+    """
+    return _cache_lookup(ONTOLOGY_TYPE_CACHE, dblink, cache, endpoint, default)
+
+
+def import_pickle_cache(folder=PICKLE_CACHE, cache=None, endpoint=SPARQL_URL, remove=False, batch_size=1000):
+    """
+    Move the pickle files of an old .dbpedia_cache folder into the response cache, the queries
+    are found again by their hash. Only run this on folders written by LILACS, pickle can execute code
+    @param folder: the old cache folder
+    @type folder: str
+    @param cache: ResponseCache to fill, defaults to the process wide one
+    @param endpoint: SPARQL endpoint the results came from
+    @type endpoint: str
+    @param remove: delete every file once imported, and the folder if it ends up empty
+    @type remove: bool
+    @return: number of files imported and skipped
+    @rtype: tuple
+    """
+    cache = cache or get_cache()
+    if cache is None:
+        raise ValueError("response cache is disabled")
+    imported, skipped = 0, 0
+    batches = {SPARQL_CACHE: [], ONTOLOGY_TYPE_CACHE: []}
+    done = []
+
+    def flush():
+        for name, batch in batches.items():
+            if batch:
+                cache.set_many(name, batch)
+                del batch[:]
+        if remove:
+            for path in done:
+                os.remove(path)
+        del done[:]
+
+    if not os.path.isdir(folder):
+        return imported, skipped
+    for entry in os.scandir(folder):
+        digest, _, extension = entry.name.partition('.')
+        if not entry.is_file() or len(digest) != 64 or extension not in ('', 'ontologytype'):
+            skipped += 1
+            continue
+        try:
+            with open(entry.path, 'rb') as fd:
+                value = pickle.load(fd)
+            # the cache stores json
+            json.dumps(value)
+        except Exception:
+            skipped += 1
+            continue
+        if extension:
+            batches[ONTOLOGY_TYPE_CACHE].append(([endpoint, digest], value))
+        else:
+            batches[SPARQL_CACHE].append(([endpoint, digest], value))
+        done.append(entry.path)
+        imported += 1
+        if len(done) >= batch_size:
+            flush()
+    flush()
+    if remove and not os.listdir(folder):
+        os.rmdir(folder)
+    return imported, skipped
 
 
 class DbpediaOntology(object):
@@ -104,42 +208,27 @@ class DbpediaEnquirer(object):
     This class allows to query dbpedia using the Virtuoso SPARQL endpoint and gives access to different type of information
     """
 
-    def __init__(self, endpoint='http://dbpedia.org/sparql'):
+    def __init__(self, endpoint=SPARQL_URL, cache=None):
+        """
+        @param cache: ResponseCache for query results, defaults to the process wide one
+        """
         self.__endpoint__ = endpoint
-        self.__thisfolder__ = os.path.dirname(os.path.realpath(__file__))
-        self.__cache_folder__ = self.__thisfolder__ + '/.dbpedia_cache'
+        self.cache = cache
         self.__dbpedia_ontology__ = DbpediaOntology()
 
-    def __get_name_cached_file(self, query):
-        if isinstance(query, str):
-            query = query.encode('utf-8')
-        cached_file = self.__cache_folder__ + '/' + hashlib.sha256(query).hexdigest()
-        return cached_file
-
-    def __get_name_cached_ontology_type(self, dblink):
-        if isinstance(dblink, str):
-            dblink = dblink.encode('utf-8')
-        cached_file = self.__cache_folder__ + '/' + hashlib.sha256(dblink).hexdigest() + '.ontologytype'
-        return cached_file
-
     def __my_query(self, this_query):
-        cached_file = self.__get_name_cached_file(this_query)
-        if os.path.exists(cached_file):
-            fd = open(cached_file, 'rb')
-            results = pickle.load(fd)
-            fd.close()
-        else:
-            sparql = SPARQLWrapper(self.__endpoint__)
-            sparql.setQuery(this_query)
-            sparql.setReturnFormat(JSON)
-            query = sparql.query()
-            # query.setJSONModule(json)
-            results = query.convert()['results']['bindings']
-            if not os.path.exists(self.__cache_folder__):
-                os.mkdir(self.__cache_folder__)
-            fd = open(cached_file, 'wb')
-            pickle.dump(results, fd, protocol=-1)
-            fd.close()
+        results = cached_query(this_query, self.cache, self.__endpoint__, MISSING)
+        if results is not MISSING:
+            return results
+        sparql = SPARQLWrapper(self.__endpoint__)
+        sparql.setQuery(this_query)
+        sparql.setReturnFormat(JSON)
+        query = sparql.query()
+        # query.setJSONModule(json)
+        results = query.convert()['results']['bindings']
+        cache = self.cache or get_cache()
+        if cache is not None:
+            cache.set(SPARQL_CACHE, [self.__endpoint__, query_key(this_query)], results)
         return results
 
     def get_deepest_ontology_class_for_dblink(self, dblink):
@@ -151,7 +240,9 @@ class DbpediaEnquirer(object):
         @return: the deespest DBpedia ontology label
         @rtype: string
         """
-        deepest = None
+        deepest = cached_ontology_type(dblink, self.cache, self.__endpoint__)
+        if deepest is not None:
+            return deepest
         onto_labels = self.get_dbpedia_labels_for_dblink(dblink)
         pair_label_path = []
         for ontolabel in onto_labels:
@@ -159,6 +250,9 @@ class DbpediaEnquirer(object):
             pair_label_path.append((ontolabel, len(this_path)))
         if len(pair_label_path) > 0:
             deepest = sorted(pair_label_path, key=lambda t: -t[1])[0][0]
+            cache = self.cache or get_cache()
+            if cache is not None:
+                cache.set(ONTOLOGY_TYPE_CACHE, [self.__endpoint__, query_key(dblink)], deepest)
         return deepest
 
     def get_all_instances_for_ontology_label(self, ontology_label, log=False):
@@ -489,10 +583,14 @@ class DbpediaEnquirer(object):
         return " ".join(words)
 
 
+@cached("spotlight")
+def spotlight_annotate(text, url=SPOTLIGHT_URL):
+    return spotlight.annotate(url, text)
+
+
 def scrap_resource_page(link):
     u = link.replace("http://dbpedia.org/resource/", "http://dbpedia.org/data/") + ".json"
-    data = requests.get(u)
-    json_data = data.json()
+    json_data = cached_json("dbpedia", "get", u)
     dbpedia = {}
     dbpedia["related_subjects"] = []
     dbpedia["picture"] = []
@@ -550,7 +648,7 @@ def scrap_resource_page(link):
 def tag(text):
     urls = []
     try:
-        annotations = spotlight.annotate(SPOTLIGHT_URL, text)
+        annotations = spotlight_annotate(text)
         for annotation in annotations:
             score = annotation["similarityScore"]
             # entry we are talking about
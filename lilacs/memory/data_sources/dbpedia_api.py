@@ -1,19 +1,22 @@
 # self hosted - https://github.com/dbpedia/lookup
 
-import requests
+from lilacs.memory.cache import cached_json
+
+KEYWORD_SEARCH_URL = "http://lookup.dbpedia.org/api/search/KeywordSearch?QueryClass=%s&QueryString=%s"
+PREFIX_SEARCH_URL = "http://lookup.dbpedia.org/api/search/PrefixSearch?QueryClass=&MaxHits=5&QueryString=%s"
 
 
 def dbpedia_keyword_api(concept, category=""):
-    url = "http://lookup.dbpedia.org/api/search/KeywordSearch?QueryClass=" + category +"&QueryString=" + concept
-    r = requests.get(url, headers={"Accept": "application/json"})
-    data = r.json()
+    url = KEYWORD_SEARCH_URL % (category, concept)
+    data = cached_json("dbpedia lookup", "get", url,
+                       headers={"Accept": "application/json"})
     return data["results"]
 
 
 def dbpedia_prefix_api(concept):
-    url = "http://lookup.dbpedia.org/api/search/PrefixSearch?QueryClass=&MaxHits=5&QueryString=" + concept
-    r = requests.get(url, headers={"Accept": "application/json"})
-    data = r.json()
+    url = PREFIX_SEARCH_URL % concept
+    data = cached_json("dbpedia lookup", "get", url,
+                       headers={"Accept": "application/json"})
     return data["results"]
 
 
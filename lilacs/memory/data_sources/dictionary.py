@@ -1,4 +1,5 @@
 from vocabulary.vocabulary import Vocabulary as vb
+from lilacs.memory.cache import cached
 
 
 def extract_dictionary_connections(subject):
@@ -18,6 +19,8 @@ def extract_dictionary_connections(subject):
     return concepts
 
 
+# a failed lookup still returns every key, with empty lists
+@cached("dictionary", is_empty=lambda cons: not any(cons.values()))
 def get_dictionary(subject):
     cons = {"meaning": [], "synonym": [], "antonym": [], "example": [], "part of speech": []}
     meanings = vb.meaning(subject, format="list")
@@ -1,12 +1,11 @@
-import requests
+from lilacs.memory.cache import cached_json
 
 
 # use the source https://github.com/dice-group/GENESIS
 def genesis_data(text):
     url = "http://genesis.aksw.org/api/search"
     data = {"q": text}
-    r = requests.post(url, json=data)
-    return r.json()
+    return cached_json("genesis", "post", url, json=data)
 
 #print(genesis_data("dog"))
 # [{'image': 'http://commons.wikimedia.org/wiki/Special:FilePath/Collage_of_Nine_Dogs.jpg?width=300', 'description': 'The domestic dog (Canis lupus familiaris or Canis familiaris) is a domesticated canine which has been selectively bred over millennia for various behaviours, sensory capabilities, and physical attributes. Although initially thought to have originated as an artificial variant of an extant canid species (variously supposed as being the dhole, golden jackal, or gray wolf), extensive genetic studies undertaken during the 2010s indicate that dogs diverged from an extinct wolf-like canid in Eurasia 40,000 years ago. Their long association with humans has led to dogs being uniquely attuned to human behavior and are able to thrive on a starch-rich diet which would be inadequate for other canid species. Dogs are also the oldest domesticated animal. Dogs vary widely in shape, size and colours. Dogs perform many roles for people, such as hunting, herding, pulling loads, protection, assisting police and military, companionship and, more recently, aiding handicapped individuals. This influence on human society has given them the sobriquet, "man\'s best friend".', 'title': 'Dog', 'url': 'http://dbpedia.org/resource/Dog'}, {'image': 'http://placehold.it/350x150', 'description': 'Einer frisst den anderen (released as Dog Eat Dog!, in the United States) is a 1964 German crime drama film that starred Jayne Mansfield, Cameron Mitchell, Dodie Heath, Ivor Salter, Isa Miranda, Elisabeth Flickenschildt, Werner Peters, and Pinkas Braun. Filming occurred in late 1963 in Yugoslavia. Mansfield was pregnant with Mariska Hargitay during filming.', 'title': 'Dog Eat Dog 1964 Film', 'url': 'http://dbpedia.org/resource/Dog_Eat_Dog_(1964_film)'}, {'image': 'http://commons.wikimedia.org/wiki/Special:FilePath/Dog_eat_Dog_–_Reload_Festival_2016_02.jpg?width=300', 'description': 'Dog Eat Dog, an American band originally from Bergen County, New Jersey, began in 1990 as part of the hardcore music scenes of New York City and New Jersey. With members now scattered through New Jersey, Washington, D.C. and Europe, the band refers to themselves as being based out of all three locations. Dog Eat Dog was one of the earliest bands to fuse hardcore and rap, a style that would later become commonplace. Dog Eat Dog has achieved commercial success with singles such as "No Fronts", "Expect The Unexpected" and "Who\'s The King" – all showcasing their blend of hardcore, rap and saxophone. Since their first album, the band\'s sound has evolved to incorporate elements of funk, ska and hip hop. As of 2009, the lineup of the band consists of Dave Neabore (bass), John Connor (vocals), Brandon Finley (drums) and Roger Haemmerli (guitar).', 'title': 'Dog Eat Dog Band', 'url': 'http://dbpedia.org/resource/Dog_Eat_Dog_(band)'}, {'image': 'http://placehold.it/350x150', 'description': "Dog Eat Dog Films is film director Michael Moore's production company. Dog Eat Dog Films has produced films, television programs, and DVDs.", 'title': 'Dog Eat Dog Films', 'url': 'http://dbpedia.org/resource/Dog_Eat_Dog_Films'}, {'image': 'http://placehold.it/350x150', 'description': 'Perro Come Perro (English: Dog Eat Dog) is a 2008 Colombian thriller film by director Carlos Moreno. The film depicts the violence among the low life, crime filled life of some criminals in the city of Cali. The film was shown at the 2008 Sundance Film Festival.The soundtrack of the film included a song by Colombian band Superlitio.', 'title': 'Dog Eat Dog 2008 Film', 'url': 'http://dbpedia.org/resource/Dog_Eat_Dog_(2008_film)'}, {'image': 'http://placehold.it/350x150', 'description': '"Dog Eat Dog" is a song by Australian hard rock band AC/DC. It is the second track of their album Let There Be Rock, released in 1977, and was written by Angus Young, Malcolm Young, and Bon Scott. It was released as a single in Australia, and included the non-album track "Carry Me Home" on the B-side, which was later released on Backtracks. AC/DC played "Dog Eat Dog" on their Black Ice World Tour until early 2010 when they dropped it from the set list and added "High Voltage".', 'title': 'Dog Eat Dog Song', 'url': 'http://dbpedia.org/resource/Dog_Eat_Dog_(song)'}, {'image': 'http://placehold.it/350x150', 'description': '"Good Dog Bad Dog" is a 2009 single by a Polish singer and dancer Mandaryna.', 'title': 'Good Dog Bad Dog', 'url': 'http://dbpedia.org/resource/Good_Dog_Bad_Dog'}, {'image': 'http://placehold.it/350x150', 'description': 'Dog Bite Dog  (Chinese: 狗咬狗) is a 2006 Hong Kong action crime thriller film directed by Soi Cheang and starring Edison Chen as a brutal Cambodian assassin, desperately trying to evade the police, led by Sam Lee, after completing an assignment in Hong Kong. The film was released in Hong Kong cinemas on 17 August 2006.', 'title': 'Dog Bite Dog', 'url': 'http://dbpedia.org/resource/Dog_Bite_Dog'}, {'image': 'http://placehold.it/350x150', 'description': 'Dog Eat Dog is a 2001 British film, directed by Moody Shoaibi and written by Moody Shoaibi and Mark Tonderai.', 'title': 'Dog Eat Dog 2001 Film', 'url': 'http://dbpedia.org/resource/Dog_Eat_Dog_(2001_film)'}, {'image': 'http://placehold.it/350x150', 'description': 'Good Dog, Bad Dog is the fourth studio album by Over the Rhine, released independently in 1996, and reissued with a slightly altered track listing by Virgin/Backporch in 2000.', 'title': 'Good Dog Bad Dog', 'url': 'http://dbpedia.org/resource/Good_Dog,_Bad_Dog'}, {'image': 'http://placehold.it/350x150', 'description': "Dog Mountain is a unique farm in St. Johnsbury, Vermont with 150 acres of scenic trails, trout ponds, dog sculptures, an art gallery and the popular Dog Chapel. It was run by Vermont artists Stephen Huneck and Gwen Huneck until their deaths. Gwen's brother, Jonathan Ide of Fitchburg, Wisconsin, is directing the business.", 'title': 'Dog Mountain Dog Park', 'url': 'http://dbpedia.org/resource/Dog_Mountain_(dog_park)'}, {'image': 'http://commons.wikimedia.org/wiki/Special:FilePath/Hot_dog_with_mustard.png?width=300', 'description': "A hot dog (also spelled hotdog) is a cooked sausage, traditionally grilled or steamed and served in a sliced bun as a sandwich. Hot dog variants include the corn dog and pigs in blankets. Typical hot dog garnishes include mustard, ketchup, onions, mayonnaise, relish, coleslaw, cheese, chili, olives, and sauerkraut. This kind of sausage was culturally imported from Germany and popularized in the United States, where it became a working-class street food sold at hot dog stands and hot dog carts, and developed an association with baseball and American culture. Hot dog preparation and condiment styles vary regionally in the US. Although linked in particular with New York City and New York City cuisine, the hot dog became ubiquitous throughout the United States during the 20th century, becoming an important part of other regional cuisines, most notably Chicago street cuisine. The hot dog's cultural traditions include the Nathan's Hot Dog Eating Contest and the Oscar Mayer Wienermobile.", 'title': 'Hot Dog', 'url': 'http://dbpedia.org/resource/Hot_dog'}, {'image': 'http://commons.wikimedia.org/wiki/Special:FilePath/Big_and_little_dog_1.jpg?width=300', 'description': 'Dog breeds are dogs that have relatively uniform physical characteristics developed under controlled conditions by humans, with breeding animals selected for phenotypic traits such as size, coat color, structure, and behavior. The Fédération Cynologique Internationale recognizes over 400 pure dog breeds. Other uses of the term breed when referring to dogs may include pure breeds, cross-breeds, mixed breeds and natural breeds.', 'title': 'Dog Breed', 'url': 'http://dbpedia.org/resource/Dog_breed'}, {'image': 'http://commons.wikimedia.org/wiki/Special:FilePath/Swedish_police_dogs.jpg?width=300', 'description': 'A police dog, known as a "K-9" or "K9" (a homophone of "canine") in some English-speaking countries, is a dog that is specifically trained to assist police and other law-enforcement personnel in their work. Their duties include searching for drugs and explosives, searching for lost people, looking for crime scene evidence, and protecting their handlers. Police dogs must remember several hand and verbal commands. The most commonly used breed is the German Shepherd. In many common law jurisdictions, the intentional injuring or killing of a police dog is a felony.', 'title': 'Police Dog', 'url': 'http://dbpedia.org/resource/Police_dog'}, {'image': 'http://commons.wikimedia.org/wiki/Special:FilePath/Dog_coat_variation.png?width=300', 'description': "The coat of the domestic dog (Canis lupus familiaris) refers to the hair that covers its body. A dog's coat may be a double coat, made up of a soft undercoat and a tougher topcoat, or a single coat, which lacks an undercoat. Double coats have a top coat, made of stiff hairs to help repel water and shield from dirt, and an undercoat to serve as insulation. The terms fur and hair are often used interchangeably when describing a dog's coat, however in general, a double coat, e.g., like that of the Newfoundland and most mountain dogs, is referred to as a fur coat, while a single coat, like that of the Poodle, is referred to as a hair coat.", 'title': 'Coat Dog', 'url': 'http://dbpedia.org/resource/Coat_(dog)'}, {'image': 'http://commons.wikimedia.org/wiki/Special:FilePath/Black-Tailed_Prairie_Dog.jpg?width=300', 'description': "Prairie dogs (genus Cynomys) are herbivorous burrowing rodents native to the grasslands of North America. The five species are: black-tailed, white-tailed, Gunnison's, Utah, and Mexican prairie dogs. They are a type of ground squirrel, found in the United States, Canada and Mexico. In Mexico, prairie dogs are found primarily in the northern states, which lie at the southern end of the Great Plains: northeastern Sonora, north and northeastern Chihuahua, northern Coahuila, northern Nuevo León, and northern Tamaulipas. In the United States, they range primarily to the west of the Mississippi River, though they have also been introduced in a few eastern locales. Despite the name, they are not canines.", 'title': 'Prairie Dog', 'url': 'http://dbpedia.org/resource/Prairie_dog'}, {'image': 'http://commons.wikimedia.org/wiki/Special:FilePath/DogSledRace.jpg?width=300', 'description': 'A dog sled or dog sleigh is a sled pulled by one or more sled dogs used to travel over ice and through snow. Numerous types of sleds are used, depending on their function. They can be used for dog sled racing.', 'title': 'Dog Sled', 'url': 'http://dbpedia.org/resource/Dog_sled'}, {'image': 'http://commons.wikimedia.org/wiki/Special:FilePath/Kelpie_walking_across_the_backs_of_sheep.jpg?width=300', 'description': 'A herding dog, also known as a stock dog or working dog, is a type of pastoral dog that either has been trained in herding or belongs to breeds developed for herding. Their ability to be trained to act on the sound of a whistle or word of command is renowned throughout the world. Collies are recommended as herding dogs.', 'title': 'Herding Dog', 'url': 'http://dbpedia.org/resource/Herding_dog'}, {'image': 'http://commons.wikimedia.org/wiki/Special:FilePath/Chihuahua1_bvdb.jpg?width=300', 'description': 'The Chihuahua /tʃɪˈwɑːwɑː/ (Spanish: chihuahueño) is the smallest breed of dog and is named for the state of Chihuahua in Mexico. Chihuahuas come in a wide variety of sizes, head shapes, colors, and coat lengths.', 'title': 'Chihuahua Dog', 'url': 'http://dbpedia.org/resource/Chihuahua_(dog)'}]
\ No newline at end of file
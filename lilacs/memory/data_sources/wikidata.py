@@ -1,5 +1,6 @@
 import wptools
-from lilacs.memory.nodes.short_term import ConceptDatabase
+from lilacs.memory.nodes.long_term import LongTermMemory
+from lilacs.memory.cache import cached
 
 __author__ = 'jarbas'
 
@@ -7,7 +8,7 @@ __author__ = 'jarbas'
 def extract_wikidata_connections(subject, save=False, db=None):
     cons = get_wikidata(subject) # type : [nodes] || node
     if save:
-        db = db or ConceptDatabase(debug=False)
+        db = db or LongTermMemory(debug=False)
 
     connections = []  # concept : [{type : con, strength: score}]
     skips = ["heart rate", "image", "topic's main category", "earliest date", "Commons gallery", "signature",
@@ -30,26 +31,22 @@ def extract_wikidata_connections(subject, save=False, db=None):
                     t = target.split(",")
                     for target in t:
                         connections.append((con_type, target, 46))
-                        if save:
-                            db.add_connection(subject, target, con_type)
                 else:
                     connections.append((con_type, target, 46))
-                    if save:
-                        db.add_connection(subject, target, con_type)
         elif targets:
             if "," in targets:
                 t = targets.split(",")
                 for target in t:
                     connections.append((con_type, target, 46))
-                    if save:
-                        db.add_connection(subject, target, con_type)
             else:
                 connections.append((con_type, targets, 46))
-                if save:
-                    db.add_connection(subject, targets, con_type)
+    if save:
+        db.add_connections_bulk([(subject, con_type, target, strength)
+                                 for con_type, target, strength in connections])
     return connections
 
 
+@cached("wikidata")
 def get_wikidata(subject):
     node_data = {}
     base = wptools.page(subject).get_parse().data["wikibase"]
@@ -1,6 +1,7 @@
-import requests
 import bs4
 
+from lilacs.memory.cache import cached_text
+
 
 class WikiHow(object):
 
@@ -21,8 +22,8 @@ class WikiHow(object):
     @staticmethod
     def _get_html(url):
         headers = {'User-Agent': "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:41.0) Gecko/20100101 Firefox/41.0"}
-        r = requests.get(url, headers=headers)
-        html = r.text.encode("utf8")
+        html = cached_text("wikihow", "get", url, headers=headers)
+        html = html.encode("utf8")
         return html
 
     @staticmethod
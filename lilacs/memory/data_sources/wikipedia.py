@@ -1,6 +1,7 @@
 from __future__ import print_function
 import wptools
-from lilacs.memory.nodes.short_term import ConceptDatabase
+from lilacs.memory.nodes.long_term import LongTermMemory
+from lilacs.memory.cache import cached
 
 __author__ = 'jarbas'
 
@@ -9,7 +10,7 @@ def extract_wikipedia_connections(subject, save=False, db=None, nlp=None):
     data = get_wikipedia(subject)
     subject = data["name"]
     if save:
-        db = db or ConceptDatabase(debug=False)
+        db = db or LongTermMemory(debug=False)
 
     connections = [] # concept : [{type : con, strength: score}]
     if save:
@@ -25,6 +26,7 @@ def extract_wikipedia_connections(subject, save=False, db=None, nlp=None):
     return connections
 
 
+@cached("wikipedia")
 def get_wikipedia(subject):
     node_data = {}
     try:
@@ -6,7 +6,8 @@ __author__ = "JarbasAI"
 Base = declarative_base()
 
 
-from sqlalchemy import Column, ForeignKey, Integer, String, Text, Table, UnicodeText, Unicode
+from sqlalchemy import Column, ForeignKey, Integer, String, Text, Table, UnicodeText, Unicode, Index, \
+    UniqueConstraint
 from sqlalchemy.orm import relationship, backref
 
 
@@ -18,15 +19,22 @@ from sqlalchemy.orm import relationship, backref
 
 class Concept(Base):
     __tablename__ = "concepts"
+    __table_args__ = {"sqlite_autoincrement": True}
     id = Column(Integer, primary_key=True, nullable=False)
     description = Column(UnicodeText)
-    name = Column(UnicodeText)
-    type = Column(Unicode, default="label")
-    last_seen = Column(Integer, default=0)
+    name = Column(UnicodeText, index=True)
+    type = Column(Unicode, default="label", index=True)
+    # last crawl, indexed for crawlers looking for the stalest concepts
+    last_seen = Column(Integer, default=0, index=True)
+    # last use by the reactor or a crawler, for the memory policy
+    last_used = Column(Integer, default=0, server_default="0", index=True)
+    # times the concept was touched, for least frequently used eviction
+    hits = Column(Integer, default=0, server_default="0")
     out_connections = relationship("Connection", back_populates="source",
                                    foreign_keys="Connection.source_id", cascade="all, delete-orphan")
     in_connections = relationship("Connection", back_populates="target",
                                   foreign_keys="Connection.target_id", cascade="all, delete-orphan")
+    aliases = relationship("Alias", back_populates="concept", cascade="all, delete-orphan")
 
     def __repr__(self):
         return self.name + ":" + str(self.id)
@@ -34,12 +42,17 @@ class Concept(Base):
 
 class Connection(Base):
     __tablename__ = 'connections'
+    # the unique constraint also serves (source_id, target_id) lookups
+    __table_args__ = (UniqueConstraint("source_id", "target_id", "type",
+                                       name="uq_connections_source_target_type"),
+                      Index("ix_connections_source_type", "source_id", "type"),
+                      {"sqlite_autoincrement": True})
     id = Column(Integer, primary_key=True, nullable=False)
     last_seen = Column(Integer, default=0)
     strength = Column(Integer, default=50)
-    type = Column(Unicode, default="related")
+    type = Column(Unicode, default="related", index=True)
     source_id = Column(Integer, ForeignKey('concepts.id'))
-    target_id = Column(Integer, ForeignKey('concepts.id'))
+    target_id = Column(Integer, ForeignKey('concepts.id'), index=True)
     source = relationship("Concept", back_populates="out_connections", foreign_keys=[source_id])
     target = relationship("Concept", back_populates="in_connections", foreign_keys=[target_id])
 
@@ -48,6 +61,42 @@ class Connection(Base):
         return self.type + ": " + str(self.source.name) + "->" + str(self.target.name)
 
 
+class Alias(Base):
+    # normalized name key -> concept, every concept has the key of its own
+    # name plus any synonyms, see nodes.names.normalize_name
+    __tablename__ = "aliases"
+    id = Column(Integer, primary_key=True, nullable=False)
+    key = Column(UnicodeText, nullable=False, unique=True)
+    concept_id = Column(Integer, ForeignKey('concepts.id'), index=True)
+    concept = relationship("Concept", back_populates="aliases")
+
+    def __repr__(self):
+        return self.key + "->" + str(self.concept_id)
+
+
+class ArchivedConcept(Base):
+    # concepts evicted from short term memory, see nodes.policy
+    __tablename__ = "archived_concepts"
+    id = Column(Integer, primary_key=True, nullable=False)
+    description = Column(UnicodeText)
+    name = Column(UnicodeText, index=True)
+    type = Column(Unicode)
+    last_seen = Column(Integer, default=0)
+    hits = Column(Integer, default=0)
+    archived_at = Column(Integer, default=0)
+
+
+class ArchivedConnection(Base):
+    # connections are archived by name, concept ids do not survive eviction
+    __tablename__ = "archived_connections"
+    id = Column(Integer, primary_key=True, nullable=False)
+    source_name = Column(UnicodeText, index=True)
+    type = Column(Unicode)
+    target_name = Column(UnicodeText, index=True)
+    strength = Column(Integer, default=50)
+    archived_at = Column(Integer, default=0)
+
+
 def model_to_dict(obj):
     serialized_data = {c.key: getattr(obj, c.key) for c in obj.__table__.columns}
     return serialized_data
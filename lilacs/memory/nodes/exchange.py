@@ -0,0 +1,266 @@
+"""
+export and import of the concept graph
+
+"nt" N-Triples and "bin" binary files can be imported again. N-Triples
+does not keep connection strengths, imported connections get the default
+strength. "ttl" Turtle is export only, for reasoners like EYE
+"""
+import re
+import struct
+from urllib.parse import quote, unquote
+
+from lilacs.memory.nodes import Concept, Connection
+from lilacs.memory.nodes.short_term import SourceConcept, TargetConcept
+
+CONCEPT_NS = "urn:lilacs:concept:"
+RELATION_NS = "urn:lilacs:relation:"
+TYPE_NS = "urn:lilacs:type:"
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+
+BINARY_MAGIC = b"LILACSX1"
+
+_TRIPLE = re.compile(r'^\s*<([^>]*)>\s+<([^>]*)>\s+<([^>]*)>\s*\.\s*$')
+_SAFE_LOCAL = re.compile(r'^[A-Za-z0-9_%][A-Za-z0-9_%-]*$')
+
+
+# records, the common stream of every format
+#   ("concept", name, type)
+#   ("connection", source_name, type, target_name, strength)
+def iter_records(db, batch_size=10000):
+    """
+    stream the graph of a ConceptDatabase as records, concepts first,
+    rows are fetched batch_size at a time
+    """
+    for name, concept_type in db.session.query(
+            Concept.name, Concept.type).order_by(
+            Concept.id).yield_per(batch_size):
+        yield ("concept", name, concept_type)
+    for source, con_type, target, strength in db.session.query(
+            SourceConcept.name, Connection.type, TargetConcept.name,
+            Connection.strength).join(
+            SourceConcept, Connection.source_id == SourceConcept.id).join(
+            TargetConcept, Connection.target_id == TargetConcept.id).order_by(
+            Connection.id).yield_per(batch_size):
+        yield ("connection", source, con_type, target, strength)
+
+
+def import_records(db, records, chunk_size=5000):
+    """
+    ingest a record stream through the bulk insert path, existing
+    concepts and connections are skipped
+
+    :return: (number of concepts, number of connections) read
+    """
+    concepts = {}  # type -> names
+    connections = []
+    counts = [0, 0]
+
+    def flush():
+        for concept_type, names in sorted(concepts.items()):
+            db.add_concepts_bulk(names, type=concept_type)
+        concepts.clear()
+        if connections:
+            db.add_connections_bulk(connections)
+            del connections[:]
+
+    for record in records:
+        if record[0] == "concept":
+            concepts.setdefault(record[2], []).append(record[1])
+            counts[0] += 1
+        else:
+            connections.append(record[1:])
+            counts[1] += 1
+        if counts[0] + counts[1] and \
+                (counts[0] + counts[1]) % chunk_size == 0:
+            flush()
+    flush()
+    return tuple(counts)
+
+
+# N-Triples and Turtle
+def _iri(namespace, value):
+    return "<" + namespace + quote(value or "", safe="") + ">"
+
+
+def _from_iri(iri, namespace):
+    if iri.startswith(namespace):
+        return unquote(iri[len(namespace):])
+    return None
+
+
+def iter_ntriples(records):
+    """
+    N-Triples lines for a record stream, concept types become rdf:type
+    triples, connection strength is not kept
+    """
+    for record in records:
+        if record[0] == "concept":
+            yield "%s <%s> %s .\n" % (_iri(CONCEPT_NS, record[1]), RDF_TYPE,
+                                      _iri(TYPE_NS, record[2]))
+        else:
+            yield "%s %s %s .\n" % (_iri(CONCEPT_NS, record[1]),
+                                    _iri(RELATION_NS, record[2]),
+                                    _iri(CONCEPT_NS, record[3]))
+
+
+def _turtle_term(prefix, namespace, value):
+    local = quote(value or "", safe="")
+    if _SAFE_LOCAL.match(local):
+        return prefix + ":" + local
+    return "<" + namespace + local + ">"
+
+
+def iter_turtle(records):
+    """
+    Turtle for a record stream, the N3 dialect the EYE reasoner reads.
+    Consecutive triples of one subject are grouped, connection strength
+    is not kept and there is no Turtle reader
+    """
+    yield "@prefix c: <%s> .\n" % CONCEPT_NS
+    yield "@prefix r: <%s> .\n" % RELATION_NS
+    yield "@prefix t: <%s> .\n\n" % TYPE_NS
+    subject = None
+    for record in records:
+        if record[0] == "concept":
+            triple = (record[1], "a", _turtle_term("t", TYPE_NS, record[2]))
+        else:
+            triple = (record[1], _turtle_term("r", RELATION_NS, record[2]),
+                      _turtle_term("c", CONCEPT_NS, record[3]))
+        if triple[0] == subject:
+            yield " ;\n    %s %s" % triple[1:]
+        else:
+            if subject is not None:
+                yield " .\n"
+            subject = triple[0]
+            yield "%s %s %s" % ((_turtle_term("c", CONCEPT_NS, subject),) +
+                                triple[1:])
+    if subject is not None:
+        yield " .\n"
+
+
+def parse_ntriples(lines):
+    """
+    records from N-Triples lines written by iter_ntriples, triples outside
+    the LILACS namespaces are skipped
+    """
+    for line in lines:
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        match = _TRIPLE.match(line)
+        if not match:
+            raise ValueError("not an N-Triples line: " + line)
+        subject, predicate, obj = match.groups()
+        source = _from_iri(subject, CONCEPT_NS)
+        if source is None:
+            continue
+        if predicate == RDF_TYPE:
+            concept_type = _from_iri(obj, TYPE_NS)
+            if concept_type is not None:
+                yield ("concept", source, concept_type)
+            continue
+        con_type = _from_iri(predicate, RELATION_NS)
+        target = _from_iri(obj, CONCEPT_NS)
+        if con_type is not None and target is not None:
+            yield ("connection", source, con_type, target, None)
+
+
+# binary, length prefixed records
+#   b"C" name type
+#   b"E" source type target float64 strength
+# every string is a uint32 length followed by utf-8 bytes, strengths are
+# doubles since sqlite keeps whatever number was stored, whole ones are
+# read back as int
+def _pack_str(value):
+    data = (value or "").encode("utf-8")
+    return struct.pack("<I", len(data)) + data
+
+
+def iter_binary(records):
+    """
+    binary chunks for a record stream, starting with BINARY_MAGIC
+    """
+    yield BINARY_MAGIC
+    for record in records:
+        if record[0] == "concept":
+            yield b"C" + _pack_str(record[1]) + _pack_str(record[2])
+        else:
+            strength = 50 if record[4] is None else record[4]
+            yield b"E" + _pack_str(record[1]) + _pack_str(record[2]) + \
+                _pack_str(record[3]) + struct.pack("<d", strength)
+
+
+def _read_exact(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("truncated LILACS binary graph")
+    return data
+
+
+def _read_str(f):
+    size = struct.unpack("<I", _read_exact(f, 4))[0]
+    return _read_exact(f, size).decode("utf-8")
+
+
+def parse_binary(f):
+    """
+    records from a binary file object written with iter_binary
+    """
+    if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError("not a LILACS binary graph")
+    while True:
+        kind = f.read(1)
+        if not kind:
+            return
+        if kind == b"C":
+            yield ("concept", _read_str(f), _read_str(f))
+        elif kind == b"E":
+            source = _read_str(f)
+            con_type = _read_str(f)
+            target = _read_str(f)
+            strength = struct.unpack("<d", _read_exact(f, 8))[0]
+            if strength.is_integer():
+                strength = int(strength)
+            yield ("connection", source, con_type, target, strength)
+        else:
+            raise ValueError("unknown record in LILACS binary graph")
+
+
+# files
+_WRITERS = {"nt": iter_ntriples, "ttl": iter_turtle, "bin": iter_binary}
+
+
+def export_graph(db, path, format="nt", batch_size=10000):
+    """
+    write the graph of a ConceptDatabase to path, streaming
+
+    :param format: "nt" N-Triples, "ttl" Turtle or "bin" binary
+    :return: path
+    """
+    if format not in _WRITERS:
+        raise ValueError("unknown format: " + format)
+    chunks = _WRITERS[format](iter_records(db, batch_size))
+    if format == "bin":
+        with open(path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(chunk)
+    return path
+
+
+def import_graph(db, path, format="nt", chunk_size=5000):
+    """
+    load a file written by export_graph into a ConceptDatabase
+
+    :param format: "nt" N-Triples or "bin" binary
+    :return: (number of concepts, number of connections) read
+    """
+    if format == "bin":
+        with open(path, "rb") as f:
+            return import_records(db, parse_binary(f), chunk_size)
+    if format == "nt":
+        with open(path, encoding="utf-8") as f:
+            return import_records(db, parse_ntriples(f), chunk_size)
+    raise ValueError("unknown format: " + format)
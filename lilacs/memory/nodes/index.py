@@ -0,0 +1,268 @@
+from sqlalchemy import event, inspect
+from threading import RLock
+
+from lilacs.memory.nodes import Alias, Concept, Connection
+from lilacs.memory.nodes.names import normalize_name
+
+
+class GraphIndex(object):
+    """
+    In memory adjacency index mirroring the concepts and connections tables
+
+    concepts are kept as id -> (name, type), connections as
+    id -> (source_id, type, target_id, strength), with adjacency sets per
+    concept and a (type, source_id, target_id) key set for existence checks
+
+    names are looked up by their normalized key through the aliases table
+    """
+
+    def __init__(self):
+        self.names = {}  # normalized key -> set of concept ids
+        self.aliases = {}  # alias id -> (key, concept id)
+        self.concepts = {}  # concept id -> (name, type)
+        self.connections = {}  # connection id -> (source_id, type, target_id, strength)
+        self.out_edges = {}  # concept id -> set of connection ids
+        self.in_edges = {}  # concept id -> set of connection ids
+        self.pairs = {}  # (source_id, target_id) -> set of connection ids
+        self.edge_keys = {}  # (type, source_id, target_id) -> connection id
+        # held while a batch of changes is applied
+        self.lock = RLock()
+
+    def clear(self):
+        self.names.clear()
+        self.aliases.clear()
+        self.concepts.clear()
+        self.connections.clear()
+        self.out_edges.clear()
+        self.in_edges.clear()
+        self.pairs.clear()
+        self.edge_keys.clear()
+
+    def load(self, session):
+        # plain column queries, no ORM objects are built
+        with self.lock:
+            self.clear()
+            for concept_id, name, concept_type in session.query(
+                    Concept.id, Concept.name, Concept.type):
+                self.add_concept(concept_id, name, concept_type)
+            for alias_id, key, concept_id in session.query(
+                    Alias.id, Alias.key, Alias.concept_id):
+                self.add_alias(alias_id, key, concept_id)
+            for con_id, source_id, con_type, target_id, strength in \
+                    session.query(Connection.id, Connection.source_id,
+                                  Connection.type, Connection.target_id,
+                                  Connection.strength):
+                self.add_connection(con_id, source_id, con_type, target_id,
+                                    strength)
+
+    # concepts
+    def add_concept(self, concept_id, name, concept_type=None):
+        if concept_id in self.concepts:
+            self.remove_concept(concept_id, keep_edges=True)
+        self.concepts[concept_id] = (name, concept_type)
+
+    def remove_concept(self, concept_id, keep_edges=False):
+        if concept_id not in self.concepts:
+            return
+        self.concepts.pop(concept_id)
+        if keep_edges:
+            return
+        for con_id in list(self.out_edges.get(concept_id, [])) + \
+                list(self.in_edges.get(concept_id, [])):
+            self.remove_connection(con_id)
+        self.out_edges.pop(concept_id, None)
+        self.in_edges.pop(concept_id, None)
+
+    # aliases
+    def add_alias(self, alias_id, key, concept_id):
+        if alias_id in self.aliases:
+            self.remove_alias(alias_id)
+        self.aliases[alias_id] = (key, concept_id)
+        self.names.setdefault(key, set()).add(concept_id)
+
+    def remove_alias(self, alias_id):
+        if alias_id not in self.aliases:
+            return
+        key, concept_id = self.aliases.pop(alias_id)
+        ids = self.names.get(key)
+        if ids is not None:
+            ids.discard(concept_id)
+            if not ids:
+                self.names.pop(key)
+
+    # readers iterating the sets take the lock, commits of other threads
+    # change them in place
+    def concept_id(self, name):
+        key = normalize_name(name)
+        with self.lock:
+            ids = self.names.get(key)
+            if ids:
+                return min(ids)
+        return None
+
+    def concept_ids(self, name):
+        key = normalize_name(name)
+        with self.lock:
+            return sorted(self.names.get(key, []))
+
+    def concept_name(self, concept_id):
+        concept = self.concepts.get(concept_id)
+        if concept:
+            return concept[0]
+        return None
+
+    def concept_type(self, concept_id):
+        concept = self.concepts.get(concept_id)
+        if concept:
+            return concept[1]
+        return None
+
+    # connections
+    def add_connection(self, con_id, source_id, con_type, target_id,
+                       strength=50):
+        if con_id in self.connections:
+            self.remove_connection(con_id)
+        self.connections[con_id] = (source_id, con_type, target_id, strength)
+        self.out_edges.setdefault(source_id, set()).add(con_id)
+        self.in_edges.setdefault(target_id, set()).add(con_id)
+        self.pairs.setdefault((source_id, target_id), set()).add(con_id)
+        self.edge_keys.setdefault((con_type, source_id, target_id), con_id)
+
+    def remove_connection(self, con_id):
+        if con_id not in self.connections:
+            return
+        source_id, con_type, target_id, _ = self.connections.pop(con_id)
+        for table, key in ((self.out_edges, source_id),
+                           (self.in_edges, target_id),
+                           (self.pairs, (source_id, target_id))):
+            ids = table.get(key)
+            if ids is not None:
+                ids.discard(con_id)
+                if not ids:
+                    table.pop(key)
+        key = (con_type, source_id, target_id)
+        if self.edge_keys.get(key) == con_id:
+            self.edge_keys.pop(key)
+            # another row may still carry the same key
+            for other in self.pairs.get((source_id, target_id), []):
+                if self.connections[other][1] == con_type:
+                    self.edge_keys[key] = other
+                    break
+
+    def connection(self, con_id):
+        return self.connections.get(con_id)
+
+    def connection_ids_by_pair(self, source_id, target_id):
+        with self.lock:
+            return sorted(self.pairs.get((source_id, target_id), []))
+
+    def connection_id(self, con_type, source_id, target_id):
+        return self.edge_keys.get((con_type, source_id, target_id))
+
+    def has_connection(self, con_type, source_id, target_id):
+        return (con_type, source_id, target_id) in self.edge_keys
+
+    def out_connections(self, concept_id):
+        with self.lock:
+            return [self.connections[c]
+                    for c in self.out_edges.get(concept_id, [])]
+
+    def in_connections(self, concept_id):
+        with self.lock:
+            return [self.connections[c]
+                    for c in self.in_edges.get(concept_id, [])]
+
+    def total_concepts(self):
+        return len(self.concepts)
+
+    def total_connections(self):
+        return len(self.connections)
+
+    # write through
+    @staticmethod
+    def _pending(session):
+        # staged rows live with each session, one per thread
+        return session.info.setdefault("graph_index_pending", [])
+
+    def stage(self, session, rows):
+        """
+        apply rows, as made by _row, once session commits, for changes the
+        session events do not see such as core inserts
+        """
+        self._pending(session).extend(rows)
+
+    def staged(self, session):
+        # does session hold changes the index does not have yet
+        return bool(session.info.get("graph_index_pending"))
+
+    def attach(self, session):
+        """
+        keep the index in sync with every flush of session, changes are
+        staged on flush and only applied once the transaction commits
+
+        :param session: sqlalchemy session, sessionmaker or scoped_session
+                        to follow, every session they create is followed
+        """
+        pending = self._pending
+
+        def after_flush(session, flush_context):
+            # objects are expired by the time the commit finishes, copy
+            # the column values now
+            for obj in list(session.new) + list(session.dirty):
+                if not inspect(obj).deleted:
+                    pending(session).append(self._row(obj, removed=False))
+
+        def persistent_to_deleted(session, obj):
+            # also fires for delete-orphan cascades, which never show up
+            # in session.deleted
+            pending(session).append(self._row(obj, removed=True))
+
+        def after_commit(session):
+            rows = pending(session)
+            with self.lock:
+                for row in rows:
+                    self._apply(row)
+            del rows[:]
+
+        def after_rollback(session, previous_transaction):
+            del pending(session)[:]
+
+        event.listen(session, "after_flush", after_flush)
+        event.listen(session, "persistent_to_deleted", persistent_to_deleted)
+        event.listen(session, "after_commit", after_commit)
+        event.listen(session, "after_soft_rollback", after_rollback)
+        return session
+
+    @staticmethod
+    def _row(obj, removed=False):
+        if isinstance(obj, Concept):
+            return ("concept", removed, obj.id, obj.name, obj.type)
+        if isinstance(obj, Connection):
+            return ("connection", removed, obj.id, obj.source_id, obj.type,
+                    obj.target_id, obj.strength)
+        if isinstance(obj, Alias):
+            return ("alias", removed, obj.id, obj.key, obj.concept_id)
+        return (None, removed)
+
+    def _apply(self, row):
+        kind, removed = row[:2]
+        if kind == "concept":
+            concept_id, name, concept_type = row[2:]
+            if removed:
+                self.remove_concept(concept_id)
+            else:
+                self.add_concept(concept_id, name, concept_type)
+        elif kind == "connection":
+            con_id, source_id, con_type, target_id, strength = row[2:]
+            if removed or source_id is None or target_id is None:
+                # malformed connections are not reachable from the graph
+                self.remove_connection(con_id)
+            else:
+                self.add_connection(con_id, source_id, con_type, target_id,
+                                    strength)
+        elif kind == "alias":
+            alias_id, key, concept_id = row[2:]
+            if removed or concept_id is None:
+                self.remove_alias(alias_id)
+            else:
+                self.add_alias(alias_id, key, concept_id)
@@ -0,0 +1,396 @@
+import json
+import os
+import threading
+import time
+from os.path import exists, getsize
+
+from lilacs.settings import MUTATION_LOG_COMPACT_SIZE
+
+
+class MutationLog(object):
+    """
+    append only JSONL log of graph mutations
+
+    every record gets a sequence number, records appended close together
+    are written by one writer thread with a single write and a single
+    fsync (group commit). A torn last line left behind by a crash is
+    dropped when the log is opened again
+
+    compact drops the records up to a sequence number, they are replaced
+    by a single "checkpoint" record so numbering continues after a restart
+    """
+
+    def __init__(self, path, batch_size=512, flush_interval=0.005,
+                 fsync=True):
+        """
+        :param path: log file, created if missing
+        :param batch_size: most records written per group
+        :param flush_interval: seconds a group waits for more records
+        :param fsync: fsync every group, off trades durability for speed
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.last_seq = self._recover()
+        # highest sequence number known to be on disk
+        self.durable_seq = self.last_seq
+        self._pending = []  # (seq, line) not written yet
+        self._closed = False
+        self._cond = threading.Condition()
+        # held while the file is written to or replaced
+        self._io_lock = threading.Lock()
+        self._file = open(path, "ab")
+        self._thread = threading.Thread(target=self._write_loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _recover(self):
+        # truncate a torn last line and return the last sequence number
+        if not exists(self.path):
+            return 0
+        with open(self.path, "rb+") as f:
+            end = f.seek(0, 2)
+            pos = end
+            data = b""
+            cut = -1
+            while pos > 0:
+                step = min(65536, pos)
+                pos -= step
+                f.seek(pos)
+                data = f.read(step) + data
+                cut = data.rfind(b"\n")
+                if cut >= 0 and data.rfind(b"\n", 0, cut) >= 0:
+                    break
+            if cut < 0:
+                f.truncate(0)
+                return 0
+            if pos + cut + 1 < end:
+                f.truncate(pos + cut + 1)
+            line = data[data.rfind(b"\n", 0, cut) + 1:cut]
+            return json.loads(line.decode("utf-8"))["seq"]
+
+    def append(self, op, **fields):
+        """
+        queue a record, it is on disk once wait returns for its sequence
+        number
+
+        :param op: mutation name, see apply_records
+        :return: sequence number of the record
+        """
+        with self._cond:
+            if self._closed:
+                raise ValueError("mutation log is closed")
+            self.last_seq += 1
+            record = {"seq": self.last_seq, "time": time.time(), "op": op}
+            record.update(fields)
+            line = json.dumps(record, separators=(",", ":")) + "\n"
+            self._pending.append((self.last_seq, line.encode("utf-8")))
+            self._cond.notify_all()
+            return self.last_seq
+
+    def wait(self, seq=None, timeout=None):
+        """
+        block until record seq, by default the last one, is on disk
+
+        :return: True if it is, False on timeout
+        """
+        seq = self.last_seq if seq is None else seq
+        with self._cond:
+            return self._cond.wait_for(lambda: self.durable_seq >= seq,
+                                       timeout)
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                if len(self._pending) < self.batch_size and \
+                        self.flush_interval and not self._closed:
+                    # give concurrent writers a chance to join the group
+                    self._cond.wait(self.flush_interval)
+                batch = self._pending[:self.batch_size]
+                del self._pending[:len(batch)]
+            with self._io_lock:
+                self._file.write(b"".join(line for _, line in batch))
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            with self._cond:
+                self.durable_seq = batch[-1][0]
+                self._cond.notify_all()
+
+    def compact(self, seq):
+        """
+        drop the records up to seq from the log, e.g. once they are applied
+        to the database. Readers further behind can not catch up anymore,
+        see LogReader.read
+
+        :return: True if the log was rewritten
+        """
+        seq = min(seq, self.durable_seq)
+        with self._io_lock:
+            with open(self.path, "rb") as src:
+                pos = 0
+                for line in src:
+                    if json.loads(line.decode("utf-8"))["seq"] > seq:
+                        break
+                    pos += len(line)
+                if not pos:
+                    return False
+                tmp = self.path + ".compact"
+                with open(tmp, "wb") as dst:
+                    dst.write(json.dumps(
+                        {"seq": seq, "time": time.time(), "op": "checkpoint"},
+                        separators=(",", ":")).encode("utf-8") + b"\n")
+                    # sequence numbers only grow, the rest is copied as is
+                    src.seek(pos)
+                    while True:
+                        chunk = src.read(1 << 20)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+            os.replace(tmp, self.path)
+            self._file.close()
+            self._file = open(self.path, "ab")
+        return True
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._file.close()
+
+
+class LogReader(object):
+    """
+    reads complete records of a mutation log, also while another process
+    is appending to it or compacting it
+    """
+
+    def __init__(self, path, after=0):
+        """
+        :param path: log file
+        :param after: skip records up to this sequence number
+        """
+        self.path = path
+        self.after = after
+        self.offset = 0
+        # (device, inode) the offset belongs to
+        self._file_id = None
+
+    def read(self, limit=None):
+        """
+        records are read line by line, limit bounds the memory used on a
+        long log
+
+        :param limit: most records returned, None for all
+        :return: list of records appended since the last call
+        """
+        if not exists(self.path):
+            return []
+        records = []
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            file_id = (stat.st_dev, stat.st_ino)
+            if file_id != self._file_id or stat.st_size < self.offset:
+                # compacted, sequence numbers skip what was read already
+                self._file_id = file_id
+                self.offset = 0
+            f.seek(self.offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # still being written
+                    break
+                self.offset += len(line)
+                record = json.loads(line.decode("utf-8"))
+                if record["seq"] <= self.after:
+                    continue
+                if record["op"] == "checkpoint":
+                    raise ValueError("mutation log compacted past record %d"
+                                     % self.after)
+                records.append(record)
+                self.after = record["seq"]
+                if limit and len(records) >= limit:
+                    break
+        return records
+
+    def tail(self, poll_interval=0.5, stop=None, batch_size=10000):
+        """
+        follow the log, yields records as they are appended
+
+        :param stop: optional threading.Event ending the generator
+        :param batch_size: most records read at once
+        """
+        while stop is None or not stop.is_set():
+            records = self.read(batch_size)
+            for record in records:
+                yield record
+            if not records:
+                time.sleep(poll_interval)
+
+
+def read_log(path, after=0):
+    return LogReader(path, after).read()
+
+
+def apply_records(db, records):
+    """
+    apply mutation records to a ConceptDatabase in one transaction,
+    records are idempotent so replaying an applied one changes nothing
+
+    :return: sequence number of the last applied record, None if empty
+    """
+    last = None
+    with db.transaction():
+        cons = []
+        for record in records:
+            if record["op"] == "connections":
+                cons += [tuple(c) for c in record["connections"]]
+            elif record["op"] == "concept":
+                if cons:
+                    db.add_connections_bulk(cons)
+                    cons = []
+                db.add_concept(record["name"], record["description"],
+                               record["type"])
+            elif record["op"] == "seen":
+                if cons:
+                    db.add_connections_bulk(cons)
+                    cons = []
+                db.mark_seen(record["name"], record["timestamp"])
+            else:
+                raise ValueError("unknown mutation: " + record["op"])
+            last = record["seq"]
+        if cons:
+            db.add_connections_bulk(cons)
+    return last
+
+
+class LoggedWriter(object):
+    """
+    write front end of a ConceptDatabase backed by a MutationLog
+
+    mutations return as soon as they are queued for the log and are
+    applied to the database by a background thread, many records per
+    sqlite commit. The sequence number of the last applied record is kept
+    next to the log, on start everything after it is replayed. Once the
+    log grows past compact_size the applied records are dropped from it,
+    replicas following the log must keep up or start from a copy of the
+    database. If applying fails no more mutations are accepted
+    """
+
+    def __init__(self, db, path=None, batch_size=512, fsync=True,
+                 apply_batch=10000, compact_size=MUTATION_LOG_COMPACT_SIZE):
+        """
+        :param apply_batch: most records applied per sqlite commit
+        :param compact_size: log bytes that trigger a compaction, None
+                             keeps every record
+        """
+        self.db = db
+        self.apply_batch = apply_batch
+        self.compact_size = compact_size
+        self.log = MutationLog(path or db.log_path, batch_size=batch_size,
+                               fsync=fsync)
+        self.checkpoint_path = self.log.path + ".applied"
+        self.applied_seq = 0
+        if exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                self.applied_seq = int(f.read().strip() or 0)
+        self._reader = LogReader(self.log.path, self.applied_seq)
+        self._cond = threading.Condition()
+        self._stopped = False
+        self.error = None
+        # crash recovery, before new records can arrive
+        while self._apply(self._reader.read(self.apply_batch)):
+            pass
+        self._thread = threading.Thread(target=self._apply_loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _append(self, op, **fields):
+        if self.error is not None:
+            raise RuntimeError("mutations are not applied anymore: %r"
+                               % self.error)
+        return self.log.append(op, **fields)
+
+    def add_concept(self, name, description="", type="idea"):
+        return self._append("concept", name=name, description=description,
+                            type=type)
+
+    def add_connection(self, source_name, target_name, type="related",
+                       strength=50):
+        return self.add_connections_bulk(
+            [(source_name, type, target_name, strength)])
+
+    def add_connections_bulk(self, connections):
+        """
+        :param connections: iterable of (source_name, type, target_name, strength)
+        :return: sequence number of the record
+        """
+        return self._append("connections",
+                            connections=[list(c) for c in connections])
+
+    def mark_seen(self, name, timestamp=None):
+        """
+        set last_seen of a concept, e.g. once a crawler is done with it
+        """
+        return self._append("seen", name=name,
+                            timestamp=int(timestamp or time.time()))
+
+    def _apply(self, records):
+        if not records:
+            return False
+        seq = apply_records(self.db, records)
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(seq))
+        os.replace(tmp, self.checkpoint_path)
+        with self._cond:
+            self.applied_seq = seq
+            self._cond.notify_all()
+        if self.compact_size and getsize(self.log.path) > self.compact_size:
+            self.log.compact(seq)
+        return True
+
+    def _apply_loop(self):
+        while True:
+            stopping = self._stopped
+            # wake up once a new record is on disk
+            self.log.wait(self.applied_seq + 1, timeout=0.1)
+            try:
+                self._apply(self._reader.read(self.apply_batch))
+            except Exception as e:
+                # the records stay in the log and are replayed on restart
+                with self._cond:
+                    self.error = e
+                    self._cond.notify_all()
+                break
+            if stopping:
+                break
+        self.db.close()
+
+    def sync(self, timeout=None):
+        """
+        block until everything appended so far is in the database
+
+        :return: True if it is, False on timeout
+        """
+        seq = self.log.last_seq
+        with self._cond:
+            done = self._cond.wait_for(
+                lambda: self.applied_seq >= seq or self.error, timeout)
+        if self.error is not None:
+            raise self.error
+        return bool(done)
+
+    def close(self):
+        try:
+            self.sync()
+        finally:
+            self.log.close()
+            self._stopped = True
+            self._thread.join()
@@ -0,0 +1,28 @@
+from lilacs.memory.nodes.short_term import ConceptDatabase
+from lilacs.settings import DATABASE_DIR, LONG_TERM_DATABASE
+from os.path import join
+
+
+class LongTermMemory(ConceptDatabase):
+    """
+    persistent concept database, reopening it resumes from the knowledge
+    gathered by previous runs, several crawlers can share it
+    """
+
+    def __init__(self, name=None, debug=False, indexed=False, path=None,
+                 pragmas=None):
+        """
+        :param name: named store under DATABASE_DIR, defaults to LONG_TERM_DATABASE
+        :param debug: echo SQL
+        :param indexed: keep an in memory GraphIndex of the store
+        :param path: explicit database file, overrides name
+        :param pragmas: sqlite pragmas, defaults to settings.SQLITE_PRAGMAS
+        """
+        if path is None:
+            if name is None:
+                path = LONG_TERM_DATABASE
+            else:
+                path = join(DATABASE_DIR, name + ".db")
+        self.name = name
+        ConceptDatabase.__init__(self, debug=debug, indexed=indexed,
+                                 path=path, pragmas=pragmas)
@@ -0,0 +1,282 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+
+from lilacs.memory.nodes import Base, Concept
+from lilacs.memory.nodes.names import normalize_name
+from lilacs.memory.nodes.search import has_search_index
+
+
+def get_schema_version(connection):
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def set_schema_version(connection, version):
+    connection.execute(text("PRAGMA user_version = %d" % int(version)))
+
+
+def rebuild_table(connection, name, schema):
+    """
+    recreate a table keeping all rows, sqlite can not alter keys or
+    constraints in place. Migrations pass the schema of their own version,
+    never the current model, so they give the same result whenever they
+    run
+
+    :param connection: sqlalchemy connection inside a transaction
+    :param name: table name
+    :param schema: list of SQL statements creating the table and its indexes
+    """
+    if name not in inspect(connection).get_table_names():
+        for statement in schema:
+            connection.execute(text(statement))
+        return
+    old = name + "_old"
+    # do not rewrite foreign keys of other tables to point at the old copy
+    connection.execute(text("PRAGMA legacy_alter_table = ON"))
+    connection.execute(text("ALTER TABLE %s RENAME TO %s" % (name, old)))
+    connection.execute(text("PRAGMA legacy_alter_table = OFF"))
+    # index names are global in sqlite, free them for the new table
+    for index in inspect(connection).get_indexes(old):
+        connection.execute(text("DROP INDEX IF EXISTS %s" % index["name"]))
+    for statement in schema:
+        connection.execute(text(statement))
+    new_columns = [c["name"] for c in inspect(connection).get_columns(name)]
+    columns = [c["name"] for c in inspect(connection).get_columns(old)
+               if c["name"] in new_columns]
+    columns = ", ".join(columns)
+    # rows violating constraints added since are dropped, the first one
+    # in id order is kept
+    connection.execute(text(
+        "INSERT OR IGNORE INTO %s (%s) SELECT %s FROM %s ORDER BY id" %
+        (name, columns, columns, old)))
+    connection.execute(text("DROP TABLE %s" % old))
+
+
+def _autoincrement_ids(connection):
+    # ids used to be allocated as COUNT(*) + 1 by the application
+    rebuild_table(connection, "concepts", [
+        "CREATE TABLE concepts (id INTEGER NOT NULL PRIMARY KEY "
+        "AUTOINCREMENT, description TEXT, name TEXT, type VARCHAR, "
+        "last_seen INTEGER)"])
+    rebuild_table(connection, "connections", [
+        "CREATE TABLE connections (id INTEGER NOT NULL PRIMARY KEY "
+        "AUTOINCREMENT, last_seen INTEGER, strength INTEGER, type VARCHAR, "
+        "source_id INTEGER, target_id INTEGER, "
+        "FOREIGN KEY(source_id) REFERENCES concepts (id), "
+        "FOREIGN KEY(target_id) REFERENCES concepts (id))"])
+
+
+def _indexes_and_unique_connections(connection):
+    # keep the oldest of every duplicated connection before adding the
+    # unique constraint
+    connection.execute(text(
+        "DELETE FROM connections WHERE id NOT IN "
+        "(SELECT MIN(id) FROM connections "
+        "GROUP BY source_id, target_id, type)"))
+    rebuild_table(connection, "connections", [
+        "CREATE TABLE connections (id INTEGER NOT NULL PRIMARY KEY "
+        "AUTOINCREMENT, last_seen INTEGER, strength INTEGER, type VARCHAR, "
+        "source_id INTEGER, target_id INTEGER, "
+        "CONSTRAINT uq_connections_source_target_type "
+        "UNIQUE (source_id, target_id, type), "
+        "FOREIGN KEY(source_id) REFERENCES concepts (id), "
+        "FOREIGN KEY(target_id) REFERENCES concepts (id))",
+        "CREATE INDEX ix_connections_source_type ON connections "
+        "(source_id, type)",
+        "CREATE INDEX ix_connections_target_id ON connections (target_id)",
+        "CREATE INDEX ix_connections_type ON connections (type)"])
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_concepts_name ON concepts (name)"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_concepts_type ON concepts (type)"))
+
+
+def _concept_hits(connection):
+    # databases rebuilt by the first migration already have the column
+    columns = [c["name"] for c in inspect(connection).get_columns(
+        Concept.__tablename__)]
+    if "hits" not in columns:
+        connection.execute(text(
+            "ALTER TABLE concepts ADD COLUMN hits INTEGER DEFAULT 0"))
+
+
+def _aliases(connection):
+    # concepts whose names only differ in case or separators collapse
+    # into the oldest one, which gets the key of the name as its alias
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS aliases (id INTEGER NOT NULL, "
+        "\"key\" TEXT NOT NULL, concept_id INTEGER, PRIMARY KEY (id), "
+        "UNIQUE (\"key\"), "
+        "FOREIGN KEY(concept_id) REFERENCES concepts (id))"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS "
+                            "ix_aliases_concept_id ON aliases (concept_id)"))
+    groups = {}
+    for concept_id, name in connection.execute(text(
+            "SELECT id, name FROM concepts ORDER BY id")):
+        if name:
+            groups.setdefault(normalize_name(name), []).append(concept_id)
+    for key, ids in groups.items():
+        keep = ids[0]
+        for dup in ids[1:]:
+            # would turn into self loops
+            connection.execute(text(
+                "DELETE FROM connections WHERE (source_id = :dup AND "
+                "target_id = :keep) OR (source_id = :keep AND "
+                "target_id = :dup)"), keep=keep, dup=dup)
+            for column in ("source_id", "target_id"):
+                connection.execute(text(
+                    "UPDATE OR IGNORE connections SET %s = :keep "
+                    "WHERE %s = :dup" % (column, column)), keep=keep, dup=dup)
+            # connections keep already had
+            connection.execute(text(
+                "DELETE FROM connections WHERE source_id = :dup "
+                "OR target_id = :dup"), dup=dup)
+            connection.execute(text("DELETE FROM concepts WHERE id = :dup"),
+                               dup=dup)
+    if groups:
+        connection.execute(text(
+            "INSERT INTO aliases (\"key\", concept_id) "
+            "VALUES (:key, :concept_id)"),
+            [{"key": key, "concept_id": ids[0]}
+             for key, ids in groups.items()])
+
+
+# full text search, kept in sync by triggers so core inserts and other
+# processes are covered too. concept_fts indexes words of names and
+# descriptions, alias_trigrams every alias key for substring and fuzzy
+# matching. Both are external content tables, the text lives only once
+SEARCH_INDEX = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS concept_fts USING fts5("
+    "name, description, content='concepts', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS alias_trigrams USING fts5("
+    "key, content='aliases', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS concepts_search_insert AFTER INSERT ON "
+    "concepts BEGIN INSERT INTO concept_fts(rowid, name, description) "
+    "VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS concepts_search_delete AFTER DELETE ON "
+    "concepts BEGIN INSERT INTO concept_fts(concept_fts, rowid, name, "
+    "description) VALUES ('delete', old.id, old.name, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS concepts_search_update AFTER UPDATE OF "
+    "name, description ON concepts BEGIN INSERT INTO concept_fts(concept_fts, "
+    "rowid, name, description) VALUES ('delete', old.id, old.name, "
+    "old.description); INSERT INTO concept_fts(rowid, name, description) "
+    "VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS aliases_search_insert AFTER INSERT ON "
+    "aliases BEGIN INSERT INTO alias_trigrams(rowid, key) "
+    "VALUES (new.id, new.key); END",
+    "CREATE TRIGGER IF NOT EXISTS aliases_search_delete AFTER DELETE ON "
+    "aliases BEGIN INSERT INTO alias_trigrams(alias_trigrams, rowid, key) "
+    "VALUES ('delete', old.id, old.key); END",
+    "CREATE TRIGGER IF NOT EXISTS aliases_search_update AFTER UPDATE OF key "
+    "ON aliases BEGIN INSERT INTO alias_trigrams(alias_trigrams, rowid, key) "
+    "VALUES ('delete', old.id, old.key); INSERT INTO alias_trigrams(rowid, "
+    "key) VALUES (new.id, new.key); END",
+    "INSERT INTO concept_fts(concept_fts) VALUES ('rebuild')",
+    "INSERT INTO alias_trigrams(alias_trigrams) VALUES ('rebuild')"
+]
+
+
+def create_search_index(connection):
+    """
+    create and fill the full text search tables, a no-op when sqlite was
+    built without FTS5, search then falls back to LIKE
+
+    :return: True if the search tables exist
+    """
+    try:
+        connection.execute(text("CREATE VIRTUAL TABLE temp.fts5_probe "
+                                "USING fts5(x, tokenize='trigram')"))
+        connection.execute(text("DROP TABLE temp.fts5_probe"))
+    except OperationalError:
+        return False
+    for statement in SEARCH_INDEX:
+        connection.execute(text(statement))
+    return True
+
+
+def _last_seen_index(connection):
+    # the crawl scheduler refills from the stalest concepts
+    connection.execute(text("CREATE INDEX IF NOT EXISTS "
+                            "ix_concepts_last_seen ON concepts (last_seen)"))
+
+
+def _concept_last_used(connection):
+    # memory policy recency used to share last_seen with the crawlers,
+    # which skipped every concept the reactor touched
+    columns = [c["name"] for c in inspect(connection).get_columns(
+        Concept.__tablename__)]
+    if "last_used" not in columns:
+        connection.execute(text(
+            "ALTER TABLE concepts ADD COLUMN last_used INTEGER DEFAULT 0"))
+    connection.execute(text("UPDATE concepts SET last_used = last_seen"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS "
+                            "ix_concepts_last_used ON concepts (last_used)"))
+
+
+# bumped by every change a GraphSnapshot depends on, crawl timestamps and
+# hits are left out so they do not invalidate snapshots
+GRAPH_VERSION = [
+    "CREATE TABLE IF NOT EXISTS graph_version (id INTEGER PRIMARY KEY "
+    "CHECK (id = 0), version INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO graph_version VALUES (0, 0)"
+] + [
+    "CREATE TRIGGER IF NOT EXISTS %s_version_%s AFTER %s ON %s BEGIN "
+    "UPDATE graph_version SET version = version + 1; END" %
+    (table, name, change, table)
+    for table, columns in (("concepts", "name, type"),
+                           ("connections",
+                            "source_id, target_id, type, strength"))
+    for name, change in (("insert", "INSERT"), ("delete", "DELETE"),
+                         ("update", "UPDATE OF " + columns))
+]
+
+
+def create_graph_version(connection):
+    for statement in GRAPH_VERSION:
+        connection.execute(text(statement))
+
+
+# one entry per schema version, never edit or reorder released entries
+MIGRATIONS = [
+    _autoincrement_ids,
+    _indexes_and_unique_connections,
+    _concept_hits,
+    _aliases,
+    create_search_index,
+    _last_seen_index,
+    create_graph_version,
+    _concept_last_used
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def upgrade(engine):
+    """
+    bring a concepts database up to SCHEMA_VERSION, fresh databases are
+    created directly with the current schema
+
+    :param engine: sqlalchemy engine for a sqlite database
+    :return: schema version the database was found at
+    """
+    with engine.begin() as connection:
+        tables = inspect(connection).get_table_names()
+        if Concept.__tablename__ not in tables:
+            Base.metadata.create_all(connection)
+            create_search_index(connection)
+            create_graph_version(connection)
+            set_schema_version(connection, SCHEMA_VERSION)
+            return SCHEMA_VERSION
+        version = get_schema_version(connection)
+    for idx in range(version, SCHEMA_VERSION):
+        with engine.begin() as connection:
+            MIGRATIONS[idx](connection)
+            set_schema_version(connection, idx + 1)
+    # tables added since the database was created
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        # databases created or migrated without FTS5 get the search index
+        # once sqlite has it
+        if not has_search_index(connection):
+            create_search_index(connection)
+    return version
@@ -0,0 +1,21 @@
+import re
+import sys
+import unicodedata
+from functools import lru_cache
+
+_SEPARATORS = re.compile(r"[\s_]+")
+
+
+@lru_cache(maxsize=65536)
+def normalize_name(name):
+    """
+    canonical key of a concept name, "Elon_Musk", "elon musk" and
+    " Elon  Musk" all map to "elon musk"
+
+    keys are interned, equal keys are the same string object so comparing
+    them is an identity check in the common case
+    """
+    if name is None:
+        return None
+    key = unicodedata.normalize("NFKC", name).casefold()
+    return sys.intern(_SEPARATORS.sub(" ", key).strip())
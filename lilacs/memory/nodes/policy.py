@@ -0,0 +1,253 @@
+import math
+import time
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import selectinload
+
+from lilacs.memory.nodes import Concept, Connection, ArchivedConcept, \
+    ArchivedConnection
+from lilacs.settings import SHORT_TERM_WINDOW, SHORT_TERM_MAX_CONCEPTS, \
+    SHORT_TERM_HALF_LIFE, SHORT_TERM_MIN_STRENGTH, SHORT_TERM_POLICY_INTERVAL
+
+
+def decayed_strength(strength, last_seen, now, half_life=SHORT_TERM_HALF_LIFE):
+    """
+    connection strength after exponential decay since it was last seen,
+    connections that were never seen keep their strength
+
+    :param strength: stored strength
+    :param last_seen: unix time the connection was last seen, 0 if never
+    :param now: unix time to decay to
+    :param half_life: seconds for the strength to halve
+    """
+    if not last_seen or not half_life:
+        return strength
+    age = max(now - last_seen, 0)
+    return (strength or 0) * 0.5 ** (float(age) / half_life)
+
+
+class MemoryPolicy(object):
+    """
+    keeps a short term ConceptDatabase from growing without bound
+
+    connections whose decayed strength drops below min_strength, concepts
+    not seen within window and, above max_concepts, the least recently
+    ("lru") or least frequently ("lfu") used concepts are moved to the
+    archived_concepts and archived_connections tables of the same database,
+    from where recall brings them back
+
+    recency is kept in Concept.last_used, last_seen belongs to the
+    crawlers and says when a concept was last crawled. Concepts with
+    last_used 0 were never touched, the window does not apply to them but
+    they are the first to go under the size cap
+    """
+
+    def __init__(self, db, window=SHORT_TERM_WINDOW,
+                 max_concepts=SHORT_TERM_MAX_CONCEPTS,
+                 half_life=SHORT_TERM_HALF_LIFE,
+                 min_strength=SHORT_TERM_MIN_STRENGTH, eviction="lru",
+                 interval=SHORT_TERM_POLICY_INTERVAL):
+        if eviction not in ("lru", "lfu"):
+            raise ValueError("eviction must be 'lru' or 'lfu'")
+        self.db = db
+        self.window = window
+        self.max_concepts = max_concepts
+        self.half_life = half_life
+        self.min_strength = min_strength
+        self.eviction = eviction
+        # seconds between runs triggered by maintain
+        self.interval = interval
+        self.last_run = 0
+
+    def touch(self, concept_ids, now=None):
+        """
+        mark concepts as used, updates last_used and hits in one statement
+        per 400 ids
+        """
+        now = int(now or time.time())
+        concept_ids = list(concept_ids)
+        with self.db.transaction():
+            for i in range(0, len(concept_ids), 400):
+                self.db.session.query(Concept).filter(
+                    Concept.id.in_(concept_ids[i:i + 400])).update(
+                    {Concept.last_used: now, Concept.hits: Concept.hits + 1},
+                    synchronize_session="fetch")
+
+    def strength(self, connection, now=None):
+        return decayed_strength(connection.strength, connection.last_seen,
+                                now or time.time(), self.half_life)
+
+    def maintain(self, now=None):
+        """
+        run the policy if the last run is more than interval ago, for
+        callers that touch concepts as they go like the reactor and the
+        crawlers
+
+        :return: result of run, None if it was not due
+        """
+        now = int(now or time.time())
+        if now - self.last_run < self.interval:
+            return None
+        return self.run(now)
+
+    def run(self, now=None):
+        """
+        apply decay, the window and the size cap
+
+        :return: dict with the number of archived connections and concepts
+        """
+        now = int(now or time.time())
+        self.last_run = now
+        return {"decayed": self.archive_decayed(now),
+                "expired": self.expire(now),
+                "evicted": self.enforce_cap(now)}
+
+    def archive_decayed(self, now=None):
+        """
+        archive connections decayed below min_strength. Stored strengths
+        are never lowered, decay only decides what is archived, see
+        decayed_strength
+
+        :return: number of archived connections
+        """
+        now = int(now or time.time())
+        weak = []
+        for condition in self._decayed_filters(now):
+            weak += [c for c, in self.db.session.query(Connection.id).filter(
+                condition)]
+        return self.archive_connections(weak, now)
+
+    def _decayed_filters(self, now, bands=100):
+        # strength * 0.5 ** (age / half_life) < min_strength holds once
+        # age > half_life * log2(strength / min_strength), one last_seen
+        # cutoff per stored strength lets sqlite do the filtering
+        conditions = []
+        for strength, in self.db.session.query(Connection.strength).distinct():
+            if strength is None or strength < self.min_strength:
+                conditions.append(Connection.strength.is_(None)
+                                  if strength is None else
+                                  Connection.strength == strength)
+            elif self.half_life and self.min_strength > 0:
+                cutoff = now - self.half_life * math.log(
+                    strength / float(self.min_strength), 2)
+                conditions.append(and_(Connection.strength == strength,
+                                       Connection.last_seen > 0,
+                                       Connection.last_seen < cutoff))
+        for i in range(0, len(conditions), bands):
+            yield or_(*conditions[i:i + bands])
+
+    def expire(self, now=None):
+        """
+        archive concepts not seen within the window
+
+        :return: number of archived concepts
+        """
+        now = int(now or time.time())
+        stale = [c for c, in self.db.session.query(Concept.id).filter(
+            Concept.last_used > 0, Concept.last_used < now - self.window)]
+        return self.archive_concepts(stale, now)
+
+    def enforce_cap(self, now=None):
+        """
+        archive the least recently or frequently used concepts above
+        max_concepts
+
+        :return: number of archived concepts
+        """
+        excess = self.db.total_concepts() - self.max_concepts
+        if excess <= 0:
+            return 0
+        if self.eviction == "lfu":
+            order = (Concept.hits, Concept.last_used, Concept.id)
+        else:
+            order = (Concept.last_used, Concept.id)
+        victims = [c for c, in self.db.session.query(Concept.id).order_by(
+            *order).limit(excess)]
+        return self.archive_concepts(victims, now)
+
+    def archive_connections(self, connection_ids, now=None):
+        """
+        copy connections to archived_connections and delete them
+
+        :return: number of archived connections
+        """
+        now = int(now or time.time())
+        rows = self.db.get_connection_rows(connection_ids)
+        if not rows:
+            return 0
+        with self.db.transaction():
+            self._archive_rows(rows, now)
+            self.db.delete_connections([r.id for r in rows])
+        return len(rows)
+
+    def archive_concepts(self, concept_ids, now=None):
+        """
+        copy concepts and all their connections to the archive tables and
+        delete them
+
+        :return: number of archived concepts
+        """
+        now = int(now or time.time())
+        concept_ids = list(concept_ids)
+        archived = 0
+        with self.db.transaction():
+            for i in range(0, len(concept_ids), 400):
+                # connections come with the concepts, the delete cascade
+                # does not lazy load them one concept at a time
+                concepts = self.db.session.query(Concept).options(
+                    selectinload(Concept.out_connections),
+                    selectinload(Concept.in_connections),
+                    selectinload(Concept.aliases)).filter(
+                    Concept.id.in_(concept_ids[i:i + 400])).all()
+                con_ids = set()
+                for concept in concepts:
+                    con_ids.update(c.id for c in concept.out_connections)
+                    con_ids.update(c.id for c in concept.in_connections)
+                self._archive_rows(self.db.get_connection_rows(con_ids), now)
+                if concepts:
+                    self.db.session.execute(
+                        ArchivedConcept.__table__.insert(),
+                        [{"name": c.name, "description": c.description,
+                          "type": c.type, "last_seen": c.last_seen,
+                          "hits": c.hits, "archived_at": now}
+                         for c in concepts])
+                for concept in concepts:
+                    self.db.session.delete(concept)
+                archived += len(concepts)
+                self.db.commit()
+        return archived
+
+    def _archive_rows(self, rows, now):
+        if not rows:
+            return
+        self.db.session.execute(
+            ArchivedConnection.__table__.insert(),
+            [{"source_name": r.source_name, "type": r.type,
+              "target_name": r.target_name, "strength": r.strength,
+              "archived_at": now} for r in rows])
+
+    def recall(self, name):
+        """
+        bring an archived concept and its archived connections back
+
+        :param name: concept name
+        :return: list of restored connections
+        """
+        session = self.db.session
+        concepts = session.query(ArchivedConcept).filter(
+            ArchivedConcept.name == name).all()
+        cons = session.query(ArchivedConnection).filter(
+            (ArchivedConnection.source_name == name) |
+            (ArchivedConnection.target_name == name)).all()
+        if not concepts and not cons:
+            return []
+        with self.db.transaction():
+            if concepts and self.db.concept_id_by_name(name) is None:
+                self.db.add_concept(name, concepts[-1].description or "",
+                                    concepts[-1].type)
+            restored = self.db.add_connections_bulk(
+                [(c.source_name, c.type, c.target_name, c.strength)
+                 for c in cons if c.source_name and c.target_name])
+            for row in concepts + cons:
+                session.delete(row)
+        return restored
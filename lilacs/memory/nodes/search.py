@@ -0,0 +1,135 @@
+import re
+
+from sqlalchemy import text, or_
+
+from lilacs.memory.nodes import Alias, Concept
+from lilacs.memory.nodes.names import normalize_name
+
+_WORDS = re.compile(r"\w+", re.UNICODE)
+
+
+def trigrams(key):
+    return set(key[i:i + 3] for i in range(len(key) - 2))
+
+
+def similarity(first, second):
+    """
+    jaccard similarity of the trigram sets of two keys, 0..1
+    """
+    first, second = trigrams(first), trigrams(second)
+    if not first or not second:
+        return 0.0
+    return float(len(first & second)) / len(first | second)
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def has_search_index(session):
+    return session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE name = 'concept_fts'")).scalar() \
+        is not None
+
+
+class ConceptSearch(object):
+    """
+    ranked search over concept names, aliases and descriptions
+
+    words are matched through the concept_fts FTS5 table, the last word
+    as a prefix, and ranked with bm25 weighting names over descriptions.
+    When that finds too little, alias keys sharing trigrams with the query
+    are ranked by trigram similarity, which survives typos and partial
+    names. Without FTS5 the same is approximated with LIKE
+    """
+
+    def __init__(self, db, name_weight=10.0, min_similarity=0.3,
+                 candidates=200):
+        self.db = db
+        self.name_weight = name_weight
+        self.min_similarity = min_similarity
+        self.candidates = candidates
+        self.fts = has_search_index(db.session)
+
+    def search(self, query, limit=10, fuzzy=True):
+        """
+        :param query: free text, e.g. a parsed question subject
+        :param limit: most concept ids returned
+        :param fuzzy: fall back to trigram similarity
+        :return: list of (concept id, score), best first, word matches
+                 before fuzzy ones
+        """
+        results = []
+        seen = set()
+        for concept_id, score in self.words(query, limit):
+            seen.add(concept_id)
+            results.append((concept_id, score))
+        if fuzzy and len(results) < limit:
+            for concept_id, score in self.fuzzy(query, limit):
+                if concept_id not in seen and len(results) < limit:
+                    seen.add(concept_id)
+                    results.append((concept_id, score))
+        return results
+
+    def words(self, query, limit=10):
+        words = _WORDS.findall(query.lower())
+        if not words:
+            return []
+        if not self.fts:
+            q = self.db.session.query(Concept.id)
+            for word in words:
+                pattern = "%" + word + "%"
+                q = q.filter(or_(Concept.name.like(pattern),
+                                 Concept.description.like(pattern)))
+            return [(c, 1.0) for c, in q.order_by(Concept.id).limit(limit)]
+        match = " ".join(_quote(w) for w in words) + "*"
+        # bm25 is lower for better matches
+        rows = self.db.session.execute(text(
+            "SELECT rowid, bm25(concept_fts, :weight, 1.0) AS rank "
+            "FROM concept_fts WHERE concept_fts MATCH :match "
+            "ORDER BY rank LIMIT :limit"),
+            {"weight": self.name_weight, "match": match, "limit": limit})
+        return [(concept_id, -rank) for concept_id, rank in rows]
+
+    def fuzzy(self, query, limit=10):
+        key = normalize_name(query)
+        grams = trigrams(key)
+        if not grams:
+            return []
+        if self.fts:
+            rows = self.db.session.execute(text(
+                "SELECT aliases.concept_id, aliases.key FROM alias_trigrams "
+                "JOIN aliases ON aliases.id = alias_trigrams.rowid "
+                "WHERE alias_trigrams MATCH :match "
+                "ORDER BY bm25(alias_trigrams) LIMIT :limit"),
+                {"match": " OR ".join(_quote(g) for g in sorted(grams)),
+                 "limit": self.candidates})
+        else:
+            rows = self.db.session.query(Alias.concept_id, Alias.key).filter(
+                or_(*[Alias.key.like("%" + g + "%") for g in grams])).limit(
+                self.candidates)
+        best = {}
+        for concept_id, alias in rows:
+            score = similarity(key, alias)
+            if score >= self.min_similarity and \
+                    score > best.get(concept_id, 0):
+                best[concept_id] = score
+        return sorted(best.items(), key=lambda c: (-c[1], c[0]))[:limit]
+
+    def complete(self, prefix, limit=10):
+        """
+        concept ids whose name or alias starts with prefix, a range scan
+        over the unique alias key index
+
+        :return: list of concept ids in key order
+        """
+        key = normalize_name(prefix)
+        if not key:
+            return []
+        ids = []
+        for concept_id, in self.db.session.query(Alias.concept_id).filter(
+                Alias.key >= key, Alias.key < key + u"\U0010ffff").order_by(
+                Alias.key).limit(limit * 2):
+            if concept_id not in ids:
+                ids.append(concept_id)
+        return ids[:limit]
@@ -0,0 +1,262 @@
+import zlib
+from contextlib import ExitStack, contextmanager
+from os.path import join
+
+from lilacs.memory.nodes import Concept
+from lilacs.memory.nodes.names import normalize_name
+from lilacs.memory.nodes.short_term import ConceptDatabase
+from lilacs.settings import DATABASE_DIR
+
+# type of the local copy a shard keeps of a concept homed elsewhere, so
+# connections can point at it
+REFERENCE_TYPE = "shard reference"
+
+
+def shard_of(name, shards):
+    # stable across processes, unlike hash(), spellings of one name share
+    # a shard
+    return zlib.crc32((normalize_name(name) or "").encode("utf-8")) % shards
+
+
+class ShardedConceptDatabase(object):
+    """
+    concept graph partitioned across several sqlite files
+
+    a concept lives in the shard picked by a stable hash of its name,
+    together with all of its outgoing connections. When the target of a
+    connection is homed in another shard the source shard keeps a
+    REFERENCE_TYPE copy of it. Outgoing lookups hit one shard, incoming
+    ones are asked to every shard and merged
+
+    every shard is its own ConceptDatabase with its own write lock, so
+    crawlers working on subjects in different shards write in parallel.
+    Writes spanning shards commit shard by shard, they are not atomic.
+    Concept ids are local to a shard, crawlers work by name or through
+    the home shard of a concept and accept a sharded store. An alias
+    hashed to another shard than its concept is kept there on a
+    REFERENCE_TYPE copy, name lookups follow it to the home shard
+    """
+
+    def __init__(self, name="concepts", shards=4, directory=DATABASE_DIR,
+                 debug=False, indexed=False, pragmas=None):
+        """
+        :param name: shard files are named <name>_<n>.db
+        :param shards: number of shards, fixed for the life of the store
+        :param directory: where the shard files live
+        :param debug: echo SQL
+        :param indexed: keep an in memory GraphIndex per shard
+        :param pragmas: sqlite pragmas, defaults to settings.SQLITE_PRAGMAS
+        """
+        self.name = name
+        self.shards = [ConceptDatabase(debug=debug, indexed=indexed,
+                                       pragmas=pragmas,
+                                       path=join(directory, "%s_%d.db" %
+                                                 (name, n)))
+                       for n in range(shards)]
+        # mutation log of a LoggedWriter in front of the store
+        self.log_path = join(directory, "%s.log" % name)
+
+    def shard_for(self, name):
+        """
+        :return: ConceptDatabase holding the concept name
+        """
+        return self.shards[shard_of(name, len(self.shards))]
+
+    def _resolve(self, name):
+        # the shard of a name and the name of its concept, an alias
+        # stored away from its concept resolves to a reference copy
+        shard = self.shard_for(name)
+        concept = shard.first_concept_by_name(name)
+        if concept is not None and concept.type == REFERENCE_TYPE:
+            return self.shard_for(concept.name), concept.name
+        return shard, name
+
+    def _group(self, names):
+        # shard -> names homed there
+        groups = {}
+        for name in names:
+            groups.setdefault(shard_of(name, len(self.shards)), []).append(
+                name)
+        return [(self.shards[n], group) for n, group in
+                sorted(groups.items())]
+
+    # writes
+    @contextmanager
+    def transaction(self):
+        """
+        unit of work on every shard, see ConceptDatabase.transaction. The
+        shards commit one after the other at the end, if one of them fails
+        the shards committed before it keep their writes
+        """
+        with ExitStack() as stack:
+            for shard in self.shards:
+                stack.enter_context(shard.transaction())
+            yield self
+
+    def add_concept(self, name=None, description="", type="idea"):
+        return self.shard_for(name).add_concept(name, description, type)
+
+    def add_connection(self, source_name, target_name, type="related",
+                       strength=50):
+        cons = self.add_connections_bulk(
+            [(source_name, type, target_name, strength)])
+        return cons[0] if cons else None
+
+    def add_connections_bulk(self, connections, chunk_size=400):
+        """
+        route connections to the shard of their source, missing concepts
+        are created in their home shard
+
+        every shard commits on its own, not atomic: if a shard fails the
+        earlier ones keep their connections. Existing connections are
+        skipped, so the same batch can simply be added again
+
+        :param connections: iterable of (source_name, type, target_name, strength)
+        :return: list of newly created connections
+        """
+        by_shard = {}
+        for con in connections:
+            if not con[0] or not con[2]:
+                continue
+            by_shard.setdefault(shard_of(con[0], len(self.shards)),
+                                []).append(con)
+        new_cons = []
+        for n, cons in sorted(by_shard.items()):
+            shard = self.shards[n]
+            names = set(con[0] for con in cons)
+            names.update(con[2] for con in cons)
+            for home, homed in self._group(names):
+                home.add_concepts_bulk(homed)
+            # references first, else the bulk insert would create the
+            # foreign targets as plain concepts
+            shard.add_concepts_bulk(
+                [n for n in names if self.shard_for(n) is not shard],
+                type=REFERENCE_TYPE)
+            new_cons += shard.add_connections_bulk(cons, chunk_size)
+        return new_cons
+
+    def add_alias(self, alias, name):
+        """
+        make alias resolve to the concept name, see
+        ConceptDatabase.add_alias. The alias is stored in the home shard of
+        name and, when alias hashes to another shard, also there on a
+        reference copy of name. Concepts merged by the alias are merged
+        within the shard holding them
+
+        :return: the concept, None if name is unknown
+        """
+        shard, name = self._resolve(name)
+        concept = shard.add_alias(alias, name)
+        if concept is None:
+            return None
+        other = self.shard_for(alias)
+        if other is not shard:
+            other.add_concepts_bulk([name], type=REFERENCE_TYPE)
+            other.add_alias(alias, name)
+        return concept
+
+    def mark_seen(self, name, timestamp):
+        return self.shard_for(name).mark_seen(name, timestamp)
+
+    # reads
+    def first_concept_by_name(self, name):
+        concept = self.shard_for(name).first_concept_by_name(name)
+        if concept is not None and concept.type == REFERENCE_TYPE:
+            # an alias kept away from its concept
+            return self.shard_for(concept.name).first_concept_by_name(
+                concept.name)
+        return concept
+
+    def search_concept_by_name(self, name):
+        shard, name = self._resolve(name)
+        return shard.search_concept_by_name(name)
+
+    def concept_id_by_name(self, name):
+        # ids are only unique within the home shard of the concept
+        shard, name = self._resolve(name)
+        return shard.concept_id_by_name(name)
+
+    def connection_exists(self, type, source_name, target_name):
+        shard, source_name = self._resolve(source_name)
+        return shard.connection_exists(type, source_name,
+                                       self._resolve(target_name)[1])
+
+    def search_connection_by_concept(self, name, direction="both", types=None,
+                                     min_strength=None, limit=None):
+        """
+        connections of a concept from every shard holding them, strongest
+        first, see ConceptDatabase.search_connection_by_concept
+        """
+        home, name = self._resolve(name)
+        cons = []
+        if direction in ("out", "both"):
+            cons += home.search_connection_by_concept(
+                name, "out", types, min_strength, limit)
+        # self loops come back from both directions of the home shard
+        seen = set(c.id for c in cons)
+        if direction in ("in", "both"):
+            for shard in self.shards:
+                cons += [c for c in shard.search_connection_by_concept(
+                    name, "in", types, min_strength, limit)
+                    if shard is not home or c.id not in seen]
+        cons.sort(key=lambda c: -(c.strength or 0))
+        if limit is not None:
+            cons = cons[:limit]
+        return cons
+
+    def search_connection_rows_by_names(self, names, direction="both",
+                                        types=None):
+        """
+        ConnectionRow tuples of the named concepts, one query per shard
+        involved, ids are only unique within a shard
+        """
+        rows = []
+        if direction in ("out", "both"):
+            for shard, homed in self._group(names):
+                rows += shard.search_connection_rows_by_names(homed, "out",
+                                                              types)
+        if direction in ("in", "both"):
+            for shard in self.shards:
+                rows += shard.search_connection_rows_by_names(names, "in",
+                                                              types)
+        return rows
+
+    def search_neighbourhood(self, name, hops=1, direction="out", types=None,
+                             min_strength=None):
+        """
+        concepts reachable from name in up to hops connections, across
+        shards. Concept ids are local to a shard, so unlike
+        ConceptDatabase.search_neighbourhood names are returned
+
+        :return: dict of concept name -> distance in hops
+        """
+        if self.first_concept_by_name(name) is None:
+            return {}
+        distances = {name: 0}
+        frontier = [name]
+        for hop in range(1, hops + 1):
+            found = []
+            for row in self.search_connection_rows_by_names(
+                    frontier, direction, types):
+                if min_strength is not None and row.strength < min_strength:
+                    continue
+                for neighbour in (row.source_name, row.target_name):
+                    if neighbour is not None and neighbour not in distances:
+                        distances[neighbour] = hop
+                        found.append(neighbour)
+            if not found:
+                break
+            frontier = found
+        return distances
+
+    def total_concepts(self):
+        # references are copies, only count concepts in their home shard
+        return sum(shard.session.query(Concept).filter(
+            Concept.type != REFERENCE_TYPE).count() for shard in self.shards)
+
+    def total_connections(self):
+        return sum(shard.total_connections() for shard in self.shards)
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
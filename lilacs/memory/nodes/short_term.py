@@ -1,33 +1,125 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker, scoped_session, aliased, \
+    joinedload
+from sqlalchemy import and_, func, or_, tuple_
 from sqlalchemy.exc import IntegrityError
 
-from lilacs.memory.nodes import Base, Concept, Connection
-from lilacs.settings import DATABASE_DIR
+from lilacs.memory.nodes import Alias, Concept, Connection
+from lilacs.memory.nodes.index import GraphIndex
+from lilacs.memory.nodes.names import normalize_name
+from lilacs.memory.nodes.migrations import upgrade
+from lilacs.memory.nodes.search import ConceptSearch
+from lilacs.memory.nodes.snapshot import GraphSnapshot, replace_file
+from lilacs.memory.nodes.vectors import VectorIndex
+from lilacs.settings import DATABASE_DIR, SQLITE_PRAGMAS
 import time
-from os.path import join
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import wraps
+from os import makedirs
+from os.path import join, dirname, exists
+
+
+# a connection with the names of both ends, no ORM object behind it
+ConnectionRow = namedtuple("ConnectionRow", ["id", "type", "strength",
+                                             "source_id", "source_name",
+                                             "target_id", "target_name"])
+
+# the two ends of a connection in joined queries
+SourceConcept = aliased(Concept, name="source_concept")
+TargetConcept = aliased(Concept, name="target_concept")
+
+
+def serialized(method):
+    # get or create is check then insert, run it for one thread at a time
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.write_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def set_sqlite_pragmas(engine, pragmas=None):
+    """
+    apply pragmas to every connection the engine opens
+
+    :param engine: sqlalchemy engine for a sqlite database
+    :param pragmas: dict of pragma name -> value, defaults to settings.SQLITE_PRAGMAS
+    """
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute("PRAGMA %s = %s" % (name, value))
+        cursor.close()
+
+    event.listen(engine, "connect", on_connect)
+    return engine
 
 
 class ConceptDatabase(object):
-    def __init__(self, debug=False):
-        path = str(time.time()) + '_concepts.db'
-        self.path = "sqlite:///" + join(DATABASE_DIR, path)
-        self.db = create_engine(self.path)
-        Base.metadata.create_all(self.db)
+    def __init__(self, debug=False, indexed=False, path=None, pragmas=None):
+        # without a path every instance gets a fresh scratch database
+        path = path or join(DATABASE_DIR, str(time.time()) + '_concepts.db')
+        if not exists(dirname(path)):
+            makedirs(dirname(path))
+        self.snapshot_path = path + ".snapshot"
+        self.log_path = path + ".log"
+        self.vectors_path = path + ".vectors"
+        self.vectors = None
+        # embedding of build_vectors or load_vectors, keeps vectors current
+        self._embed = None
+        self._vectors_version = None
+        # vectors were added in memory only
+        self._vectors_unsaved = False
+        self.path = "sqlite:///" + path
+        self.db = set_sqlite_pragmas(create_engine(self.path), pragmas)
+        upgrade(self.db)
         self.db.echo = debug
-        Session = sessionmaker(bind=self.db)
-        self.session = Session()
+        # with the in memory index objects are not expired on commit, the
+        # index is the source of truth for lookups and rows only change
+        # through sessions of this database
+        Session = sessionmaker(bind=self.db, expire_on_commit=not indexed)
+        # one session per thread, crawler threads can share this database
+        self.session = scoped_session(Session)
+        self._local = threading.local()
+        self.write_lock = threading.RLock()
+        self._search = None
+        self.index = None
+        if indexed:
+            self.index = GraphIndex()
+            self.index.load(self.session)
+            self.index.attach(self.session)
+
+    def _use_index(self):
+        # rows flushed but not committed yet are only visible to SQL
+        return self.index is not None and \
+            not self.index.staged(self.session)
 
     def update_timestamp(self, concept_id, timestamp):
         concept = self.get_concept_by_id(concept_id)
-        if concept:
-            concept = concept[0]
-        else:
+        if not concept:
             return False
         concept.last_seen = timestamp
         self.commit()
         return True
 
+    def mark_seen(self, name, timestamp):
+        """
+        set last_seen of the concept name, created if it does not exist so
+        names crawled without results are not crawled again right away
+
+        :return: the concept, None for an empty name
+        """
+        if not name:
+            return None
+        concept = self.first_concept_by_name(name) or self.add_concept(name)
+        if concept is not None:
+            self.update_timestamp(concept.id, timestamp)
+        return concept
+
     def get_concepts(self):
         return self.session.query(Concept).all()
 
@@ -38,15 +130,312 @@ class ConceptDatabase(object):
         return self.session.query(Connection).get(connection_id)
 
     def get_concept_by_id(self, concept_id):
+        if self._use_index() and concept_id not in self.index.concepts:
+            return None
         return self.session.query(Concept).get(concept_id)
 
     def search_connection_by_type(self, type="related"):
-        return self.session.query(Connection).filter_by(type=type).all()
+        return self._eager(self.session.query(Connection)).filter_by(
+            type=type).all()
+
+    def search_connection_rows(self, concept_id, direction="both",
+                               types=None):
+        """
+        connections of a concept as ConnectionRow tuples, the names of
+        source and target are joined in by the same statement so reading
+        them never triggers a lazy load
+
+        rows whose source or target concept is missing have None names
+
+        :param concept_id: concept id
+        :param direction: "out", "in" or "both"
+        :param types: optional list of connection types to keep
+        :return: list of ConnectionRow
+        """
+        if self._use_index():
+            con_ids = set()
+            rows = []
+            with self.index.lock:
+                if direction in ("out", "both"):
+                    con_ids.update(self.index.out_edges.get(concept_id, []))
+                if direction in ("in", "both"):
+                    con_ids.update(self.index.in_edges.get(concept_id, []))
+                for con_id in sorted(con_ids):
+                    source_id, con_type, target_id, strength = \
+                        self.index.connections[con_id]
+                    if types is None or con_type in types:
+                        rows.append(ConnectionRow(
+                            con_id, con_type, strength,
+                            source_id, self.index.concept_name(source_id),
+                            target_id, self.index.concept_name(target_id)))
+            return rows
+        query = self._connection_rows_query()
+        if direction == "out":
+            query = query.filter(Connection.source_id == concept_id)
+        elif direction == "in":
+            query = query.filter(Connection.target_id == concept_id)
+        else:
+            query = query.filter(or_(Connection.source_id == concept_id,
+                                     Connection.target_id == concept_id))
+        query = self._filter_connections(query, types, None)
+        return [ConnectionRow(*row) for row in query.order_by(Connection.id)]
+
+    def search_connection_rows_by_type(self, type="related"):
+        """
+        every connection of one type as ConnectionRow tuples, one statement
+        """
+        query = self._connection_rows_query().filter(Connection.type == type)
+        return [ConnectionRow(*row) for row in query.order_by(Connection.id)]
+
+    def get_connection_rows(self, connection_ids):
+        """
+        ConnectionRow tuples for the given connection ids, in id order
+        """
+        connection_ids = sorted(set(connection_ids))
+        rows = []
+        # stay below the sqlite bound parameter limit
+        for i in range(0, len(connection_ids), 400):
+            query = self._connection_rows_query().filter(
+                Connection.id.in_(connection_ids[i:i + 400]))
+            rows += [ConnectionRow(*row) for row in
+                     query.order_by(Connection.id)]
+        return rows
+
+    def search_connection_rows_by_names(self, names, direction="both",
+                                        types=None):
+        """
+        ConnectionRow tuples of every concept named in names, one
+        statement per 400 names
+
+        :param names: iterable of concept names
+        :param direction: "out", "in" or "both"
+        :param types: optional list of connection types to keep
+        :return: list of ConnectionRow
+        """
+        names = sorted(set(names))
+        if self._use_index():
+            rows = {}
+            for name in names:
+                for concept_id in self.index.concept_ids(name):
+                    for row in self.search_connection_rows(
+                            concept_id, direction, types):
+                        rows[row.id] = row
+            return [rows[con_id] for con_id in sorted(rows)]
+        rows = []
+        concept_ids = sorted(set(self._concept_ids_by_names(names).values()))
+        for i in range(0, len(concept_ids), 400):
+            chunk = concept_ids[i:i + 400]
+            query = self._connection_rows_query()
+            if direction == "out":
+                query = query.filter(Connection.source_id.in_(chunk))
+            elif direction == "in":
+                query = query.filter(Connection.target_id.in_(chunk))
+            else:
+                query = query.filter(or_(Connection.source_id.in_(chunk),
+                                         Connection.target_id.in_(chunk)))
+            query = self._filter_connections(query, types, None)
+            rows += [ConnectionRow(*row) for row in
+                     query.order_by(Connection.id)]
+        return rows
 
-    def search_connection_by_concept(self, name):
-        return self.session.query(Connection).filter(Concept.name==name).all()
+    def _connection_rows_query(self):
+        # outer joins keep connections pointing at deleted concepts
+        return self.session.query(
+            Connection.id, Connection.type, Connection.strength,
+            Connection.source_id, SourceConcept.name, Connection.target_id,
+            TargetConcept.name).outerjoin(
+            SourceConcept, Connection.source_id == SourceConcept.id).outerjoin(
+            TargetConcept, Connection.target_id == TargetConcept.id)
+
+    @staticmethod
+    def _eager(query):
+        # source and target come with the connections in the same statement
+        return query.options(joinedload(Connection.source),
+                             joinedload(Connection.target))
+
+    def search_connection_by_concept(self, name, direction="both", types=None,
+                                     min_strength=None, limit=None):
+        """
+        connections of a concept, strongest first
+
+        :param name: concept name
+        :param direction: "out", "in" or "both"
+        :param types: optional list of connection types to keep
+        :param min_strength: optional minimum connection strength
+        :param limit: optional maximum number of connections
+        :return: list of connections
+        """
+        if self._use_index():
+            return self._connections_by_ids(self._indexed_connection_ids(
+                name, direction, types, min_strength, limit))
+        return self._connection_by_concept_query(name, direction, types,
+                                                 min_strength, limit).all()
+
+    def iter_connection_by_concept(self, name, direction="both", types=None,
+                                   min_strength=None, limit=None,
+                                   batch_size=500):
+        """
+        same as search_connection_by_concept but streams rows in batches
+        instead of loading all of them at once
+        """
+        if self._use_index():
+            con_ids = self._indexed_connection_ids(name, direction, types,
+                                                   min_strength, limit)
+            for i in range(0, len(con_ids), batch_size):
+                for con in self._connections_by_ids(
+                        con_ids[i:i + batch_size]):
+                    yield con
+            return
+        query = self._connection_by_concept_query(name, direction, types,
+                                                  min_strength, limit)
+        for con in query.yield_per(batch_size):
+            yield con
+
+    def _connections_by_ids(self, connection_ids):
+        # one statement per 400 ids with both ends joined in, returned in
+        # the order of connection_ids
+        found = {}
+        for i in range(0, len(connection_ids), 400):
+            query = self._eager(self.session.query(Connection)).filter(
+                Connection.id.in_(connection_ids[i:i + 400]))
+            for con in query:
+                found[con.id] = con
+        return [found[con_id] for con_id in connection_ids
+                if con_id in found]
+
+    def search_neighbourhood(self, name, hops=1, direction="out", types=None,
+                             min_strength=None):
+        """
+        concepts reachable from name in up to hops connections, one query
+        per hop instead of one per concept
+
+        :return: dict of concept id -> distance in hops
+        """
+        if self._use_index():
+            start = self.index.concept_ids(name)
+        else:
+            start = list(self._concept_ids_by_names([name]).values())
+        distances = dict((concept_id, 0) for concept_id in start)
+        frontier = set(start)
+        for hop in range(1, hops + 1):
+            if not frontier:
+                break
+            found = set()
+            for source_id, target_id in self._edges_from(
+                    frontier, direction, types, min_strength):
+                for concept_id in (source_id, target_id):
+                    if concept_id not in distances:
+                        distances[concept_id] = hop
+                        found.add(concept_id)
+            frontier = found
+        return distances
+
+    def _edges_from(self, concept_ids, direction, types, min_strength):
+        if self._use_index():
+            edges = []
+            for concept_id in concept_ids:
+                if direction in ("out", "both"):
+                    edges += self.index.out_connections(concept_id)
+                if direction in ("in", "both"):
+                    edges += self.index.in_connections(concept_id)
+            return [(s, t) for s, con_type, t, strength in edges
+                    if (types is None or con_type in types) and
+                    (min_strength is None or strength >= min_strength)]
+        edges = []
+        concept_ids = list(concept_ids)
+        # stay below the sqlite bound parameter limit
+        for i in range(0, len(concept_ids), 400):
+            ids = concept_ids[i:i + 400]
+            query = self.session.query(Connection.source_id,
+                                       Connection.target_id)
+            if direction == "out":
+                query = query.filter(Connection.source_id.in_(ids))
+            elif direction == "in":
+                query = query.filter(Connection.target_id.in_(ids))
+            else:
+                query = query.filter(or_(Connection.source_id.in_(ids),
+                                         Connection.target_id.in_(ids)))
+            query = self._filter_connections(query, types, min_strength)
+            edges += query.all()
+        return edges
+
+    def _connection_by_concept_query(self, name, direction, types,
+                                     min_strength, limit):
+        # concept ids come from the unique alias key, connections from the
+        # source and target indexes
+        ids = self.session.query(Alias.concept_id).filter(
+            Alias.key == normalize_name(name))
+        query = self._eager(self.session.query(Connection))
+        if direction == "out":
+            query = query.filter(Connection.source_id.in_(ids))
+        elif direction == "in":
+            query = query.filter(Connection.target_id.in_(ids))
+        else:
+            query = query.filter(or_(Connection.source_id.in_(ids),
+                                     Connection.target_id.in_(ids)))
+        query = self._filter_connections(query, types, min_strength)
+        query = query.order_by(Connection.strength.desc(), Connection.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    @staticmethod
+    def _filter_connections(query, types, min_strength):
+        if types is not None:
+            query = query.filter(Connection.type.in_(list(types)))
+        if min_strength is not None:
+            query = query.filter(Connection.strength >= min_strength)
+        return query
+
+    def _indexed_connection_ids(self, name, direction, types, min_strength,
+                                limit):
+        con_ids = set()
+        cons = []
+        with self.index.lock:
+            for concept_id in self.index.concept_ids(name):
+                if direction in ("out", "both"):
+                    con_ids.update(self.index.out_edges.get(concept_id, []))
+                if direction in ("in", "both"):
+                    con_ids.update(self.index.in_edges.get(concept_id, []))
+            for con_id in con_ids:
+                _, con_type, _, strength = self.index.connections[con_id]
+                if types is not None and con_type not in types:
+                    continue
+                if min_strength is not None and strength < min_strength:
+                    continue
+                cons.append((-strength, con_id))
+        cons.sort()
+        if limit is not None:
+            cons = cons[:limit]
+        return [con_id for _, con_id in cons]
+
+    def connection_exists(self, type, source_name, target_name):
+        """
+        is there a connection of type from source_name to target_name
+
+        indexed databases answer from the (type, source_id, target_id)
+        key set of the GraphIndex, which follows every commit, otherwise
+        a single lookup over the connections unique constraint is made
+        """
+        if self._use_index():
+            targets = self.index.concept_ids(target_name)
+            return any(self.index.has_connection(type, source_id, target_id)
+                       for source_id in self.index.concept_ids(source_name)
+                       for target_id in targets)
+        ids = self._concept_ids_by_names([source_name, target_name])
+        if source_name not in ids or target_name not in ids:
+            return False
+        query = self.session.query(Connection.id).filter(
+            Connection.source_id == ids[source_name],
+            Connection.target_id == ids[target_name],
+            Connection.type == type)
+        return self.session.query(query.exists()).scalar()
 
     def search_connection_by_concept_pair(self, source, target):
+        if self._use_index():
+            source = self.index.concept_id(source)
+            target = self.index.concept_id(target)
+            return self._connections_by_pair_id(source, target)
         source = self.first_concept_by_name(source)
         target = self.first_concept_by_name(target)
         if source and target:
@@ -55,6 +444,8 @@ class ConceptDatabase(object):
         return []
 
     def search_connection_by_concept_pair_id(self, source, target):
+        if self._use_index():
+            return self._connections_by_pair_id(source, target)
         source = self.get_concept_by_id(source)
         target = self.get_concept_by_id(target)
         if source and target:
@@ -62,78 +453,578 @@ class ConceptDatabase(object):
                 Connection.target_id == target.id).all()
         return []
 
+    def _connections_by_pair_id(self, source_id, target_id):
+        # no SQL for pairs without connections
+        return self._connections_by_ids(
+            self.index.connection_ids_by_pair(source_id, target_id))
+
+    def stale_concepts(self, before, limit=100, after=None):
+        """
+        concepts last seen before a timestamp, stalest first, one page of
+        the last_seen index
+
+        :param before: timestamp
+        :param after: (last_seen, id) of the last concept of the previous
+                      page
+        :return: list of Concept
+        """
+        query = self.session.query(Concept).filter(Concept.last_seen < before)
+        if after is not None:
+            query = query.filter(or_(
+                Concept.last_seen > after[0],
+                and_(Concept.last_seen == after[0], Concept.id > after[1])))
+        return query.order_by(Concept.last_seen, Concept.id).limit(
+            limit).all()
+
     def search_concept_by_type(self, type):
         return self.session.query(Concept).filter_by(type=type).all()
 
     def first_concept_by_name(self, name):
-        return self.session.query(Concept).filter_by(name=name).first()
+        if self._use_index():
+            concept_id = self.index.concept_id(name)
+            if concept_id is None:
+                return None
+            return self.session.query(Concept).get(concept_id)
+        return self._concept_by_name_query(name).first()
 
     def search_concept_by_name(self, name):
-        return self.session.query(Concept).filter_by(name=name).all()
+        if self._use_index():
+            concept_ids = self.index.concept_ids(name)
+            if not concept_ids:
+                return []
+            return self.session.query(Concept).filter(
+                Concept.id.in_(concept_ids)).order_by(Concept.id).all()
+        return self._concept_by_name_query(name).all()
+
+    def concept_id_by_name(self, name):
+        """
+        id of the concept first_concept_by_name would return, indexed
+        databases answer without SQL
+
+        :return: concept id, None if no concept has that name
+        """
+        return self._concept_ids_by_names([name]).get(name)
 
+    def _concept_by_name_query(self, name):
+        # "Elon_Musk" finds "elon musk", names resolve through their key
+        return self.session.query(Concept).join(Concept.aliases).filter(
+            Alias.key == normalize_name(name)).order_by(Concept.id)
+
+    def search_concepts(self, query, limit=10, fuzzy=True):
+        """
+        ranked full text search over names, aliases and descriptions, for
+        strings that do not name a concept exactly
+
+        :param query: free text, the last word also matches as a prefix
+        :param limit: most concepts returned
+        :param fuzzy: also rank names sharing trigrams with the query
+        :return: list of concepts, best match first
+        """
+        if self._search is None:
+            self._search = ConceptSearch(self)
+        concepts = [self.get_concept_by_id(concept_id) for concept_id, _ in
+                    self._search.search(query, limit, fuzzy)]
+        # rows deleted since the search tables were read
+        return [c for c in concepts if c is not None]
+
+    def complete_concept_name(self, prefix, limit=10):
+        """
+        :return: concepts whose name or alias starts with prefix
+        """
+        if self._search is None:
+            self._search = ConceptSearch(self)
+        concepts = [self.get_concept_by_id(concept_id) for concept_id in
+                    self._search.complete(prefix, limit)]
+        return [c for c in concepts if c is not None]
+
+    def search_aliases(self, name):
+        """
+        :return: normalized keys that resolve to the concept name
+        """
+        concept_id = self.concept_id_by_name(name)
+        if concept_id is None:
+            return []
+        return sorted(k for k, in self.session.query(Alias.key).filter(
+            Alias.concept_id == concept_id))
+
+    @serialized
+    def add_alias(self, alias, name):
+        """
+        make alias resolve to the concept name, when alias already names
+        another concept that concept is merged into name
+
+        :param alias: other name, e.g. a "same as" proposal
+        :param name: existing concept name
+        :return: the concept, None if name is unknown
+        """
+        concept = self.first_concept_by_name(name)
+        if concept is None or not alias:
+            return None
+        key = normalize_name(alias)
+        row = self.session.query(Alias).filter(Alias.key == key).first()
+        if row is None:
+            self.session.add(Alias(key=key, concept=concept))
+        elif row.concept_id != concept.id:
+            self._merge_concept(concept, row.concept)
+        if not self.commit():
+            return None
+        return concept
+
+    def _merge_concept(self, keep, other):
+        # move every connection of other to keep, dropping the ones keep
+        # already has, then move the aliases and delete other
+        for con in list(other.out_connections):
+            if con.target is keep:
+                # would turn into a self loop, orphaned it is deleted
+                other.out_connections.remove(con)
+        for con in list(other.in_connections):
+            if con.source is keep:
+                other.in_connections.remove(con)
+        out_keys = set((c.type, c.target_id) for c in keep.out_connections)
+        in_keys = set((c.type, c.source_id) for c in keep.in_connections)
+        for con in list(other.out_connections):
+            if con.target is other:
+                con.target = keep
+            key = (con.type, con.target.id)
+            if key in out_keys:
+                # orphaned, the cascade deletes it
+                other.out_connections.remove(con)
+            else:
+                out_keys.add(key)
+                con.source = keep
+        for con in list(other.in_connections):
+            key = (con.type, con.source.id)
+            if key in in_keys:
+                other.in_connections.remove(con)
+            else:
+                in_keys.add(key)
+                con.target = keep
+        for alias in list(other.aliases):
+            alias.concept = keep
+        self.session.delete(other)
+
+    @serialized
     def add_concept(self, name=None, description="", type="idea"):
-        c = self.first_concept_by_name(name)
-        if not c:
-            concept = Concept(name=name, description=description, type=type, id=self.total_concepts() + 1)
+        if self.concept_id_by_name(name) is None:
+            concept = Concept(name=name, description=description, type=type)
+            if name:
+                concept.aliases.append(Alias(key=normalize_name(name)))
             self.session.add(concept)
             if self.commit():
                 return concept
         return None
 
+    @serialized
     def add_connection(self, source_name, target_name, type="related", strength=50):
         source = self.first_concept_by_name(source_name)
         if not source:
             source = self.add_concept(source_name)
 
-        connection = Connection(type=type, id=self.total_connections() + 1, strength=strength)
+        connection = Connection(type=type, strength=strength,
+                                last_seen=int(time.time()))
 
         target = self.first_concept_by_name(target_name)
         if not target:
             target = self.add_concept(target_name)
 
-        if not self.search_connection_by_concept_pair(source_name, target_name) and target and source:
+        if not target or not source:
+            return None
+        existing = self._connection_id(type, source.id, target.id)
+        if existing is None:
             connection.target = target
             connection.source = source
 
             self.session.add(connection)
             if self.commit():
                 return connection
+        else:
+            self._touch_connection(existing, connection.last_seen)
         return None
 
+    @serialized
     def add_connection_by_id(self, source_id, target_name, type="related", strength=50):
         source = self.get_concept_by_id(source_id)
         if not source:
             raise AssertionError("invalid concept id")
 
-        connection = Connection(type=type, id=self.total_connections() + 1, strength=strength)
+        connection = Connection(type=type, strength=strength,
+                                last_seen=int(time.time()))
 
         target = self.first_concept_by_name(target_name)
         if not target:
             target = self.add_concept(target_name)
 
-        if not self.search_connection_by_concept_pair_id(source.id, target.id):
+        existing = self._connection_id(type, source.id, target.id)
+        if existing is None:
             connection.target = target
             connection.source = source
 
             self.session.add(connection)
             if self.commit():
                 return connection
+        else:
+            self._touch_connection(existing, connection.last_seen)
         return None
 
+    def _connection_id(self, type, source_id, target_id):
+        # the (source, target, type) key of the unique constraint, other
+        # types between the same pair are separate connections
+        if self._use_index():
+            return self.index.connection_id(type, source_id, target_id)
+        return self.session.query(Connection.id).filter(
+            Connection.source_id == source_id,
+            Connection.target_id == target_id,
+            Connection.type == type).scalar()
+
+    def _touch_connection(self, connection_id, now):
+        # a connection seen again is not decayed, see nodes.policy
+        connection = self.get_connection_by_id(connection_id)
+        if connection is not None:
+            connection.last_seen = now
+            self.commit()
+
+    def _update_last_seen(self, connection_ids, now):
+        # rows the session holds keep their old last_seen until expired
+        for i in range(0, len(connection_ids), 400):
+            self.session.query(Connection).filter(
+                Connection.id.in_(connection_ids[i:i + 400])).update(
+                {Connection.last_seen: now}, synchronize_session=False)
+
+    @serialized
+    def add_connections_bulk(self, connections, chunk_size=400):
+        """
+        add many connections in a single transaction, missing concepts are
+        created and connections that already exist are skipped, only their
+        last_seen is refreshed
+
+        :param connections: iterable of (source_name, type, target_name, strength)
+        :param chunk_size: connections resolved and flushed per round trip
+        :return: list of newly created connections
+        """
+        concepts = {}  # normalized key -> id, shared across chunks
+        new_cons = []
+        chunk = []
+        for con in connections:
+            chunk.append(con)
+            if len(chunk) >= chunk_size:
+                new_cons += self._add_connections_chunk(chunk, concepts)
+                chunk = []
+        if chunk:
+            new_cons += self._add_connections_chunk(chunk, concepts)
+        # rows inserted through core are invisible to the session events
+        if self.index is not None:
+            self.index.stage(self.session,
+                             [self.index._row(c) for c in new_cons])
+        if not self.commit():
+            return []
+        return new_cons
+
+    def _add_connections_chunk(self, chunk, concepts):
+
+        # resolve concepts, one query for the whole chunk
+        names = set()
+        for source, _, target, _ in chunk:
+            names.add(source)
+            names.add(target)
+        ids = self._get_or_create_concepts(names, known=concepts)
+
+        # the first of every (source, target, type) in the chunk wins
+        rows = {}
+        now = int(time.time())
+        for source, con_type, target, strength in chunk:
+            if not source or not target:
+                continue
+            if strength is None:
+                strength = 50
+            key = (ids[source], ids[target], con_type)
+            rows.setdefault(key, {"type": con_type, "source_id": key[0],
+                                  "target_id": key[1], "strength": strength,
+                                  "last_seen": now})
+        existing = self._connection_ids_by_keys(rows)
+        if existing:
+            self._update_last_seen(list(existing.values()), now)
+        keys = [key for key in rows if key not in existing]
+        if not keys:
+            return []
+        # rows another writer added since are still skipped by the unique
+        # constraint
+        self.session.execute(
+            Connection.__table__.insert().prefix_with("OR IGNORE"),
+            [rows[key] for key in keys])
+        # only the keys of this chunk, never rows other writers committed
+        con_ids = list(self._connection_ids_by_keys(keys).values())
+        if not con_ids:
+            return []
+        return self._eager(self.session.query(Connection)).filter(
+            Connection.id.in_(con_ids)).order_by(Connection.id).all()
+
+    def _connection_ids_by_keys(self, keys):
+        """
+        :param keys: iterable of (source_id, target_id, type)
+        :return: dict of key -> id of the connections that exist
+        """
+        keys = sorted(keys)
+        found = {}
+        # three bound parameters per key
+        for i in range(0, len(keys), 300):
+            query = self.session.query(
+                Connection.source_id, Connection.target_id, Connection.type,
+                Connection.id).filter(tuple_(
+                    Connection.source_id, Connection.target_id,
+                    Connection.type).in_(keys[i:i + 300]))
+            for source_id, target_id, con_type, con_id in query:
+                found[(source_id, target_id, con_type)] = con_id
+        return found
+
+    @serialized
+    def add_concepts_bulk(self, names, type="idea"):
+        """
+        create every missing concept in names in a single transaction
+
+        :param names: iterable of concept names
+        :param type: type of the created concepts
+        :return: dict of name -> concept id, existing ones included
+        """
+        names = sorted(set(n for n in names if n))
+        concepts = {}
+        known = {}
+        for i in range(0, len(names), 400):
+            concepts.update(self._get_or_create_concepts(
+                names[i:i + 400], type, known))
+        if not self.commit():
+            return {}
+        return concepts
+
+    def _get_or_create_concepts(self, names, type="idea", known=None):
+        """
+        one query for the existing concepts, one flush for the rest, names
+        sharing a normalized key get the same concept
+
+        :param known: dict of key -> concept id resolved by earlier chunks,
+                      updated in place
+        :return: dict of name -> concept id
+        """
+        known = {} if known is None else known
+        by_key = {}
+        for name in sorted(set(n for n in names if n)):
+            by_key.setdefault(normalize_name(name), name)
+        unresolved = [k for k in by_key if k not in known]
+        known.update(self._concept_ids_by_keys(unresolved))
+        missing = sorted(k for k in unresolved if k not in known)
+        if missing:
+            new_concepts = [Concept(name=by_key[k], description="", type=type,
+                                    aliases=[Alias(key=k)]) for k in missing]
+            self.session.add_all(new_concepts)
+            self.session.flush()
+            for key, concept in zip(missing, new_concepts):
+                known[key] = concept.id
+        return dict((name, known[normalize_name(name)]) for name in names
+                    if name)
+
+    def _concept_ids_by_names(self, names):
+        keys = self._concept_ids_by_keys(
+            set(normalize_name(n) for n in names if n))
+        return dict((n, keys[normalize_name(n)]) for n in names
+                    if n and normalize_name(n) in keys)
+
+    def _concept_ids_by_keys(self, keys):
+        if self._use_index():
+            with self.index.lock:
+                return dict((k, min(self.index.names[k])) for k in keys
+                            if self.index.names.get(k))
+        keys = sorted(keys)
+        concepts = {}
+        for i in range(0, len(keys), 400):
+            concepts.update(self.session.query(Alias.key, Alias.concept_id)
+                            .filter(Alias.key.in_(keys[i:i + 400])))
+        return concepts
+
+    @serialized
+    def delete_connections(self, connection_ids):
+        """
+        delete connections by id, one query loads them all
+
+        :param connection_ids: iterable of connection ids
+        :return: number of deleted connections
+        """
+        connection_ids = list(connection_ids)
+        deleted = 0
+        for i in range(0, len(connection_ids), 400):
+            for con in self.session.query(Connection).filter(
+                    Connection.id.in_(connection_ids[i:i + 400])):
+                self.session.delete(con)
+                deleted += 1
+        if deleted and not self.commit():
+            return 0
+        return deleted
+
     def total_connections(self):
+        if self._use_index():
+            return self.index.total_connections()
         return self.session.query(Connection).count()
 
     def total_concepts(self):
+        if self._use_index():
+            return self.index.total_concepts()
         return self.session.query(Concept).count()
 
+    def graph_version(self):
+        # changes whenever concepts or connections are added, removed,
+        # renamed or retyped, kept by triggers
+        return [self.session.execute(text(
+            "SELECT version FROM graph_version")).scalar()]
+
+    def save_snapshot(self, path=None):
+        """
+        freeze the graph into a GraphSnapshot file, the file is replaced
+        atomically so processes still mapping the old one are unaffected
+        """
+        path = path or self.snapshot_path
+        return replace_file(path, GraphSnapshot.from_database(self).save)
+
+    def load_snapshot(self, path=None, rebuild=False):
+        """
+        memory map the graph snapshot, rebuilding it first if it is missing
+        or older than the database. Read only pages are shared between all
+        processes mapping the same file
+
+        :param path: snapshot file, defaults to the database path + ".snapshot"
+        :param rebuild: always rebuild the snapshot from the database
+        :return: GraphSnapshot
+        """
+        path = path or self.snapshot_path
+        if not rebuild and exists(path):
+            try:
+                snapshot = GraphSnapshot.load(path)
+            except ValueError:
+                # written by an older format
+                snapshot = None
+            if snapshot is not None and \
+                    snapshot.meta.get("version") == self.graph_version():
+                return snapshot
+        return GraphSnapshot.load(self.save_snapshot(path))
+
+    def build_vectors(self, embed, path=None, train_above=100000):
+        """
+        embed every concept and save the VectorIndex next to the database
+
+        :param embed: callable mapping a concept name to a vector or None,
+                      e.g. the vectors of a spacy vocab
+        :param train_above: also build the approximate IVF index when
+                            there are more vectors than this
+        :return: VectorIndex, None if no concept could be embedded
+        """
+        path = path or self.vectors_path
+        self._embed = embed
+        self._vectors_version = self.graph_version()
+        vectors = VectorIndex.from_database(self, embed)
+        if vectors is None:
+            return None
+        if len(vectors) > train_above:
+            vectors.train()
+        replace_file(path, vectors.save)
+        self.vectors = vectors
+        return vectors
+
+    def load_vectors(self, path=None, embed=None):
+        """
+        memory map the concept vectors saved by build_vectors
+
+        :param embed: the callable the vectors were built with, concepts
+                      added since are then embedded as they are searched
+        :return: VectorIndex, None if there is none
+        """
+        path = path or self.vectors_path
+        if embed is not None:
+            self._embed = embed
+        if exists(path):
+            self.vectors = VectorIndex.load(path)
+        return self.vectors
+
+    def update_vectors(self, embed=None, path=None, save=True):
+        """
+        embed the concepts added since the vectors were built or loaded
+
+        :param embed: defaults to the callable of build_vectors/load_vectors
+        :param save: write the vectors back to path, with the ones added
+                     by earlier unsaved updates
+        :return: number of concepts embedded
+        """
+        embed = embed or self._embed
+        if embed is None:
+            raise ValueError("no embedding to update the vectors with")
+        self._vectors_version = self.graph_version()
+        if self.vectors is None:
+            vectors = self.build_vectors(embed, path)
+            return 0 if vectors is None else len(vectors)
+        added = self.vectors.update(self, embed)
+        if not save:
+            self._vectors_unsaved = self._vectors_unsaved or bool(added)
+        elif added or self._vectors_unsaved:
+            replace_file(path or self.vectors_path, self.vectors.save)
+            self._vectors_unsaved = False
+        return added
+
+    def similar_concepts(self, name, k=10):
+        """
+        nearest concepts in embedding space, no network access. With a
+        known embedding new concepts are embedded first
+
+        :return: list of (concept name, cosine similarity), best first
+        """
+        if self._embed is not None and self.vectors is not None and \
+                self._vectors_version != self.graph_version():
+            self.update_vectors(save=False)
+        if self.vectors is None:
+            return []
+        return self.vectors.similar(name, k)
+
+    @contextmanager
+    def transaction(self):
+        """
+        unit of work for the calling thread, commits made inside the block
+        only flush and everything is committed once at the end, or rolled
+        back if the block raises. A write violating a constraint inside
+        the block raises IntegrityError and aborts the whole unit of work,
+        outside of one it is only skipped
+
+            with db.transaction():
+                db.add_connection("dog", "mammal", "instance of")
+                db.add_connection("cat", "mammal", "instance of")
+        """
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        try:
+            yield self.session
+            if depth == 0:
+                self.session.commit()
+        except Exception:
+            if depth == 0:
+                self.session.rollback()
+            raise
+        finally:
+            self._local.depth = depth
+
     def commit(self):
         try:
-            self.session.commit()
+            if getattr(self._local, "depth", 0):
+                # batched, the enclosing transaction commits
+                self.session.flush()
+            else:
+                self.session.commit()
             return True
         except IntegrityError:
+            if getattr(self._local, "depth", 0):
+                # rolling back here would silently drop the earlier writes
+                # of the unit of work, abort all of it instead
+                raise
             self.session.rollback()
             return False
 
+    def close(self):
+        # release the session of the calling thread
+        self.session.remove()
+
 
 if __name__ == "__main__":
     d = ConceptDatabase()
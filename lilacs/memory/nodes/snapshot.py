@@ -0,0 +1,345 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from lilacs.memory.nodes import Concept, Connection
+from lilacs.memory.nodes.names import normalize_name
+
+# G2 sorts names by their normalized key, G3 also stores the sorted keys
+MAGIC = b"LILACSG3"
+ALIGNMENT = 64
+
+
+def save_arrays(path, arrays, header, magic=MAGIC):
+    """
+    write named numpy arrays to one file, magic, json header and the
+    arrays each aligned so they can be memory mapped
+    """
+    header = dict(header, arrays={})
+    offset = 0
+    layout = []
+    for name in sorted(arrays):
+        array = np.ascontiguousarray(arrays[name])
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        header["arrays"][name] = {"dtype": array.dtype.str,
+                                  "shape": list(array.shape),
+                                  "offset": offset}
+        layout.append((offset, array))
+        offset += array.nbytes
+    header = json.dumps(header).encode("utf-8")
+    start = -(-(len(magic) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+    with open(path, "wb") as f:
+        f.write(magic)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for array_offset, array in layout:
+            f.seek(start + array_offset)
+            f.write(array.tobytes())
+        # empty trailing arrays still need their offsets in the file
+        f.truncate(start + offset)
+    return path
+
+
+def replace_file(path, save):
+    """
+    write a file through a temporary one next to it and move it into
+    place, readers never see a partial file and concurrent writers never
+    share a temporary name
+
+    :param save: callable writing the file at the path it is given
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                               prefix=os.path.basename(path) + ".",
+                               suffix=".tmp")
+    os.close(fd)
+    try:
+        save(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path
+
+
+def load_arrays(path, mmap_mode=True, magic=MAGIC):
+    """
+    :return: (dict of name -> array, header, buffer backing the arrays)
+    """
+    with open(path, "rb") as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError("not a %s file: %s" %
+                             (magic.decode("ascii"), path))
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size).decode("utf-8"))
+        if mmap_mode:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            f.seek(0)
+            buffer = f.read()
+    start = -(-(len(magic) + 8 + header_size) // ALIGNMENT) * ALIGNMENT
+    arrays = {}
+    for name, spec in header.pop("arrays").items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count,
+                                     offset=start + spec["offset"]
+                                     ).reshape(spec["shape"])
+    return arrays, header, buffer
+
+
+class _Names(object):
+    # read only sequence of names decoded straight from the utf-8 blob
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return bytes(self.data[start:end]).decode("utf-8")
+
+
+class GraphSnapshot(object):
+    """
+    compact read only copy of the concept graph
+
+    concepts are numbered 0..n-1, names are interned in one utf-8 blob
+    and connections are kept as int32 CSR arrays per connection type, in
+    both directions, with uint8 strengths. A snapshot is saved as a single
+    file whose arrays can be memory mapped
+    """
+
+    def __init__(self, arrays, types, concept_types, buffer=None, meta=None):
+        self.arrays = arrays
+        self.meta = meta or {}
+        self.types = list(types)
+        self.concept_types = list(concept_types)
+        self._type_index = dict((t, k) for k, t in enumerate(self.types))
+        self._buffer = buffer  # keeps the mmap alive
+        self.names = _Names(arrays["name_data"], arrays["name_offsets"])
+        self._keys = arrays["key_data"]
+        self._key_offsets = arrays["key_offsets"]
+
+    # building
+    @classmethod
+    def from_database(cls, db):
+        """
+        freeze a ConceptDatabase, uses its GraphIndex when available
+
+        :param db: ConceptDatabase
+        :return: GraphSnapshot
+        """
+        if db.index is not None:
+            with db.index.lock:
+                concepts = sorted((concept_id, name, concept_type)
+                                  for concept_id, (name, concept_type) in
+                                  db.index.concepts.items())
+                connections = [(con_id,) + con for con_id, con in
+                               db.index.connections.items()]
+        else:
+            concepts = db.session.query(Concept.id, Concept.name,
+                                        Concept.type).order_by(Concept.id)
+            connections = db.session.query(
+                Connection.id, Connection.source_id, Connection.type,
+                Connection.target_id, Connection.strength).yield_per(10000)
+        snapshot = cls.from_rows(concepts, connections)
+        snapshot.meta["version"] = db.graph_version()
+        return snapshot
+
+    @classmethod
+    def from_rows(cls, concepts, connections):
+        """
+        :param concepts: iterable of (id, name, type) sorted by id
+        :param connections: iterable of (id, source_id, type, target_id, strength)
+        """
+        concept_ids = []
+        blob = bytearray()
+        name_offsets = [0]
+        concept_types = []
+        concept_type_index = {}
+        concept_type_codes = []
+        for concept_id, name, concept_type in concepts:
+            concept_ids.append(concept_id)
+            blob += (name or "").encode("utf-8")
+            name_offsets.append(len(blob))
+            if concept_type not in concept_type_index:
+                concept_type_index[concept_type] = len(concept_types)
+                concept_types.append(concept_type)
+            concept_type_codes.append(concept_type_index[concept_type])
+        concept_ids = np.array(concept_ids, dtype=np.int64)
+        n = len(concept_ids)
+
+        types = []
+        type_index = {}
+        edges = {}  # type code -> ([sources], [targets], [strengths])
+        for _, source_id, con_type, target_id, strength in connections:
+            if source_id is None or target_id is None:
+                continue
+            if con_type not in type_index:
+                type_index[con_type] = len(types)
+                types.append(con_type)
+                edges[type_index[con_type]] = ([], [], [])
+            sources, targets, strengths = edges[type_index[con_type]]
+            sources.append(source_id)
+            targets.append(target_id)
+            strengths.append(strength if strength is not None else 50)
+
+        arrays = {
+            "concept_ids": concept_ids,
+            "concept_types": np.array(concept_type_codes, dtype=np.uint16),
+            "name_offsets": np.array(name_offsets, dtype=np.int64),
+            "name_data": np.frombuffer(bytes(blob), dtype=np.uint8)
+        }
+        # normalized keys in sorted order with the position of their name,
+        # for binary search
+        keys = sorted((normalize_name(bytes(
+            blob[name_offsets[i]:name_offsets[i + 1]]).decode(
+            "utf-8")).encode("utf-8"), i) for i in range(n))
+        key_blob = b"".join(key for key, _ in keys)
+        key_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum([len(key) for key, _ in keys], out=key_offsets[1:])
+        arrays["key_data"] = np.frombuffer(key_blob, dtype=np.uint8)
+        arrays["key_offsets"] = key_offsets
+        arrays["name_order"] = np.array([i for _, i in keys], dtype=np.int32)
+        for code, (sources, targets, strengths) in edges.items():
+            sources = np.array(sources, dtype=np.int64)
+            targets = np.array(targets, dtype=np.int64)
+            # drop connections pointing at deleted concepts
+            known = np.isin(sources, concept_ids) & \
+                np.isin(targets, concept_ids)
+            # database ids -> dense 0..n-1 positions
+            sources = np.searchsorted(concept_ids, sources[known])
+            targets = np.searchsorted(concept_ids, targets[known])
+            strengths = np.clip(np.array(strengths)[known], 0,
+                                255).astype(np.uint8)
+            for direction, rows, cols in (("out", sources, targets),
+                                          ("in", targets, sources)):
+                order = np.argsort(rows, kind="stable")
+                offsets = np.zeros(n + 1, dtype=np.int32)
+                np.cumsum(np.bincount(rows, minlength=n), out=offsets[1:])
+                arrays["%s_offsets_%d" % (direction, code)] = offsets
+                arrays["%s_targets_%d" % (direction, code)] = \
+                    cols[order].astype(np.int32)
+                arrays["%s_strengths_%d" % (direction, code)] = \
+                    strengths[order]
+        return cls(arrays, types, concept_types)
+
+    # persistence
+    def save(self, path):
+        return save_arrays(path, self.arrays,
+                           {"types": self.types,
+                            "concept_types": self.concept_types,
+                            "meta": self.meta})
+
+    @classmethod
+    def load(cls, path, mmap_mode=True):
+        """
+        :param path: file written by save
+        :param mmap_mode: map the file read only instead of reading it
+        """
+        arrays, header, buffer = load_arrays(path, mmap_mode)
+        return cls(arrays, header["types"], header["concept_types"], buffer,
+                   header.get("meta"))
+
+    # queries
+    def total_concepts(self):
+        return len(self.arrays["concept_ids"])
+
+    def total_connections(self):
+        return sum(len(self.arrays["out_targets_%d" % k])
+                   for k in range(len(self.types)))
+
+    def _key(self, k):
+        return bytes(self._keys[self._key_offsets[k]:self._key_offsets[k + 1]])
+
+    def concept_index(self, name):
+        # binary search over the sorted keys, the name is normalized once
+        # and no dict is built
+        order = self.arrays["name_order"]
+        key = (normalize_name(name) or "").encode("utf-8")
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(order) and self._key(lo) == key:
+            return int(order[lo])
+        return None
+
+    def concept_position(self, concept_id):
+        """
+        :return: position of a database concept id, None if it is not in
+                 the snapshot
+        """
+        ids = self.arrays["concept_ids"]
+        idx = int(np.searchsorted(ids, concept_id))
+        if idx < len(ids) and ids[idx] == concept_id:
+            return idx
+        return None
+
+    def concept_name(self, idx):
+        return self.names[idx]
+
+    def concept_id(self, idx):
+        return int(self.arrays["concept_ids"][idx])
+
+    def concept_type(self, idx):
+        return self.concept_types[self.arrays["concept_types"][idx]]
+
+    def neighbours(self, idx, types=None, direction="out"):
+        """
+        :return: (neighbour positions, strengths, type codes) arrays
+        """
+        codes = range(len(self.types)) if types is None else \
+            [self._type_index[t] for t in types if t in self._type_index]
+        directions = ["out", "in"] if direction == "both" else [direction]
+        found = []
+        for d in directions:
+            for code in codes:
+                offsets = self.arrays["%s_offsets_%d" % (d, code)]
+                start, end = offsets[idx], offsets[idx + 1]
+                if start == end:
+                    continue
+                found.append((
+                    self.arrays["%s_targets_%d" % (d, code)][start:end],
+                    self.arrays["%s_strengths_%d" % (d, code)][start:end],
+                    np.full(end - start, code, dtype=np.uint16)))
+        if not found:
+            return (np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.uint8),
+                    np.zeros(0, dtype=np.uint16))
+        return tuple(np.concatenate(a) for a in zip(*found))
+
+    def expand(self, name, hops=1, direction="out", types=None):
+        """
+        k hop neighbourhood, same result as GraphTraversal.expand
+
+        :return: dict of concept name -> distance in hops
+        """
+        start = self.concept_index(name)
+        if start is None:
+            return {}
+        distance = np.full(self.total_concepts(), -1, dtype=np.int32)
+        distance[start] = 0
+        frontier = [start]
+        for hop in range(1, hops + 1):
+            found = [self.neighbours(idx, types, direction)[0]
+                     for idx in frontier]
+            if not found:
+                break
+            found = np.unique(np.concatenate(found))
+            found = found[distance[found] < 0]
+            if not len(found):
+                break
+            distance[found] = hop
+            frontier = found
+        reached = np.nonzero(distance >= 0)[0]
+        return dict((self.names[idx], int(distance[idx])) for idx in reached)
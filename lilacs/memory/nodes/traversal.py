@@ -0,0 +1,249 @@
+from heapq import heappush, heappop
+
+from lilacs.memory.nodes.index import GraphIndex
+
+
+def strength_cost(strength):
+    # strong connections are cheap to follow
+    return 1.0 / max(strength or 0, 1)
+
+
+class IndexAdjacency(object):
+    # adjacency of a GraphIndex, nodes are concept ids
+    def __init__(self, index):
+        self.index = index
+
+    def nodes(self, name):
+        if isinstance(name, int):
+            return [name] if name in self.index.concepts else []
+        return self.index.concept_ids(name)
+
+    def name(self, node):
+        return self.index.concept_name(node)
+
+    def neighbours(self, node, direction="both", types=None):
+        # yields (neighbour, (source, type, target, strength))
+        if direction in ("out", "both"):
+            for con in self.index.out_connections(node):
+                if types is None or con[1] in types:
+                    yield con[2], con
+        if direction in ("in", "both"):
+            for con in self.index.in_connections(node):
+                if types is None or con[1] in types:
+                    yield con[0], con
+
+
+class SnapshotAdjacency(object):
+    # adjacency of a GraphSnapshot, nodes are snapshot positions, concepts
+    # are still given by database id like with IndexAdjacency
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def nodes(self, name):
+        if isinstance(name, int):
+            idx = self.snapshot.concept_position(name)
+        else:
+            idx = self.snapshot.concept_index(name)
+        return [] if idx is None else [idx]
+
+    def name(self, node):
+        return self.snapshot.concept_name(node)
+
+    def neighbours(self, node, direction="both", types=None):
+        for d in (["out", "in"] if direction == "both" else [direction]):
+            targets, strengths, codes = self.snapshot.neighbours(node, types, d)
+            for target, strength, code in zip(targets.tolist(),
+                                              strengths.tolist(),
+                                              codes.tolist()):
+                con_type = self.snapshot.types[code]
+                if d == "out":
+                    yield target, (node, con_type, target, strength)
+                else:
+                    yield target, (target, con_type, node, strength)
+
+
+class GraphTraversal(object):
+    """
+    path finding over the in memory adjacency of a ConceptDatabase
+
+    runs on a memory mapped GraphSnapshot when given one, else on the
+    database GraphIndex when it is indexed, otherwise loads a private
+    index of the graph once, no per node queries are issued
+    """
+    ancestor_types = ["instance of", "label"]
+
+    def __init__(self, db=None, index=None, snapshot=None):
+        if snapshot is not None:
+            self.graph = SnapshotAdjacency(snapshot)
+            return
+        if index is None:
+            index = getattr(db, "index", None)
+        if index is None:
+            index = GraphIndex()
+            index.load(db.session)
+        self.graph = IndexAdjacency(index)
+
+    def _neighbours(self, node, direction="both", types=None):
+        return self.graph.neighbours(node, direction, types)
+
+    def _ids(self, name):
+        return self.graph.nodes(name)
+
+    def _triples(self, cons):
+        return [(self.graph.name(source), con_type, self.graph.name(target))
+                for source, con_type, target, _ in cons]
+
+    def expand(self, name, hops=1, direction="out", types=None):
+        """
+        k hop neighbourhood of a concept
+
+        :param name: concept name or id
+        :param hops: maximum distance
+        :param direction: "out", "in" or "both"
+        :param types: optional list of connection types to follow
+        :return: dict of concept name -> distance in hops
+        """
+        distances = dict((concept_id, 0) for concept_id in self._ids(name))
+        frontier = list(distances)
+        for hop in range(1, hops + 1):
+            found = []
+            for concept_id in frontier:
+                for neighbour, _ in self._neighbours(concept_id, direction,
+                                                     types):
+                    if neighbour not in distances:
+                        distances[neighbour] = hop
+                        found.append(neighbour)
+            if not found:
+                break
+            frontier = found
+        result = {}
+        for concept_id, distance in distances.items():
+            name = self.graph.name(concept_id)
+            if name not in result or distance < result[name]:
+                result[name] = distance
+        return result
+
+    def path(self, source, target, direction="both", types=None, max_hops=6):
+        """
+        shortest path in number of connections, bidirectional breadth
+        first search expanding the smaller frontier on every step
+
+        :param source: concept name or id
+        :param target: concept name or id
+        :param direction: "out" follows connections source -> target, "both" ignores direction
+        :param types: optional list of connection types to follow
+        :param max_hops: give up after this many connections
+        :return: list of (source, type, target) triples, None if unreachable
+        """
+        sources = self._ids(source)
+        targets = self._ids(target)
+        if not sources or not targets:
+            return None
+        if set(sources) & set(targets):
+            return []
+        backward = {"out": "in", "in": "out"}.get(direction, "both")
+        # node -> (previous node, connection)
+        forward_parents = dict((c, None) for c in sources)
+        backward_parents = dict((c, None) for c in targets)
+        forward_frontier = list(sources)
+        backward_frontier = list(targets)
+        hops = 0
+        while forward_frontier and backward_frontier and hops < max_hops:
+            hops += 1
+            if len(forward_frontier) <= len(backward_frontier):
+                forward_frontier, meet = self._bfs_step(
+                    forward_frontier, forward_parents, backward_parents,
+                    direction, types)
+            else:
+                backward_frontier, meet = self._bfs_step(
+                    backward_frontier, backward_parents, forward_parents,
+                    backward, types)
+            if meet is not None:
+                cons = []
+                node = meet
+                while forward_parents[node] is not None:
+                    node, con = forward_parents[node]
+                    cons.insert(0, con)
+                node = meet
+                while backward_parents[node] is not None:
+                    node, con = backward_parents[node]
+                    cons.append(con)
+                return self._triples(cons)
+        return None
+
+    def _bfs_step(self, frontier, parents, other_parents, direction, types):
+        found = []
+        for concept_id in frontier:
+            for neighbour, con in self._neighbours(concept_id, direction,
+                                                   types):
+                if neighbour in parents:
+                    continue
+                parents[neighbour] = (concept_id, con)
+                if neighbour in other_parents:
+                    return found, neighbour
+                found.append(neighbour)
+        return found, None
+
+    def weighted_path(self, source, target, direction="both", types=None,
+                      cost=strength_cost, max_cost=None):
+        """
+        cheapest path using connection strength, dijkstra over the index
+
+        :param cost: callable mapping a connection strength to a positive cost
+        :param max_cost: give up on paths more expensive than this
+        :return: (total cost, list of (source, type, target) triples), None if unreachable
+        """
+        targets = set(self._ids(target))
+        if not targets:
+            return None
+        best = {}
+        parents = {}
+        heap = []
+        for concept_id in self._ids(source):
+            best[concept_id] = 0.0
+            parents[concept_id] = None
+            heappush(heap, (0.0, concept_id))
+        while heap:
+            total, concept_id = heappop(heap)
+            if total > best.get(concept_id, total):
+                continue
+            if concept_id in targets:
+                cons = []
+                while parents[concept_id] is not None:
+                    concept_id, con = parents[concept_id]
+                    cons.insert(0, con)
+                return total, self._triples(cons)
+            for neighbour, con in self._neighbours(concept_id, direction,
+                                                   types):
+                strength = con[3]
+                new_total = total + cost(strength)
+                if max_cost is not None and new_total > max_cost:
+                    continue
+                if new_total < best.get(neighbour, float("inf")):
+                    best[neighbour] = new_total
+                    parents[neighbour] = (concept_id, con)
+                    heappush(heap, (new_total, neighbour))
+        return None
+
+    def ancestors(self, name, types=None, max_depth=10):
+        """
+        concepts above name following "instance of" and "label" connections
+
+        :return: dict of ancestor name -> depth
+        """
+        types = types or self.ancestor_types
+        return dict((n, d) for n, d in self.expand(name, max_depth, "out",
+                                                   types).items() if d > 0)
+
+    def common_ancestors(self, first, second, types=None, max_depth=10):
+        """
+        what first and second have in common, closest ancestors first
+
+        :return: list of (ancestor name, depth from first, depth from second)
+        """
+        first_ancestors = self.ancestors(first, types, max_depth)
+        second_ancestors = self.ancestors(second, types, max_depth)
+        common = [(name, first_ancestors[name], second_ancestors[name])
+                  for name in first_ancestors if name in second_ancestors]
+        common.sort(key=lambda c: (c[1] + c[2], c[0]))
+        return common
@@ -0,0 +1,326 @@
+import numpy as np
+
+from lilacs.memory.nodes import Concept
+from lilacs.memory.nodes.names import normalize_name
+from lilacs.memory.nodes.snapshot import save_arrays, load_arrays
+
+MAGIC = b"LILACSV1"
+# most scores computed at once when searching, bounds the memory of a
+# batch of queries against a large matrix
+MAX_SCORES = 2 ** 24
+
+
+def normalize_rows(vectors):
+    """
+    :return: float32 copy of a vector or matrix with unit length rows,
+             zero rows stay zero
+    """
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def top_k(scores, k):
+    """
+    positions of the k highest scores along the last axis, best first.
+    argpartition selects them in linear time, only those k are sorted
+    """
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        idx = np.broadcast_to(np.arange(n), scores.shape).copy()
+    order = np.argsort(-np.take_along_axis(scores, idx, -1), axis=-1,
+                      kind="stable")
+    return np.take_along_axis(idx, order, -1)
+
+
+def _embed_concepts(db, embed, after, batch_size):
+    # (names, vectors, last concept id) per batch of concepts after the
+    # id after, names without a vector are skipped
+    names, vectors = [], []
+    last_id = after
+    for concept_id, name in db.session.query(Concept.id, Concept.name).filter(
+            Concept.id > after).order_by(Concept.id).yield_per(batch_size):
+        last_id = concept_id
+        vector = embed(name) if name else None
+        if vector is None:
+            continue
+        names.append(name)
+        vectors.append(vector)
+        if len(names) >= batch_size:
+            yield names, vectors, last_id
+            names, vectors = [], []
+    if names or last_id != after:
+        yield names, vectors, last_id
+
+
+class VectorIndex(object):
+    """
+    nearest neighbour index over concept embeddings
+
+    vectors are rows of a float32 matrix normalized to unit length, so the
+    cosine similarity of a batch of queries is one matrix product. After
+    train the rows are also grouped into an inverted file (IVF) by their
+    closest k-means centroid, queries then only score the rows of the
+    n_probe closest groups plus the rows added since training
+    """
+
+    def __init__(self, dim, capacity=1024):
+        self.dim = dim
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.size = 0
+        self.keys = []  # row -> name
+        self.rows = {}  # normalized name -> row
+        self.centroids = None
+        self.list_offsets = None
+        self.list_rows = None
+        self.trained_size = 0
+        self.n_probe = 8
+        # highest database id of the concepts embedded so far
+        self.last_concept_id = 0
+        self._buffer = None  # keeps the mmap alive
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, name):
+        return normalize_name(name) in self.rows
+
+    @property
+    def matrix(self):
+        return self._matrix[:self.size]
+
+    # building
+    @classmethod
+    def from_database(cls, db, embed, batch_size=10000):
+        """
+        embed every concept of a ConceptDatabase
+
+        :param db: ConceptDatabase
+        :param embed: callable mapping a concept name to a vector, or None
+                      for names it has no vector for
+        :return: VectorIndex, None if no concept could be embedded
+        """
+        index = None
+        for names, vectors, last_id in _embed_concepts(db, embed, 0,
+                                                       batch_size):
+            if names:
+                index = index or cls(len(vectors[0]))
+                index.add(names, vectors)
+            if index is not None:
+                index.last_concept_id = last_id
+        return index
+
+    def update(self, db, embed, batch_size=10000):
+        """
+        embed the concepts added to db since the index was built, renamed
+        concepts keep their old vector until the index is rebuilt
+
+        :return: number of concepts embedded
+        """
+        added = 0
+        for names, vectors, last_id in _embed_concepts(
+                db, embed, self.last_concept_id, batch_size):
+            if names:
+                self.add(names, vectors)
+                added += len(names)
+            self.last_concept_id = last_id
+        return added
+
+    def add(self, names, vectors):
+        """
+        add or replace the vectors of names. Replaced rows stay in their
+        IVF list until the next train
+
+        :param names: list of concept names
+        :param vectors: matching list or (n, dim) array of vectors
+        """
+        vectors = normalize_rows(vectors)
+        keys = [normalize_name(name) for name in names]
+        self._reserve(len(set(k for k in keys if k not in self.rows)))
+        for name, key, vector in zip(names, keys, vectors):
+            row = self.rows.get(key)
+            if row is None:
+                row = self.size
+                self.size += 1
+                self.rows[key] = row
+                self.keys.append(name)
+            self._matrix[row] = vector
+
+    def _reserve(self, extra):
+        # loaded matrices are read only maps of the file
+        if self.size + extra <= len(self._matrix) and \
+                self._matrix.flags.writeable:
+            return
+        capacity = max(self.size + extra, 2 * len(self._matrix))
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:self.size] = self.matrix
+        self._matrix = matrix
+
+    def vector(self, name):
+        row = self.rows.get(normalize_name(name))
+        return None if row is None else self._matrix[row]
+
+    def train(self, n_lists=None, n_probe=8, iterations=10, sample=100000,
+              seed=0):
+        """
+        build the IVF, spherical k-means over a sample of the rows
+
+        :param n_lists: number of centroids, defaults to sqrt(rows)
+        :param n_probe: lists scored per query, more is slower and exact-er
+        """
+        n = self.size
+        n_lists = min(n_lists or int(np.sqrt(n)), n)
+        if n_lists < 1:
+            return
+        random = np.random.RandomState(seed)
+        data = self.matrix
+        if n > sample:
+            data = data[random.choice(n, sample, replace=False)]
+        centroids = data[random.choice(len(data), n_lists, replace=False)]
+        for _ in range(iterations):
+            assigned = self._nearest(data, centroids)
+            order = np.argsort(assigned, kind="stable")
+            counts = np.bincount(assigned, minlength=n_lists)
+            # empty lists keep their old centroid
+            filled = counts > 0
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            centroids[filled] = normalize_rows(np.add.reduceat(
+                data[order], starts[filled]))
+        assigned = self._nearest(self.matrix, centroids)
+        self.centroids = centroids
+        self.list_rows = np.argsort(assigned, kind="stable").astype(np.int64)
+        self.list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assigned, minlength=n_lists),
+                  out=self.list_offsets[1:])
+        self.trained_size = n
+        self.n_probe = n_probe
+
+    @staticmethod
+    def _nearest(vectors, centroids):
+        step = max(1, MAX_SCORES // len(centroids))
+        return np.concatenate([
+            np.argmax(vectors[start:start + step].dot(centroids.T), axis=1)
+            for start in range(0, len(vectors), step)])
+
+    # queries
+    def search(self, queries, k=10, exclude=None):
+        """
+        k nearest rows of every query by cosine similarity
+
+        :param queries: (m, dim) array, or a single vector
+        :param k: results per query
+        :param exclude: optional list with an iterable of rows per query
+                        that must not be returned
+        :return: (rows, scores) arrays of shape (m, k) best first, missing
+                 results have row -1 and score -inf
+        """
+        queries = normalize_rows(queries)
+        m = len(queries)
+        rows = np.full((m, k), -1, dtype=np.int64)
+        scores = np.full((m, k), -np.inf, dtype=np.float32)
+        if not self.size or not k:
+            return rows, scores
+        if self.centroids is None:
+            step = max(1, MAX_SCORES // self.size)
+            for start in range(0, m, step):
+                batch = queries[start:start + step].dot(self.matrix.T)
+                for i in range(len(batch)):
+                    if exclude is not None:
+                        batch[i, list(exclude[start + i])] = -np.inf
+                found = top_k(batch, k)
+                width = found.shape[1]
+                rows[start:start + len(batch), :width] = found
+                scores[start:start + len(batch), :width] = \
+                    np.take_along_axis(batch, found, 1)
+        else:
+            probes = top_k(queries.dot(self.centroids.T), self.n_probe)
+            recent = np.arange(self.trained_size, self.size)
+            for i, query in enumerate(queries):
+                candidates = np.concatenate(
+                    [self.list_rows[self.list_offsets[p]:
+                                    self.list_offsets[p + 1]]
+                     for p in probes[i]] + [recent])
+                if not len(candidates):
+                    continue
+                candidate_scores = self.matrix[candidates].dot(query)
+                if exclude is not None:
+                    candidate_scores[np.isin(candidates,
+                                             list(exclude[i]))] = -np.inf
+                found = top_k(candidate_scores, k)
+                rows[i, :len(found)] = candidates[found]
+                scores[i, :len(found)] = candidate_scores[found]
+        rows[~np.isfinite(scores)] = -1
+        return rows, scores
+
+    def _results(self, rows, scores):
+        return [(self.keys[row], float(score))
+                for row, score in zip(rows, scores) if row >= 0]
+
+    def similar(self, name, k=10):
+        """
+        :param name: concept name or query vector
+        :return: list of (concept name, cosine similarity), best first
+        """
+        if isinstance(name, str):
+            row = self.rows.get(normalize_name(name))
+            if row is None:
+                return []
+            rows, scores = self.search(self._matrix[row], k, [[row]])
+        else:
+            rows, scores = self.search(name, k)
+        return self._results(rows[0], scores[0])
+
+    def analogy(self, a, b, c, k=3):
+        """
+        a is to b as c is to ?, nearest concepts to b - a + c without the
+        three given ones
+
+        :return: list of (concept name, cosine similarity), best first
+        """
+        words = [self.rows.get(normalize_name(w)) for w in (a, b, c)]
+        if None in words:
+            return []
+        a, b, c = (self._matrix[row] for row in words)
+        rows, scores = self.search(b - a + c, k, [words])
+        return self._results(rows[0], scores[0])
+
+    # persistence
+    def save(self, path):
+        arrays = {"matrix": self.matrix}
+        if self.centroids is not None:
+            arrays.update(centroids=self.centroids,
+                          list_offsets=self.list_offsets,
+                          list_rows=self.list_rows)
+        return save_arrays(path, arrays,
+                           {"dim": self.dim, "keys": self.keys,
+                            "trained_size": self.trained_size,
+                            "n_probe": self.n_probe,
+                            "last_concept_id": self.last_concept_id}, MAGIC)
+
+    @classmethod
+    def load(cls, path, mmap_mode=True):
+        """
+        :param path: file written by save
+        :param mmap_mode: map the matrix read only, it is copied on the
+                          first add
+        """
+        arrays, header, buffer = load_arrays(path, mmap_mode, MAGIC)
+        index = cls(header["dim"], 0)
+        index._matrix = arrays["matrix"]
+        index._buffer = buffer
+        index.size = len(index._matrix)
+        index.keys = header["keys"]
+        index.last_concept_id = header.get("last_concept_id", 0)
+        index.rows = dict((normalize_name(name), row)
+                          for row, name in enumerate(index.keys))
+        if "centroids" in arrays:
+            index.centroids = arrays["centroids"]
+            index.list_offsets = arrays["list_offsets"]
+            index.list_rows = arrays["list_rows"]
+            index.trained_size = header["trained_size"]
+            index.n_probe = header["n_probe"]
+        return index
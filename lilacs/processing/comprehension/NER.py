@@ -1,4 +1,4 @@
-import requests
+from lilacs.memory.cache import cached_json, cached_text
 
 
 def polyglot_NER_demo(text):
@@ -17,9 +17,7 @@ def polyglot_NER_demo(text):
             "min_O": 0.00
             }
     url = "https://entityextractor.appspot.com/ner"
-    r = requests.post(url, data=data)
-
-    t = r.text.replace("<br>", "")
+    t = cached_text("polyglot", "post", url, data=data).replace("<br>", "")
     NER = []
     # parse colors
     candidates = [c for c in t.split("</font>") if not c.startswith('<font color="black">')]
@@ -98,8 +96,8 @@ def spacy_NER_demo(text):
     ents = []
     try:
         data = {"model": "en_core_web_lg", "text": text}
-        r = requests.post("https://api.explosion.ai/displacy/ent", data)
-        r = r.json()
+        r = cached_json("displacy", "post",
+                        "https://api.explosion.ai/displacy/ent", data=data)
         for e in r:
             txt = text[e["start"]:e["end"]]
             ents.append((txt, e["label"].lower()))
@@ -148,7 +146,7 @@ def allennlp_NER_demo(text):
     try:
         url = "http://demo.allennlp.org/predict/named-entity-recognition"
         data = {"sentence": text}
-        r = requests.post(url, json=data).json()
+        r = cached_json("allennlp", "post", url, json=data)
         words = r["words"]
         tags = r["tags"]
         ents = []
@@ -1,6 +1,6 @@
 import random
-import requests
 from lilacs.settings import ALLENNLP_URL
+from lilacs.memory.cache import cached_json
 
 from pprint import pprint
 
@@ -37,8 +37,8 @@ def replace_coreferences(text, nlp=None):
 def neuralcoref_demo(text):
     try:
         params = {"text": text}
-        r = requests.get("https://coref.huggingface.co/coref",
-                         params=params).json()
+        r = cached_json("neuralcoref", "get",
+                        "https://coref.huggingface.co/coref", params=params)
         text = r["corefResText"] or text
     except Exception as e:
         print(e)
@@ -49,8 +49,7 @@ def neuralcoref_demo(text):
 def cogcomp_demo(text):
     url = "https://cogcomp.org/demo_files/Coref.php"
     data = {"lang": "en", "text": text}
-    r = requests.post(url, json=data)
-    return r.json()
+    return cached_json("cogcomp", "post", url, json=data)
 
 
 def cogcomp_coref_nodes(text):
@@ -126,7 +125,7 @@ def textual_entailment(premise, hypothesis):
     url = ALLENNLP_URL + "textual-entailment"
     data = {"premise": premise,
             "hypothesis": hypothesis}
-    r = requests.post(url, json=data).json()
+    r = cached_json("allennlp", "post", url, json=data)
     probs = r["label_probs"]
     return {"entailment": probs[0], "contradiction": probs[1],
             "neutral": probs[2]}
@@ -147,7 +146,7 @@ def comprehension(question, passage):
     """
     url = ALLENNLP_URL + "machine-comprehension"
     data = {"passage": passage, "question": question}
-    r = requests.post(url, json=data).json()
+    r = cached_json("allennlp", "post", url, json=data)
     return r["best_span_str"]
 
 
@@ -165,7 +164,7 @@ def semantic_role_labeling(sentence):
     """
     url = ALLENNLP_URL + "semantic-role-labeling"
     data = {"sentence": sentence}
-    r = requests.post(url, json=data).json()
+    r = cached_json("allennlp", "post", url, json=data)
     roles = {}
     words = r["words"]
     verbs = r["verbs"]
@@ -196,7 +195,7 @@ def constituency_parse(sentence):
     """
     url = ALLENNLP_URL + "constituency-parsing"
     data = {"sentence": sentence}
-    r = requests.post(url, json=data).json()
+    r = cached_json("allennlp", "post", url, json=data)
     r.pop('class_probabilities')
     r.pop('spans')
     r.pop("slug")
@@ -214,7 +213,7 @@ def information_extraction(sentence):
     """
     url = ALLENNLP_URL + "open-information-extraction"
     data = {"sentence": sentence}
-    r = requests.post(url, json=data).json()
+    r = cached_json("allennlp", "post", url, json=data)
     data["propositions"] = {}
     for v in r["verbs"]:
         verb = v["verb"]
@@ -235,7 +234,7 @@ def event2mind(sentence):
     """
     url = ALLENNLP_URL + "event2mind"
     data = {"source": sentence}
-    r = requests.post(url, json=data).json()
+    r = cached_json("allennlp", "post", url, json=data)
     data = {"sentence": sentence,
             #"subject": "PersonX",
             #"object": "PersonY",
@@ -284,7 +283,7 @@ def documentqa(sentence):
     """
     url = "https://documentqa.allenai.org/answer"
     data = {"question": sentence}
-    r = requests.get(url, data).json()
+    r = cached_json("documentqa", "get", url, params=data)
 
     data = {"sentence": sentence,
             "answers": [],
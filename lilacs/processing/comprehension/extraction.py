@@ -1,10 +1,9 @@
-import requests
+from lilacs.memory.cache import cached_json
 from lilacs.util.parse import extract_datetime, extract_number
 from lilacs.processing.comprehension.NER import spacy_NER_demo, spacy_NER, FOX_NER, allennlp_NER_demo, polyglot_NER, polyglot_NER_demo
 import geocoder
-import spotlight
 import datetime
-from lilacs.settings import SPOTLIGHT_URL
+from lilacs.memory.data_sources.dbpedia import spotlight_annotate
 
 
 # use the source https://cogcomp.org/page/demo_view/Wikifier
@@ -12,12 +11,7 @@ from lilacs.settings import SPOTLIGHT_URL
 def wikifier(text):
     url = "https://cogcomp.org/demo_files/Wikifier.php"
     data = {"lang": "en", "text": text}
-    r = requests.post(url, data=data)
-    return r.json()
-
-
-def spotlight_annotate(text):
-    return spotlight.annotate(SPOTLIGHT_URL, text)
+    return cached_json("cogcomp", "post", url, data=data)
 
 
 def dandelion_annotate(text):
@@ -120,7 +114,8 @@ def relation_extraction(text):
     url = "http://semanticparsing.ukp.informatik.tu-darmstadt.de:5000/relation-extraction/parse/"
     relations = []
     try:
-        data = requests.post(url, json={"inputtext": text}).json()
+        data = cached_json("relation extraction", "post", url,
+                           json={"inputtext": text})
         data = data["relation_graph"]
         if data:
             tokens = data["tokens"]
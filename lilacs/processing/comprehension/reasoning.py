@@ -1,5 +1,5 @@
-import requests
 import random
+import weakref
 from lilacs.processing.comprehension import textual_entailment, \
     comprehension, documentqa
 from lilacs.processing.comprehension.extraction import LILACSextractor
@@ -8,8 +8,10 @@ import spacy
 from lilacs.processing import LILACSTextAnalyzer
 from lilacs.processing.nlp.word_vectors import similar_turkunlp_demo, similar_sense2vec, similar_sense2vec_demo
 from lilacs.processing.comprehension.solvers import TextualEntailmentSolver, WordVectorSimilaritySolver
-from numpy import dot
-from numpy.linalg import norm
+from lilacs.memory.cache import cached, cached_json, cached_text
+from lilacs.memory.nodes.names import normalize_name
+from lilacs.memory.nodes.vectors import VectorIndex
+import numpy as np
 
 
 # DO NOT ABUSE
@@ -23,7 +25,7 @@ def ask_euclid(text):
 
     """
     url = "http://euclid.allenai.org/api/solve?query=" + text
-    return requests.get(url).json()[0]
+    return cached_json("euclid", "get", url)[0]
 
 
 # DO NOT ABUSE
@@ -39,7 +41,7 @@ def ask_aristo(text, raw=False):
 
     """
     url = "http://aristo-demo.allenai.org/api/ask?text=" + text
-    data = requests.get(url).json()
+    data = cached_json("aristo", "get", url)
     if raw:
         return data
     answers = data["response"]["success"]["answers"]
@@ -75,8 +77,16 @@ def EYE_rest(data, rules="", query="{ ?a ?b ?c. } => { ?a ?b ?c. }.", server_url
     """
     if rules:
         data = data + "\n" + rules
-    r = requests.post(server_url, json={"data": data, "query": query}).text
-    return r
+    return cached_text("eye", "post", server_url,
+                       json={"data": data, "query": query})
+
+
+@cached("wikipedia page")
+def wikipedia_content(concept):
+    wiki_name = wikipedia.search(concept)
+    if wiki_name:
+        return wikipedia.page(wiki_name[0]).content
+    return None
 
 
 class LILACSReasoner(object):
@@ -85,6 +95,12 @@ class LILACSReasoner(object):
     coref_nlp = None
     nlp = None
     analyzer = LILACSTextAnalyzer
+    # nlp -> VectorIndex of its lowercase vocab, dropped with the model
+    _vocab_vectors = weakref.WeakKeyDictionary()
+    # default model of the vector methods, whatever model nlp is
+    vectors_nlp = None
+    # never given as analogy answers
+    analogy_exclude = ("king", "man", "woman")
 
     def __init__(self, bus=None, nlp=None, coref_nlp=None):
         """
@@ -121,17 +137,22 @@ class LILACSReasoner(object):
         return False
 
     @staticmethod
-    def related_nodes(concept, n=5, engine="sense2vec_demo"):
+    def related_nodes(concept, n=5, engine="sense2vec_demo", vectors=None):
         """
 
         Args:
             concept:
             n:
             engine:
+            vectors: VectorIndex for the "vectors" engine
 
         Returns:
 
         """
+        if engine == "vectors":
+            if vectors is None:
+                return []
+            return [name for name, _ in vectors.similar(concept, n)]
         if engine == "sense2vec_demo":
             return similar_sense2vec_demo(concept)
         elif engine == "sense2vec":
@@ -169,15 +190,78 @@ class LILACSReasoner(object):
         Returns:
 
         """
-        wiki_name = wikipedia.search(concept)
-        if wiki_name:
-            page = wikipedia.page(wiki_name[0])
-            corpus = page.content
+        corpus = wikipedia_content(concept)
+        if corpus:
             return LILACSReasoner.answer_corpus(question, corpus)
         return None
 
     @staticmethod
-    def analogy(a, b, c, nlp=None):
+    def _vector_model(nlp=None):
+        if nlp is None:
+            if LILACSReasoner.vectors_nlp is None:
+                LILACSReasoner.vectors_nlp = spacy.load('en_core_web_md')
+            nlp = LILACSReasoner.vectors_nlp
+        if not nlp.vocab.vectors.size:
+            raise ValueError("spacy model has no word vectors, use e.g. "
+                             "en_core_web_md")
+        return nlp
+
+    @staticmethod
+    def vocab_vectors(nlp=None):
+        """
+        row normalized matrix of the lowercase vocab vectors, built once
+        per spacy model
+
+        Args:
+            nlp: spacy model, defaults to en_core_web_md
+
+        Returns:
+            VectorIndex
+        """
+        nlp = LILACSReasoner._vector_model(nlp)
+        index = LILACSReasoner._vocab_vectors.get(nlp)
+        if index is None:
+            # take only the lowercased versions of known words
+            words = [w for w in nlp.vocab if
+                     w.has_vector and w.orth_.islower()]
+            index = VectorIndex(nlp.vocab.vectors_length, len(words))
+            if words:
+                index.add([w.orth_ for w in words],
+                          np.array([w.vector for w in words]))
+            LILACSReasoner._vocab_vectors[nlp] = index
+        return index
+
+    @staticmethod
+    def analogies(queries, nlp=None, n=3):
+        """
+        solve a batch of analogies with one matrix product
+
+        Args:
+            queries: list of (a, b, c), a is to b as c is to ??
+            nlp: spacy model, defaults to en_core_web_md
+            n: answers per analogy
+
+        Returns:
+            list with the n best words for every query, the words in
+            analogy_exclude are never answers
+        """
+        if not queries:
+            return []
+        nlp = LILACSReasoner._vector_model(nlp)
+        index = LILACSReasoner.vocab_vectors(nlp)
+        vocab = nlp.vocab
+        targets = np.array([vocab[b].vector - vocab[a].vector +
+                            vocab[c].vector for a, b, c in queries])
+        exclude = [index.rows[normalize_name(w)]
+                   for w in LILACSReasoner.analogy_exclude
+                   if normalize_name(w) in index.rows]
+        exclude = [exclude] * len(queries)
+        rows, _ = index.search(targets, n, exclude)
+        return [[index.keys[row] for row in found if row >= 0]
+                for found in rows]
+
+    @staticmethod
+    def analogy(a, b, c, nlp=None, n=3):
         """
 
         Args:
@@ -185,29 +269,13 @@ class LILACSReasoner(object):
             b:
             c:
             nlp:
+            n: number of answers
 
         Returns:
 
         """
-        parser = nlp or spacy.load('en_core_web_md')
-        # cosine similarity
-        cosine = lambda v1, v2: dot(v1, v2) / (norm(v1) * norm(v2))
-        # Let's see if it can figure out this analogy
         # Man is to King as Woman is to ??
-        a = parser.vocab[a]
-        b = parser.vocab[b]
-        c = parser.vocab[c]
-
-        result = b.vector - a.vector + c.vector
-
-        # gather all known words, take only the lowercased versions
-        allWords = list({w for w in parser.vocab if
-                         w.has_vector and w.orth_.islower() and w.lower_ != "king" and w.lower_ != "man" and w.lower_ != "woman"})
-        # sort by similarity to the result
-        allWords.sort(key=lambda w: cosine(w.vector, result), reverse=True)
-
-        #print(allWords[0].orth_, allWords[1].orth_, allWords[2].orth_)
-        return [a.orth_ for a in allWords[:3]]
+        return LILACSReasoner.analogies([(a, b, c)], nlp, n)[0]
 
     # WIP
     def answer(self, question):
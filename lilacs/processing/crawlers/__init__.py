@@ -1,6 +1,10 @@
-from lilacs.memory.nodes.short_term import ConceptDatabase
+from lilacs.memory.nodes.long_term import LongTermMemory
+from lilacs.memory.nodes.sharded import REFERENCE_TYPE
+from lilacs.processing.crawlers.scheduler import CrawlScheduler
+from lilacs.settings import CRAWL_REFRESH_INTERVAL
 from threading import Thread
 import random
+import time
 
 
 class DummyNode(object):
@@ -9,9 +13,14 @@ class DummyNode(object):
 
 
 class DummyCrawler(object):
+    # optional ConceptDatabase, BaseCrawler always has one
+    db = None
+
     def __init__(self, max_crawl=200, threaded=True):
         self.more_nodes = []
         self.crawl_list = []
+        # same names as crawl_list, for membership checks
+        self._crawled = set()
         self.con_list = []
         self.new_cons = []
         self.crawling = False
@@ -31,12 +40,23 @@ class DummyCrawler(object):
         while self.crawling:
             self.crawl_one()
         self.stop_crawling()
+        self.on_crawl_end()
+
+    def on_crawl_end(self):
+        pass
 
     def select_connections(self):
         return []
 
+    def propose_alias(self, name, alias):
+        # "same as" proposals become aliases when there is a database
+        print("** triple:", (name, "same as", alias))
+        if self.db is not None:
+            self.db.add_concept(name)
+            self.db.add_alias(alias, name)
+
     def choose_next_node(self, connections):
-        next_node = DummyNode(random.choice([n for n in self.more_nodes if n not in self.crawl_list]))
+        next_node = DummyNode(random.choice([n for n in self.more_nodes if n not in self._crawled]))
         print("** next", next_node.name)
         return next_node
 
@@ -46,7 +66,7 @@ class DummyCrawler(object):
         return new_cons
 
     def crawl_one(self):
-        self.more_nodes = [n for n in self.more_nodes if n not in self.crawl_list]
+        self.more_nodes = [n for n in self.more_nodes if n not in self._crawled]
         # check for end of crawl
         if self.max_crawl > 0 and self.steps > self.max_crawl:
             self.stop_crawling()
@@ -56,6 +76,7 @@ class DummyCrawler(object):
         self.steps += 1
         self.total_steps += 1
         self.crawl_list.append(self.current_node.name)
+        self._crawled.add(self.current_node.name)
 
         cons = self.select_connections()
         self.new_cons = self.execute_action(cons)
@@ -105,39 +126,173 @@ class DummyCrawler(object):
 
 
 class BaseCrawler(DummyCrawler):
-    def __init__(self, db=None, max_crawl=200, threaded=True, debug=False):
-        self.db = db or ConceptDatabase(debug=debug)
+    # seconds between checks whether the snapshot is behind the database
+    snapshot_refresh = 10 * 60
+
+    def __init__(self, db=None, max_crawl=200, threaded=True, debug=False,
+                 refresh_interval=CRAWL_REFRESH_INTERVAL, snapshot=False,
+                 policy=None):
+        # a ConceptDatabase or a ShardedConceptDatabase
+        self.db = db or LongTermMemory(debug=debug)
+        # optional MemoryPolicy of db, crawled concepts count as seen and
+        # the policy runs as the crawl goes
+        if policy is not None and policy.db is not self.db:
+            raise ValueError("policy must manage the crawler database")
+        self.policy = policy
+        # nodes crawled in a previous run within this window are skipped
+        self.refresh_interval = refresh_interval
+        # memory mapped graph to pick nodes from without loading the table
+        if snapshot and self.sharded:
+            raise ValueError("snapshots need a single ConceptDatabase")
+        self.snapshot = self.db.load_snapshot() if snapshot else None
+        self._snapshot_loaded = time.time()
+        # neighbours of crawled nodes, best first
+        self.scheduler = CrawlScheduler(refresh_interval)
+        # database or shard position -> (last_seen, id) of the last stale
+        # concept queued from it
+        self._stale_cursors = {}
         DummyCrawler.__init__(self, max_crawl, threaded)
 
+    def crawl_one(self):
+        if self.current_node is not None and \
+                getattr(self.current_node, "id", None) is not None:
+            now = int(time.time())
+            self.home(self.current_node.name).update_timestamp(
+                self.current_node.id, now)
+            if self.policy is not None:
+                # touched first, the current node is never archived
+                self.policy.touch([self.current_node.id], now)
+                self.policy.maintain(now)
+        DummyCrawler.crawl_one(self)
+
+    def start_crawling(self, start_node=None):
+        # a new crawl starts from its own seed and rescans stale concepts
+        self.scheduler.clear()
+        self._stale_cursors = {}
+        DummyCrawler.start_crawling(self, start_node)
+
+    @property
+    def sharded(self):
+        return getattr(self.db, "shards", None) is not None
+
+    def home(self, name):
+        """
+        :return: database the ids of concept name belong to, its shard
+                 for a ShardedConceptDatabase
+        """
+        if self.sharded:
+            return self.db.shard_for(name)
+        return self.db
+
     def con_exists(self, con_type, con_source, con_target):
-        con = self.db.search_connection_by_type(con_type)
-        for c in con:
-            if c.target is None or c.source is None:
-                print("deleting a malformed connection", c)
-                self.db.session.delete(c)
-                continue
-            if c.target.name == con_source and c.source.name == con_target:
-                return True
-        return False
+        return self.db.connection_exists(con_type, con_source, con_target)
 
     def select_connections(self):
         # select relevant connections from current node
         out = self.current_node.out_connections
         return out
 
+    def on_crawl_end(self):
+        # crawl threads release their own database session
+        if self.threaded:
+            self.db.close()
+
+    def is_crawlable(self, name, node_type, last_seen=0):
+        return bool(name) and name not in self._crawled \
+            and (last_seen or 0) < time.time() - self.refresh_interval \
+            and node_type not in ["link", "example", "meaning", "fact",
+                                  REFERENCE_TYPE] \
+            and not name.startswith("http") \
+            and len(name) < 20
+
     def choose_next_node(self, connections):
-        # pick a random next node
-        nodes = [n for n in self.db.get_concepts()
-                 if n and n.name and n.name not in self.crawl_list
-                 and not n.type in ["link", "example", "meaning", "fact"]
-                 and not n.name.startswith("http")
-                 and len(n.name) < 20]
-        if not len(nodes):
-            return None
-        next_node = random.choice(nodes)
-        print("** next", next_node.name)
+        if self.current_node is not None and \
+                getattr(self.current_node, "id", None) is not None:
+            self.schedule_neighbours(self.current_node)
+        next_node = self._choose_from_scheduler()
+        if next_node is None and self.snapshot is not None:
+            next_node = self._choose_from_snapshot()
+        if next_node is None and self._schedule_stale():
+            next_node = self._choose_from_scheduler()
+        if next_node is not None:
+            print("** next", next_node.name)
         return next_node
 
+    def schedule_neighbours(self, node):
+        """
+        queue the concepts linked to a crawled node, one level further
+        from the seed than node
+        """
+        self.scheduler.discard(node.name)
+        if self.sharded:
+            # incoming connections live in other shards, ids do not
+            # match across shards
+            rows = self.db.search_connection_rows_by_names([node.name])
+        else:
+            rows = self.db.search_connection_rows(node.id)
+        for row in rows:
+            if self.sharded:
+                outgoing = row.source_name == node.name
+            else:
+                outgoing = row.source_id == node.id
+            name = row.target_name if outgoing else row.source_name
+            if self.is_crawlable(name, None):
+                self.scheduler.push(name, node.name, row.strength or 0)
+
+    def _choose_from_scheduler(self):
+        # every name is popped once, only candidates hit sqlite
+        name = self.scheduler.pop()
+        while name is not None:
+            if self.is_crawlable(name, None):
+                next_node = self.db.first_concept_by_name(name)
+                if next_node and self.is_crawlable(
+                        next_node.name, next_node.type, next_node.last_seen):
+                    return next_node
+            name = self.scheduler.pop()
+        return None
+
+    def _schedule_stale(self, batch=100):
+        # the neighbourhood is exhausted, continue with the concepts not
+        # crawled for the longest time
+        before = time.time() - self.refresh_interval
+        dbs = self.db.shards if self.sharded else [self.db]
+        for n, db in enumerate(dbs):
+            while True:
+                concepts = db.stale_concepts(before, batch,
+                                             self._stale_cursors.get(n))
+                if not concepts:
+                    break
+                last = concepts[-1]
+                self._stale_cursors[n] = (last.last_seen, last.id)
+                queued = False
+                for concept in concepts:
+                    if self.is_crawlable(concept.name, concept.type,
+                                         concept.last_seen):
+                        queued = self.scheduler.push(
+                            concept.name, last_seen=concept.last_seen) or \
+                            queued
+                if queued:
+                    return True
+        return False
+
+    def _choose_from_snapshot(self, tries=50):
+        if time.time() - self._snapshot_loaded > self.snapshot_refresh:
+            # rebuilt only when the graph changed, new concepts show up
+            self.snapshot = self.db.load_snapshot()
+            self._snapshot_loaded = time.time()
+        # random positions in the mapped arrays, only candidates hit sqlite
+        total = self.snapshot.total_concepts()
+        for _ in range(min(tries, total)):
+            idx = random.randrange(total)
+            name = self.snapshot.concept_name(idx)
+            if not self.is_crawlable(name, self.snapshot.concept_type(idx)):
+                continue
+            next_node = self.db.first_concept_by_name(name)
+            if next_node and self.is_crawlable(next_node.name, next_node.type,
+                                               next_node.last_seen):
+                return next_node
+        return None
+
     def execute_action(self, connections):
         # execute an action in current node with selected connections
         print("current", self.current_node.name)
@@ -1,4 +1,5 @@
 from lilacs.processing.crawlers import BaseCrawler
+from lilacs.processing.crawlers.pool import CrawlerPool
 from lilacs.memory.data_sources.conceptnet import \
     extract_conceptnet_connections
 from lilacs.memory.data_sources.wordnet import extract_wordnet_connections
@@ -9,37 +10,34 @@ class ConnectionFinderCrawler(BaseCrawler):
     def execute_action(self, connections):
         print("** current", self.current_node.name)
         # execute an action in current node
-        new_cons = []
+        name = self.current_node.name
+        cons = []
         # extract new connections from conceptnet
-        cons = extract_conceptnet_connections(self.current_node.name)
-        for con_type, target, strength in cons:
-            if not self.con_exists(con_type, self.current_node.name, target):
-                c = self.db.add_connection(self.current_node.name, target, con_type, strength=strength)
-                if c is not None:
-                    new_cons.append(c)
+        for con_type, target, strength in extract_conceptnet_connections(name):
+            cons.append((name, con_type, target, strength))
 
         # extract new connections from wordnet
-        cons = extract_wordnet_connections(self.current_node.name)
-        for con_type, target, strength in cons:
-            if not self.con_exists(con_type, self.current_node.name, target):
-                c = self.db.add_connection(self.current_node.name, target, con_type, strength=strength)
-                if c is not None:
-                    new_cons.append(c)
+        for con_type, target, strength in extract_wordnet_connections(name):
+            cons.append((name, con_type, target, strength))
 
         # extract new connections from dictionary
-        cons = extract_dictionary_connections(self.current_node.name)
-        for con_type, target, strength in cons:
-            if not self.con_exists(con_type, self.current_node.name, target):
-                c = self.db.add_connection(self.current_node.name, target, con_type, strength=strength)
-                if c is not None:
-                    new_cons.append(c)
+        for con_type, target, strength in extract_dictionary_connections(name):
+            cons.append((name, con_type, target, strength))
             if con_type in ["synonym", "antonym"]:
-                if not self.con_exists(con_type, target, self.current_node.name):
-                    c = self.db.add_connection(target, self.current_node.name, con_type, strength=strength)
-                    if c is not None:
-                        new_cons.append(c)
+                cons.append((target, con_type, name, strength))
 
-        return new_cons
+        # existing connections are skipped by the bulk insert
+        return self.db.add_connections_bulk(cons)
+
+
+class ConnectionFinderPool(CrawlerPool):
+    # same sources as ConnectionFinderCrawler, crawled by many workers
+    sources = {"conceptnet": extract_conceptnet_connections,
+               "wordnet": extract_wordnet_connections,
+               "dictionary": extract_dictionary_connections}
+    # wordnet is local
+    limits = {"conceptnet": 4, "wordnet": 8, "dictionary": 2}
+    symmetric_types = ["synonym", "antonym"]
 
 
 if __name__ == "__main__":
@@ -47,3 +45,8 @@ if __name__ == "__main__":
     c.start_crawling("person")
     print(c.crawl_list)
     print(c.total_steps)
+
+    pool = ConnectionFinderPool(workers=8)
+    pool.start_crawling("person", threaded=False)
+    pool.close()
+    print(pool.total_steps)
@@ -17,16 +17,18 @@ class DBpediaBaseCrawler(BaseCrawler):
     def choose_next_node(self, connections):
         # pick the next node, ignore htp links
         try:
-            cons = [c for c in self.current_node.in_connections if c.type == "label"]
-            nodes = [c.source for c in cons if c.source.name != self.current_node.name and c.source.name not in self.crawl_list and not c.source.name.startswith("http")]
+            # names come with the rows, only the chosen node is loaded, by
+            # name so sharded stores work too
+            cons = self.db.search_connection_rows_by_names([self.current_node.name], "in", ["label"])
+            nodes = [c.source_name for c in cons if c.source_name and c.source_name != self.current_node.name and c.source_name not in self._crawled and not c.source_name.startswith("http")]
             if not len(nodes):
                 # go back to previous node
                 print("** no next node, going back to start")
-                possible_nodes = [con.target for con in self.start_node.in_connections if con.target.name not in self.crawl_list and not con.target.name.startswith("http")]
+                possible_nodes = [con.target_name for con in self.db.search_connection_rows_by_names([self.start_node.name], "in") if con.target_name and con.target_name not in self._crawled and not con.target_name.startswith("http")]
                 if len(possible_nodes):
-                    return random.choice(possible_nodes)
+                    return self.db.first_concept_by_name(random.choice(possible_nodes))
                 return None
-            next_node = random.choice(nodes)
+            next_node = self.db.first_concept_by_name(random.choice(nodes))
             print("** next", next_node.name)
             return next_node
         except Exception as e:
@@ -36,22 +38,18 @@ class DBpediaBaseCrawler(BaseCrawler):
     def execute_action(self, connections):
         print("** current", self.current_node.name)
         # execute an action in current node
+        name = self.current_node.name
         new_cons = []
-        instance_of = self.dbpedia.get_dbpedia_labels_for_dblink(self.current_node.name)
+        instance_of = self.dbpedia.get_dbpedia_labels_for_dblink(name)
         for con in instance_of:
-            if not self.con_exists("label", self.current_node.name, con):
-                new_node = self.db.add_concept(con)
-                if new_node is None:
-                    new_node = self.db.first_concept_by_name(con)
-                c = self.db.add_connection_by_id(self.current_node.id, new_node.name, "label")
-                new_cons.append(c)
+            new_cons.append((name, "label", con, 50))
 
-        cons = self.dbpedia.get_dbpedia_cons_for_dblink(self.current_node.name)
+        cons = self.dbpedia.get_dbpedia_cons_for_dblink(name)
         for c, t in cons:
-            c = self.db.add_connection_by_id(self.current_node.id, t, c)
-            new_cons.append(c)
-        print("** new cons", [(c.type, c.target[0].name) for c in new_cons])
-        return [c for c in new_cons if c is not None]
+            new_cons.append((name, c, t, 50))
+        new_cons = self.db.add_connections_bulk(new_cons)
+        print("** new cons", [(c.type, c.target.name) for c in new_cons])
+        return new_cons
 
     def default_node(self, start_node=None):
         if isinstance(start_node, str):
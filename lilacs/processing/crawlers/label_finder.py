@@ -5,20 +5,17 @@ class LabelCrawler(DBpediaBaseCrawler):
     def execute_action(self, connections):
         print("** current", self.current_node.name)
         # execute an action in current node
+        name = self.current_node.name
         new_cons = []
-        instance_of = self.dbpedia.get_dbpedia_labels_for_dblink(self.current_node.name)
+        instance_of = self.dbpedia.get_dbpedia_labels_for_dblink(name)
         for con in instance_of:
-            c = self.db.add_connection(self.current_node.name, con, "label")
-            if c is not None:
-                new_cons.append(c)
+            new_cons.append((name, "label", con, 50))
 
-        cons = self.dbpedia.get_dbpedia_cons_for_dblink(self.current_node.name)
+        cons = self.dbpedia.get_dbpedia_cons_for_dblink(name)
         for c, t in cons:
-            c = self.db.add_connection(self.current_node.name, t, c)
-            if c is not None:
-                new_cons.append(c)
+            new_cons.append((name, c, t, 50))
 
-        return new_cons
+        return self.db.add_connections_bulk(new_cons)
 
 
 if __name__ == "__main__":
@@ -9,76 +9,89 @@ class MaintenanceCrawler(BaseCrawler):
     # remove elon musk -> drug
     removes = {"person": "drug"}
 
-    def fix_types(self):
+    @property
+    def _home(self):
+        # the node and its connection ids belong to its shard in a sharded
+        # store, to the database itself otherwise
+        return self.home(self.current_node.name)
+
+    def _connection_rows(self):
+        # every connection of the node with both names, one query
+        return self._home.search_connection_rows(self.current_node.id)
+
+    def fix_types(self, rows=None):
         if self.current_node.name.startswith("http") and not self.current_node.type == "link":
             print("fixing type", self.current_node.name, self.current_node.type, "-> link")
             self.current_node.type = "link"
-            self.db.commit()
+            self._home.commit()
         else:
+            if rows is None:
+                rows = self._connection_rows()
+            labels = set(r.target_name for r in rows
+                         if r.source_id == self.current_node.id and r.type == "label")
             ents = [("person", "person"),
                     ("agent","entity"),
                     ("thing", "thing")]
             for (l, t) in ents:
-                for con in self.current_node.out_connections:
-                    if con.type == "label":
-                        if con.target.name == l and not self.current_node.type == t:
+                if l in labels and not self.current_node.type == t:
+                    print("fixing type", self.current_node.name, self.current_node.type, "->", t)
+                    self.current_node.type = t
+                    self._home.commit()
+                    return
 
-                            print("fixing type", self.current_node.name, self.current_node.type, "->", t)
-                            self.current_node.type = t
-                            self.db.commit()
-                            return
+    def _remove(self, rows, removed):
+        # delete in one go and return the rows still in the database
+        if removed:
+            self._home.delete_connections(removed)
+        return [r for r in rows if r.id not in removed]
 
-    def fix_empty_cons(self):
+    def fix_empty_cons(self, rows=None):
         # remove empty cons
-        for c in self.current_node.out_connections:
-            if c.target is None or c.source is None:
-                print("removing malformed out connection", c)
-                self.current_node.out_connections.remove(c)
-                self.db.commit()
-        for c in self.current_node.in_connections:
-            if c.target is None or c.source is None:
-                print("removing malformed in connection", c)
-                self.current_node.in_connections.remove(c)
-                self.db.commit()
-
-    def fix_references_to_self(self):
+        if rows is None:
+            rows = self._connection_rows()
+        removed = set()
+        for c in rows:
+            if c.target_name is None or c.source_name is None:
+                print("removing malformed connection", c)
+                removed.add(c.id)
+        return self._remove(rows, removed)
+
+    def fix_references_to_self(self, rows=None):
         # references to self person -> person
+        if rows is None:
+            rows = self._connection_rows()
         types = ["label", "instance of"]
-        for t in types:
-            if self.con_exists(t, self.current_node.name, self.current_node.name):
-                cons = self.current_node.out_connections
-                for c in cons:
-                    if c.target.name == self.current_node.name and c.type == t:
-                        print("removing reference to self ", self.current_node.name)
-                        c.target.out_connections.remove(c)
-                        self.current_node.in_connections.remove(c)
-                        self.db.commit()
-
-    def fix_incompatible_labels(self):
+        removed = set()
+        for c in rows:
+            if c.source_id == self.current_node.id and \
+                    c.target_name == self.current_node.name and c.type in types:
+                print("removing reference to self ", self.current_node.name)
+                removed.add(c.id)
+        return self._remove(rows, removed)
+
+    def fix_incompatible_labels(self, rows=None):
+        if rows is None:
+            rows = self._connection_rows()
+        labels = dict((r.target_name, r.id) for r in rows
+                      if r.source_id == self.current_node.id and r.type == "label")
+        removed = set()
         # remove forbidden labels
         for key in self.removes:
             # person -> drug (cant be true)
             if self.current_node.name.lower() == key.lower():
-                if self.con_exists("label", self.current_node.name, self.removes[key]):
-                    cons = self.current_node.up_relationships
-                    for c in cons:
-                        if c.target.name == self.removes[key] and c.type == "label":
-                            print("** removing forbidden label", self.current_node.name, self.removes[key])
-                            self.current_node.out_connections.remove(c)
-                            self.db.commit()
+                if self.removes[key] in labels:
+                    print("** removing forbidden label", self.current_node.name, self.removes[key])
+                    removed.add(labels[self.removes[key]])
 
         # remove incompatible labels
         for key in self.removes:
 
             # elon musk -> person, elon musk -> drug
             # remove elon musk -> drug
-            if self.con_exists("label", self.current_node.name, key) and self.con_exists("label", self.current_node.name, self.removes[key]):
-                cons = self.current_node.out_connections
-                for c in cons:
-                    if c.target.name == self.removes[key] and c.type == "label":
-                        print("** removing incompatible ", self.current_node.name, self.removes[key])
-                        self.current_node.out_connections.remove(c)
-                        self.db.commit()
+            if key in labels and self.removes[key] in labels:
+                print("** removing incompatible ", self.current_node.name, self.removes[key])
+                removed.add(labels[self.removes[key]])
+        return self._remove(rows, removed)
 
     def expand_synonyms(self):
         # synonyms and antonyms should be bidirectional
@@ -86,11 +99,12 @@ class MaintenanceCrawler(BaseCrawler):
 
     def execute_action(self, connections):
         print("** current", self.current_node.name)
-        # execute an action in current node
-        self.fix_types()
-        self.fix_empty_cons()
-        self.fix_references_to_self()
-        self.fix_incompatible_labels()
+        # execute an action in current node, all fixes share one query
+        rows = self._connection_rows()
+        self.fix_types(rows)
+        rows = self.fix_empty_cons(rows)
+        rows = self.fix_references_to_self(rows)
+        self.fix_incompatible_labels(rows)
         self.expand_synonyms()
         return []
 
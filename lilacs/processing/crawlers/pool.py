@@ -0,0 +1,242 @@
+from collections import deque
+from threading import Thread, Condition, Lock, BoundedSemaphore
+import time
+
+from lilacs.memory.nodes.long_term import LongTermMemory
+from lilacs.memory.nodes.journal import LoggedWriter
+from lilacs.memory.nodes.names import normalize_name
+from lilacs.processing.crawlers.scheduler import CrawlScheduler
+from lilacs.settings import CRAWL_REFRESH_INTERVAL
+
+
+class Frontier(object):
+    """
+    deduplicated queue of concept names shared by the workers of a pool
+
+    a name is only ever queued once, in FIFO order or, given a
+    CrawlScheduler, highest priority first. get blocks while the queue is
+    empty but workers are still crawling, they may find more names, and
+    returns None once the crawl is exhausted or closed
+    """
+
+    def __init__(self, scheduler=None):
+        self.scheduler = scheduler
+        self._queue = deque()
+        self._seen = set()
+        self._cond = Condition()
+        self.in_flight = 0
+        self.closed = False
+
+    def __len__(self):
+        if self.scheduler is not None:
+            return len(self.scheduler)
+        return len(self._queue)
+
+    def put(self, name, parent=None, strength=50):
+        """
+        :param parent: name linking to name, raises its priority when
+                       queued already
+        :param strength: strength of that link
+        :return: True if name was queued, False if it was seen before
+        """
+        with self._cond:
+            if self.closed:
+                return False
+            if self.scheduler is not None:
+                queued = self.scheduler.push(name, parent, strength)
+            else:
+                key = normalize_name(name)
+                queued = key not in self._seen
+                if queued:
+                    self._seen.add(key)
+                    self._queue.append(name)
+            if queued:
+                self._cond.notify()
+            return queued
+
+    def get(self):
+        with self._cond:
+            while not len(self):
+                if self.closed or not self.in_flight:
+                    return None
+                self._cond.wait()
+            self.in_flight += 1
+            if self.scheduler is not None:
+                return self.scheduler.pop()
+            return self._queue.popleft()
+
+    def task_done(self):
+        with self._cond:
+            self.in_flight -= 1
+            if not self.in_flight and not self._queue:
+                # wake up the idle workers so they can exit
+                self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._queue.clear()
+            if self.scheduler is not None:
+                self.scheduler.clear()
+            self._cond.notify_all()
+
+
+class CrawlerPool(object):
+    """
+    crawl with many workers at once instead of one node at a time
+
+    workers take names from a shared Frontier, nodes close to the start
+    nodes and linked from many crawled nodes first, and query every source
+    for them, at most limits[source] requests run against one source at a
+    time. New connections go to a single LoggedWriter, which applies them
+    in batches, and their targets are added to the frontier
+    """
+    # source name -> callable mapping a concept name to an iterable of
+    # (connection type, target name, strength)
+    sources = {}
+    # most concurrent requests per source
+    limits = {}
+    default_limit = 4
+    # also added as target -> source
+    symmetric_types = []
+    # targets of these connections are not crawled
+    skip_types = ["link", "example", "meaning", "fact"]
+
+    def __init__(self, db=None, workers=8, max_crawl=200, sources=None,
+                 limits=None, refresh_interval=CRAWL_REFRESH_INTERVAL,
+                 writer=None, debug=False, max_failures=1000):
+        self.db = db or LongTermMemory(debug=debug)
+        self._own_writer = writer is None
+        self.writer = writer or LoggedWriter(self.db)
+        if sources is not None:
+            self.sources = sources
+        limits = dict(self.limits, **(limits or {}))
+        self._limits = dict((source, BoundedSemaphore(
+            limits.get(source, self.default_limit)))
+            for source in self.sources)
+        self.workers = workers
+        self.max_crawl = max_crawl
+        # nodes crawled in a previous run within this window are skipped
+        self.refresh_interval = refresh_interval
+        self.frontier = Frontier(CrawlScheduler(refresh_interval))
+        self.crawl_list = []
+        self.total_steps = 0
+        self.errors = dict((source, 0) for source in self.sources)
+        # most recent (name, source, exception), source is None when the
+        # crawl of name failed outside of a source
+        self.failures = deque(maxlen=max_failures)
+        self.threads = []
+        self._lock = Lock()
+
+    @property
+    def crawling(self):
+        return any(t.is_alive() for t in self.threads)
+
+    def start_crawling(self, start_nodes, threaded=True):
+        """
+        :param start_nodes: concept name or list of names to start from
+        :param threaded: return at once instead of waiting for the crawl
+        """
+        if isinstance(start_nodes, str):
+            start_nodes = [start_nodes]
+        for name in start_nodes:
+            self.frontier.put(name)
+        self.threads = [Thread(target=self._work)
+                        for _ in range(self.workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+        if not threaded:
+            self.join()
+
+    def stop_crawling(self):
+        # nodes being crawled are finished, nothing new is started
+        self.frontier.close()
+
+    def join(self, timeout=None):
+        """
+        wait for the workers and for their connections to be written
+
+        :return: True if the crawl ended
+        """
+        for thread in self.threads:
+            thread.join(timeout)
+        if self.crawling:
+            return False
+        self.writer.sync()
+        return True
+
+    def close(self):
+        self.stop_crawling()
+        self.join()
+        if self._own_writer:
+            self.writer.close()
+
+    def _work(self):
+        try:
+            while True:
+                name = self.frontier.get()
+                if name is None:
+                    break
+                try:
+                    self._crawl(name)
+                except Exception as e:
+                    print("** error", name, e)
+                    with self._lock:
+                        self.failures.append((name, None, e))
+                finally:
+                    self.frontier.task_done()
+        finally:
+            # release the session of this worker thread
+            self.db.close()
+
+    def _crawl(self, name):
+        if not self.is_due(name):
+            return
+        with self._lock:
+            if self.max_crawl > 0 and self.total_steps >= self.max_crawl:
+                self.frontier.close()
+                return
+            self.total_steps += 1
+            self.crawl_list.append(name)
+        print("** current", name)
+        cons = self.crawl_node(name)
+        if cons:
+            self.writer.add_connections_bulk(cons)
+        self.writer.mark_seen(name)
+        for source, con_type, target, strength in cons:
+            if source == name and con_type not in self.skip_types and \
+                    self.is_crawlable(target):
+                self.frontier.put(target, name, strength)
+
+    def is_due(self, name):
+        concept = self.db.first_concept_by_name(name)
+        return concept is None or (concept.last_seen or 0) < \
+            time.time() - self.refresh_interval
+
+    def is_crawlable(self, name):
+        return bool(name) and not name.startswith("http") and len(name) < 20
+
+    def crawl_node(self, name):
+        """
+        query every source for name
+
+        :return: list of (source_name, type, target_name, strength)
+        """
+        cons = []
+        for source, extract in self.sources.items():
+            with self._limits[source]:
+                try:
+                    found = list(extract(name))
+                except Exception as e:
+                    # one failing source does not lose the others
+                    print("** error", source, e)
+                    with self._lock:
+                        self.errors[source] += 1
+                        self.failures.append((name, source, e))
+                    continue
+            for con_type, target, strength in found:
+                cons.append((name, con_type, target, strength))
+                if con_type in self.symmetric_types:
+                    cons.append((target, con_type, name, strength))
+        return cons
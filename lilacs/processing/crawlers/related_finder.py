@@ -8,12 +8,10 @@ class RelatedCrawler(BaseCrawler):
         # execute an action in current node
         new_cons = []
         cons = {}#get_similar(self.current_node.name)
-        for con in cons.get("results"):
-            c = self.db.add_connection(self.current_node.name, con["text"], strength=con["score"]*100)
-            if c is not None:
-                new_cons.append(c)
+        for con in cons.get("results", []):
+            new_cons.append((self.current_node.name, "related", con["text"], con["score"]*100))
 
-        return new_cons
+        return self.db.add_connections_bulk(new_cons)
 
 
 if __name__ == "__main__":
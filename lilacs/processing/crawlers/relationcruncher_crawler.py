@@ -19,7 +19,7 @@ class RelationCruncher(DummyCrawler):
         label = node_data["label"]
         if label.lower() != self.current_node.name.lower():
             #print("dbpedia label does not match node name, synonym proposal")
-            print("** triple:", (self.current_node.name, "same as", label))
+            self.propose_alias(self.current_node.name, label)
         description = node_data["description"]
         description = self.analyzer.coreference_resolution(description)
         triples = self.analyzer.possible_relations(description.split("."))
@@ -49,7 +49,7 @@ class RelationshipCruncher(DummyCrawler):
         label = node_data["label"]
         if label.lower() != self.current_node.name.lower():
             #print("dbpedia label does not match node name, synonym proposal")
-            print("** triple:", (self.current_node.name, "same as", label))
+            self.propose_alias(self.current_node.name, label)
         description = node_data["description"]
         description = self.analyzer.normalize(description)
         triples = self.analyzer.interesting_triples(description)
@@ -0,0 +1,142 @@
+import heapq
+import itertools
+import math
+import time
+
+from lilacs.memory.nodes.names import normalize_name
+from lilacs.settings import CRAWL_REFRESH_INTERVAL
+
+
+class CrawlScheduler(object):
+    """
+    priority queue of concept names to crawl next
+
+    names are pushed when a crawled node links to them and popped highest
+    priority first. Priority grows with the number of crawled nodes linking
+    to a name (degree), the strongest of those links and the time since the
+    name was last crawled, and falls with the distance from the seed nodes.
+    Pushing again updates the priority, the old heap entry is skipped when
+    it comes up, so push and pop are O(log V). Every name is popped at most
+    once. Not thread safe, see pool.Frontier
+    """
+    degree_weight = 1.0
+    strength_weight = 1.0
+    staleness_weight = 1.0
+    distance_weight = 1.0
+
+    def __init__(self, refresh_interval=CRAWL_REFRESH_INTERVAL,
+                 max_depth=None):
+        """
+        :param refresh_interval: seconds after which a crawled name counts
+                                 as completely stale
+        :param max_depth: names further from the seeds are not queued
+        """
+        self.refresh_interval = refresh_interval
+        self.max_depth = max_depth
+        # normalized name -> [name, depth, degree, strength, last_seen,
+        #                     heap entry, popped]
+        self._nodes = {}
+        # the nodes not popped yet, to rebuild the heap from
+        self._queued = {}
+        self._heap = []
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._queued)
+
+    def __contains__(self, name):
+        node = self._nodes.get(normalize_name(name))
+        return node is not None and not node[6]
+
+    def depth(self, name):
+        """
+        :return: hops from the closest seed, None for unknown names
+        """
+        node = self._nodes.get(normalize_name(name))
+        return None if node is None else node[1]
+
+    def priority(self, depth, degree, strength, last_seen=None, now=None):
+        if last_seen:
+            now = now or time.time()
+            staleness = min(1.0, max(0.0, now - last_seen) /
+                            float(self.refresh_interval))
+        else:
+            staleness = 1.0
+        return self.degree_weight * math.log1p(degree) + \
+            self.strength_weight * strength / 100.0 + \
+            self.staleness_weight * staleness - \
+            self.distance_weight * depth
+
+    def push(self, name, parent=None, strength=50, last_seen=None):
+        """
+        queue name, or raise its priority if it is queued already
+
+        :param parent: crawled name linking to name, None for a seed
+        :param strength: strength of the link from parent
+        :param last_seen: timestamp name was last crawled, if known
+        :return: True if name was not known before
+        """
+        key = normalize_name(name)
+        node = self._nodes.get(key)
+        if node is not None and node[6]:
+            return False
+        depth = 0
+        if parent is not None:
+            parent_depth = self.depth(parent)
+            depth = 1 if parent_depth is None else parent_depth + 1
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        new = node is None
+        if new:
+            node = [name, depth, 0, strength, last_seen, None, False]
+            self._nodes[key] = node
+            self._queued[key] = node
+        else:
+            node[1] = min(node[1], depth)
+            node[3] = max(node[3], strength)
+            if last_seen is not None:
+                node[4] = last_seen
+        if parent is not None:
+            node[2] += 1
+        entry = (-self.priority(node[1], node[2], node[3], node[4]),
+                 next(self._counter), key)
+        node[5] = entry
+        heapq.heappush(self._heap, entry)
+        # drop the entries replaced by updates once they dominate the heap
+        if len(self._heap) > 2 * len(self._queued) + 64:
+            self._heap = [n[5] for n in self._queued.values()]
+            heapq.heapify(self._heap)
+        return new
+
+    def pop(self):
+        """
+        :return: name with the highest priority, None if nothing is queued
+        """
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            node = self._nodes[entry[2]]
+            if node[6] or node[5] is not entry:
+                continue
+            node[6] = True
+            del self._queued[entry[2]]
+            return node[0]
+        return None
+
+    def discard(self, name, depth=0):
+        """
+        never queue name again, for nodes crawled without being popped
+
+        :param depth: distance from the seeds if name is not known yet
+        """
+        key = normalize_name(name)
+        node = self._nodes.get(key)
+        if node is None:
+            self._nodes[key] = [name, depth, 0, 0, None, None, True]
+        elif not node[6]:
+            node[6] = True
+            del self._queued[key]
+
+    def clear(self):
+        self._nodes = {}
+        self._queued = {}
+        self._heap = []
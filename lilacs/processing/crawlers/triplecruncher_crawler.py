@@ -19,7 +19,7 @@ class TripleCruncher(DummyCrawler):
         label = node_data["label"]
         if label.lower() != self.current_node.name.lower():
             #print("dbpedia label does not match node name, synonym proposal")
-            print("** triple:", (self.current_node.name, "same as", label))
+            self.propose_alias(self.current_node.name, label)
         description = node_data["description"]
         description = self.analyzer.coreference_resolution(description)
         triples = self.analyzer.interesting_triples(description)
@@ -2,6 +2,7 @@ from builtins import str
 from lilacs.processing.nlp.inflect import singularize as make_singular
 from lilacs.util import NUM_STRING_EN
 from lilacs.processing.comprehension import replace_coreferences
+from lilacs.processing.comprehension.extraction import spotlight_annotate
 from spacy.parts_of_speech import NOUN, VERB
 import requests
 from padaos import IntentContainer
@@ -260,7 +261,7 @@ class LILACSQuestionParser(BasicQuestionParser):
         synonims = {}
         urls = {}
         try:
-            annotations = spotlight.annotate(LILACSQuestionParser.HOST, text)
+            annotations = spotlight_annotate(text, LILACSQuestionParser.HOST)
             for annotation in annotations:
 
                 score = annotation["similarityScore"]
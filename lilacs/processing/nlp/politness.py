@@ -3,14 +3,15 @@
 # https://github.com/collab-uniba/Emotion_and_Polarity_SO/tree/master/python/CalculatePoliteAndImpolite
 
 
-import requests
+from lilacs.memory.cache import cached_json
 
 
 def get_politness(text):
     # http://www.cs.cornell.edu/~cristian//Politeness.html
     data = {"text": text}
-    r = requests.post("http://politeness.cornell.edu/score-politeness", data=data)
-    return r.json()
+    return cached_json("politeness", "post",
+                       "http://politeness.cornell.edu/score-politeness",
+                       data=data)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,4 @@
-import requests
+from lilacs.memory.cache import cached_json, cached_text
 from functools import lru_cache
 import math
 from typing import Iterable, List
@@ -68,8 +68,8 @@ class WordTwoVec(object):
 
 def similar_sense2vec_demo(text, sense="auto"):
     data = {"word": text, "sense": sense}
-    r = requests.post("https://api.explosion.ai/sense2vec/find", data)
-    return r.json()
+    return cached_json("sense2vec", "post",
+                       "https://api.explosion.ai/sense2vec/find", data=data)
 
 
 def similar_sense2vec(text, nlp, num=5):
@@ -113,7 +113,6 @@ def similar_turkunlp_demo(text, n=10, model="Finnish+4B+wordforms+skipgram"):
         "Referer": "http://bionlp-www.utu.fi/wv_demo/",
         "Accept-Encoding": "gzip, deflate",
         "Accept-Language": "en-US,en;q=0.9"}
-    r = requests.post(url, data=data)
-    print(r.text)
+    print(cached_text("turkunlp", "post", url, data=data))
 
 
@@ -1,4 +1,4 @@
-import requests
+from lilacs.memory.cache import cached_json
 
 # useful packages
 # https://github.com/carpedm20/emoji
@@ -2143,7 +2143,8 @@ EMOJI_DATA = {':+1:': {'emoji': ' 👍 ', 'tags': ['approve', 'ok']},
 def get_emoji_scores(text):
     params = {"q": text}
     emojis = {}
-    scores = requests.get("https://deepmoji.mit.edu/api/", params=params).json()["scores"]
+    scores = cached_json("deepmoji", "get", "https://deepmoji.mit.edu/api/",
+                         params=params)["scores"]
     for idx, score in enumerate(scores):
         if score:
             emojis[idx] = score
@@ -2153,7 +2154,8 @@ def get_emoji_scores(text):
 def get_emojis(text):
     params = {"q": text}
     emojis = {}
-    scores = requests.get("https://deepmoji.mit.edu/api/", params=params).json()["scores"]
+    scores = cached_json("deepmoji", "get", "https://deepmoji.mit.edu/api/",
+                         params=params)["scores"]
     for idx, score in enumerate(scores):
         if score:
             emojis[idx] = score
@@ -2165,7 +2167,8 @@ def get_emojis(text):
 def get_emotions(text):
     params = {"q": text}
     emojis = {}
-    scores = requests.get("https://deepmoji.mit.edu/api/", params=params).json()["scores"]
+    scores = cached_json("deepmoji", "get", "https://deepmoji.mit.edu/api/",
+                         params=params)["scores"]
     for idx, score in enumerate(scores):
         if score:
             emojis[idx] = score
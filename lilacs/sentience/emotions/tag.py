@@ -1,4 +1,4 @@
-import requests
+from lilacs.memory.cache import cached_json
 
 
 # DO NOT abuse this, meant for dev purposes, you should use the official api not hijack the demo site
@@ -6,7 +6,9 @@ import requests
 def tag(text, lang="en-us"):
     try:
         data = {"lang_code": lang, "text": text, "api_type": "emotion"}
-        data = requests.post("https://www.paralleldots.com/api/demos", data).json()["emotion"]["probabilities"]
+        data = cached_json("paralleldots", "post",
+                           "https://www.paralleldots.com/api/demos",
+                           data=data)["emotion"]["probabilities"]
         result = {}
         for e in data:
             if e.lower() == "happy":
@@ -3,6 +3,32 @@ from os.path import dirname, join
 ROOT_DIR = dirname(__file__)
 MODELS_DIR = join(ROOT_DIR, "models")
 DATABASE_DIR = join(ROOT_DIR, "memory/database")
+# persistent knowledge graph shared by the reactor and the crawlers
+LONG_TERM_DATABASE = join(DATABASE_DIR, "long_term.db")
+# applied to every concept database connection
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",  # readers do not block the writer
+    "synchronous": "NORMAL",  # safe with WAL, fsync only on checkpoint
+    "cache_size": -64000,  # negative is KiB, 64MB page cache
+    "mmap_size": 268435456,  # 256MB
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000  # ms to wait on a crawler holding the write lock
+}
+# crawlers skip concepts crawled more recently than this, in seconds
+CRAWL_REFRESH_INTERVAL = 7 * 24 * 60 * 60
+# short term memory policy, see lilacs.memory.nodes.policy
+SHORT_TERM_WINDOW = 24 * 60 * 60  # concepts not seen for this long are archived
+SHORT_TERM_MAX_CONCEPTS = 100000
+SHORT_TERM_HALF_LIFE = 6 * 60 * 60  # connection strength halves every 6h
+SHORT_TERM_MIN_STRENGTH = 5  # weaker decayed connections are archived
+SHORT_TERM_POLICY_INTERVAL = 10 * 60  # seconds between policy runs
+# applied records are dropped from a mutation log grown past this many bytes
+MUTATION_LOG_COMPACT_SIZE = 64 * 1024 * 1024
+# answers of remote apis, see lilacs.memory.cache, None disables caching
+RESPONSE_CACHE = join(DATABASE_DIR, "responses.db")
+RESPONSE_CACHE_TTL = 30 * 24 * 60 * 60
+RESPONSE_CACHE_SIZE = 512 * 1024 * 1024  # bytes of compressed responses
+RESPONSE_CACHE_MEMORY = 2048  # recently used responses also kept in memory
 SPACY_MODEL = "en_core_web_sm" # "en_core_web_lg", "en_core_web_md" "xx_ent_wiki_sm"
 SENSE2VEC_MODEL = "reddit_vectors-1.1.0"
 
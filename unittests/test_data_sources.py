@@ -0,0 +1,103 @@
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from os.path import join
+from unittest import mock
+
+from lilacs.memory.data_sources import async_client
+from lilacs.memory.data_sources.async_client import AsyncSession, \
+    run_async, extract_all_connections_async, \
+    extract_conceptnet_connections_async
+from lilacs.memory.nodes.short_term import ConceptDatabase
+
+CONCEPTNET = {"edges": [
+    {"@id": "/a/[/r/IsA/,/c/en/dog/,/c/en/animal/]",
+     "rel": {"label": "IsA"}, "weight": 2.0,
+     "start": {"label": "dog", "language": "en"},
+     "end": {"label": "animal", "language": "en"},
+     "surfaceText": "[[a dog]] is [[an animal]]"}]}
+
+
+async def fake_get_json(self, url, params=None, headers=None, endpoint=None):
+    if "conceptnet" in url:
+        return CONCEPTNET
+    raise IOError("offline")
+
+
+async def fake_run_blocking(self, host, func, *args):
+    return []
+
+
+@mock.patch.object(AsyncSession, "get_json", fake_get_json)
+class TestAsyncSources(unittest.TestCase):
+    def test_conceptnet(self):
+        async def crawl():
+            async with AsyncSession() as session:
+                return await extract_conceptnet_connections_async(
+                    "dog", session)
+        cons = run_async(crawl())
+        self.assertIn("animal", [target for _, target, _ in cons])
+
+    @mock.patch.object(AsyncSession, "run_blocking", fake_run_blocking)
+    def test_all_sources(self):
+        found = run_async(extract_all_connections_async(
+            "dog", sources=["conceptnet", "wikidata"]))
+        self.assertEqual(found["wikidata"], [])
+        self.assertIn("animal", [t for _, t, _ in found["conceptnet"]])
+
+    @mock.patch.object(AsyncSession, "run_blocking", fake_run_blocking)
+    def test_populate_node(self):
+        from lilacs import LILACSReactor
+        tmp = tempfile.mkdtemp()
+        try:
+            db = ConceptDatabase(path=join(tmp, "concepts.db"))
+            reactor = LILACSReactor(db=db)
+            self.assertIn("animal", [c[1] for c in
+                                     reactor.populate_node("dog")])
+            db.close()
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_running_loop(self):
+        async def nested():
+            return run_async(asyncio.sleep(0))
+        self.assertRaises(RuntimeError, run_async, nested())
+
+
+class TestRunBlocking(unittest.TestCase):
+    def test_host_limit(self):
+        lock = threading.Lock()
+        running = []
+        most = []
+        calls = []
+
+        def slow(name):
+            with lock:
+                running.append(name)
+                most.append(len(running))
+            time.sleep(0.2)
+            with lock:
+                running.remove(name)
+                calls.append(name)
+            return name
+
+        async def crawl(session):
+            return await asyncio.gather(
+                *[session.run_blocking("slow.org", slow, n)
+                  for n in range(3)], return_exceptions=True)
+
+        session = AsyncSession(per_host=1, timeout=0.1)
+        results = run_async(crawl(session))
+        self.assertTrue(all(isinstance(r, asyncio.TimeoutError)
+                            for r in results))
+        time.sleep(0.3)
+        # the timed out thread kept its slot, the waiting calls never ran
+        self.assertEqual(max(most), 1)
+        self.assertEqual(len(calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
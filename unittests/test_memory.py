@@ -0,0 +1,1322 @@
+import io
+import json
+import unittest
+import shutil
+import threading
+import time
+import tempfile
+import os
+from os.path import join
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from lilacs.memory.nodes import Alias, Concept, Connection
+from lilacs.memory.nodes.short_term import ConceptDatabase
+from lilacs.memory.nodes.long_term import LongTermMemory
+from lilacs.memory.nodes.traversal import GraphTraversal
+from lilacs.memory.nodes.snapshot import GraphSnapshot
+from lilacs.memory.nodes.policy import MemoryPolicy, decayed_strength
+from lilacs.memory.nodes.journal import MutationLog, LogReader, \
+    LoggedWriter, apply_records, read_log
+from lilacs.memory.nodes.sharded import ShardedConceptDatabase, shard_of
+from lilacs.memory.nodes.exchange import export_graph, import_graph, \
+    iter_binary, iter_records, iter_turtle, parse_binary
+from lilacs.memory.nodes.vectors import VectorIndex
+from lilacs.processing.crawlers import BaseCrawler
+from lilacs.processing.crawlers.maintenance_crawler import MaintenanceCrawler
+from lilacs.processing.crawlers.pool import CrawlerPool, Frontier
+from lilacs.processing.crawlers.scheduler import CrawlScheduler
+from lilacs.memory.cache import ResponseCache, cached, get_cache, \
+    request_params, set_cache
+from lilacs.memory.nodes.migrations import upgrade, get_schema_version, \
+    MIGRATIONS, SCHEMA_VERSION
+
+
+class TestConceptIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = ConceptDatabase(indexed=True,
+                                  path=join(self.tmp, "concepts.db"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_write_through(self):
+        self.db.add_connection("dog", "mammal", "instance of")
+        dog = self.db.index.concept_id("dog")
+        mammal = self.db.index.concept_id("mammal")
+        self.assertEqual(self.db.total_concepts(), 2)
+        self.assertEqual(self.db.total_connections(), 1)
+        self.assertTrue(self.db.index.has_connection("instance of",
+                                                     dog, mammal))
+        self.assertEqual(len(self.db.search_connection_by_concept_pair(
+            "dog", "mammal")), 1)
+        self.assertEqual(self.db.search_connection_by_concept_pair(
+            "mammal", "dog"), [])
+        self.assertIsNone(self.db.first_concept_by_name("invalid"))
+
+    def test_reads(self):
+        self.db.add_connection("dog", "mammal", "instance of")
+        dog = self.db.index.concept_id("dog")
+        statements = []
+        event.listen(self.db.db, "before_cursor_execute",
+                     lambda *args: statements.append(args[2]))
+        # ids and existence come from the index alone
+        self.assertEqual(self.db.concept_id_by_name("Dog"), dog)
+        self.assertIsNone(self.db.concept_id_by_name("invalid"))
+        self.assertIsNone(self.db.add_concept("dog"))
+        self.assertEqual(statements, [])
+        # rows are loaded in one statement
+        self.assertEqual([c.id for c in self.db.search_concept_by_name("dog")],
+                         [dog])
+        self.assertEqual(len(self.db.search_connection_by_concept_pair(
+            "dog", "mammal")), 1)
+        self.assertEqual(len(statements), 2)
+
+    def test_connection_exists(self):
+        db = ConceptDatabase(path=join(self.tmp, "plain.db"))
+        for database in (self.db, db):
+            database.add_connection("dog", "mammal", "instance of")
+            self.assertTrue(database.connection_exists("instance of", "dog",
+                                                       "mammal"))
+            self.assertFalse(database.connection_exists("instance of",
+                                                        "mammal", "dog"))
+            self.assertFalse(database.connection_exists("related", "dog",
+                                                        "mammal"))
+            self.assertFalse(database.connection_exists("related", "invalid",
+                                                        "dog"))
+            # another type between the same pair is its own connection
+            self.assertIsNotNone(database.add_connection("dog", "mammal",
+                                                         "related"))
+            self.assertIsNone(database.add_connection("dog", "mammal",
+                                                      "related"))
+            dog = database.first_concept_by_name("dog").id
+            self.assertIsNotNone(database.add_connection_by_id(
+                dog, "mammal", "label"))
+            self.assertIsNone(database.add_connection_by_id(
+                dog, "mammal", "label"))
+            self.assertEqual(sorted(c.type for c in
+                                    database.search_connection_by_concept_pair(
+                                        "dog", "mammal")),
+                             ["instance of", "label", "related"])
+            con = database.search_connection_by_concept_pair("dog", "mammal")
+            database.delete_connections([con[0].id])
+            self.assertFalse(database.connection_exists("instance of", "dog",
+                                                        "mammal"))
+
+    def test_aliases(self):
+        db = ConceptDatabase(path=join(self.tmp, "plain.db"))
+        for database in (self.db, db):
+            database.add_connections_bulk([
+                ("Elon_Musk", "label", "person", 90),
+                ("elon musk", "label", "Person", 90),
+                ("musk", "label", "person", 90)], chunk_size=1)
+            self.assertEqual(database.total_concepts(), 3)
+            self.assertEqual(database.total_connections(), 2)
+            self.assertEqual(database.first_concept_by_name(" ELON MUSK").name,
+                             "Elon_Musk")
+            self.assertIsNone(database.add_concept("elon  musk"))
+            database.add_alias("Musk, Elon", "elon musk")
+            self.assertEqual(database.search_aliases("musk, elon"),
+                             ["elon musk", "musk, elon"])
+            # an alias naming another concept merges it
+            database.add_alias("musk", "elon musk")
+            self.assertEqual(database.total_concepts(), 2)
+            self.assertEqual(database.total_connections(), 1)
+            self.assertEqual(database.first_concept_by_name("musk").name,
+                             "Elon_Musk")
+            self.assertTrue(database.connection_exists("label", "MUSK",
+                                                       "person"))
+            # connections between the merged concepts are dropped, not
+            # turned into self loops
+            database.add_connections_bulk([("dog", "related", "canine", 50),
+                                           ("canine", "related", "dog", 50)])
+            self.assertTrue(database.add_alias("canine", "dog"))
+            self.assertEqual(database.total_connections(), 1)
+            self.assertEqual(database.search_connection_by_concept("dog"),
+                             [])
+
+    def test_delete_orphan(self):
+        self.db.add_connection("dog", "mammal", "instance of")
+        dog = self.db.first_concept_by_name("dog")
+        dog.out_connections.remove(dog.out_connections[0])
+        self.db.commit()
+        self.assertEqual(self.db.total_connections(), 0)
+        self.assertEqual(self.db.index.out_connections(dog.id), [])
+
+    def test_reload(self):
+        self.db.add_connection("dog", "mammal", "instance of")
+        self.db.index.load(self.db.session)
+        self.assertEqual(self.db.total_concepts(), 2)
+        self.assertEqual(self.db.total_connections(), 1)
+
+
+class TestBulkIngest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = ConceptDatabase(path=join(self.tmp, "concepts.db"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_bulk(self):
+        self.db.add_connection("dog", "mammal", "instance of")
+        cons = [("dog", "instance of", "mammal", 50),
+                ("dog", "related", "cat", None),
+                ("cat", "related", "dog", 30),
+                ("dog", "related", "cat", 40)]
+        cons += [("node", "related", "node %s" % i, 50) for i in range(50)]
+        new_cons = self.db.add_connections_bulk(cons, chunk_size=7)
+        self.assertEqual(len(new_cons), 52)
+        self.assertEqual(self.db.total_concepts(), 54)
+        self.assertEqual(self.db.total_connections(), 53)
+        self.assertEqual(new_cons[0].strength, 50)
+        self.assertEqual(self.db.add_connections_bulk(cons), [])
+
+    def test_concurrent_writer(self):
+        self.db.add_concepts_bulk(["dog", "cat", "fox", "den"])
+        other = ConceptDatabase(path=join(self.tmp, "concepts.db"))
+        lookup = self.db._connection_ids_by_keys
+
+        def interleaved(keys):
+            # another process commits while the chunk is being added
+            if not other.total_connections():
+                other.add_connection("fox", "den", "lives in")
+            return lookup(keys)
+
+        self.db._connection_ids_by_keys = interleaved
+        new_cons = self.db.add_connections_bulk(
+            [("dog", "related", "cat", 50)])
+        other.close()
+        self.assertEqual([(c.source.name, c.target.name) for c in new_cons],
+                         [("dog", "cat")])
+        self.assertEqual(self.db.total_connections(), 2)
+
+
+class TestSessions(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = ConceptDatabase(indexed=True,
+                                  path=join(self.tmp, "concepts.db"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_threads(self):
+        def work(n):
+            for i in range(10):
+                self.db.add_connection("thread %d" % n, "node %d" % i,
+                                       "related")
+            self.db.close()
+
+        threads = [threading.Thread(target=work, args=(n,))
+                   for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.db.total_connections(), 40)
+        self.assertEqual(self.db.total_concepts(), 14)
+        self.db.index.load(self.db.session)
+        self.assertEqual(self.db.total_connections(), 40)
+
+    def test_transaction(self):
+        with self.db.transaction():
+            self.db.add_connection("dog", "mammal", "instance of")
+            self.db.add_connection("cat", "mammal", "instance of")
+        self.assertEqual(self.db.total_connections(), 2)
+        with self.assertRaises(ValueError):
+            with self.db.transaction():
+                self.db.add_connection("bird", "animal", "instance of")
+                raise ValueError
+        self.assertEqual(self.db.total_connections(), 2)
+        self.assertIsNone(self.db.first_concept_by_name("bird"))
+
+    def test_transaction_duplicate(self):
+        self.db.add_concept("dog")
+        with self.assertRaises(IntegrityError):
+            with self.db.transaction():
+                self.db.add_connection("cat", "mammal", "instance of")
+                # a second writer already took the alias key
+                self.db.session.add(Concept(name="Dog",
+                                            aliases=[Alias(key="dog")]))
+                self.db.commit()
+                self.db.add_connection("bird", "animal", "instance of")
+        # none of the unit of work is kept
+        self.assertEqual(self.db.total_connections(), 0)
+        self.assertEqual(self.db.total_concepts(), 1)
+        # outside of a transaction the duplicate is only skipped
+        self.db.session.add(Concept(name="Dog", aliases=[Alias(key="dog")]))
+        self.assertFalse(self.db.commit())
+        self.assertTrue(self.db.add_connection("cat", "mammal", "instance of"))
+
+
+class TestLongTermMemory(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_reopen(self):
+        path = join(self.tmp, "long_term.db")
+        db = LongTermMemory(path=path)
+        db.add_connection("dog", "mammal", "instance of")
+        db.session.close()
+        db = LongTermMemory(path=path, indexed=True)
+        self.assertEqual(db.total_concepts(), 2)
+        self.assertEqual(db.total_connections(), 1)
+        # a second crawler sharing the store sees the same graph
+        other = LongTermMemory(path=path)
+        self.assertIsNotNone(other.first_concept_by_name("dog"))
+        mode = db.session.execute(text("PRAGMA journal_mode")).scalar()
+        self.assertEqual(mode, "wal")
+
+
+class TestMigrations(unittest.TestCase):
+    legacy_schema = [
+        "CREATE TABLE concepts (id INTEGER NOT NULL, description TEXT, "
+        "name TEXT, type VARCHAR, last_seen INTEGER, PRIMARY KEY (id))",
+        "CREATE TABLE connections (id INTEGER NOT NULL, last_seen INTEGER, "
+        "strength INTEGER, type VARCHAR, source_id INTEGER, "
+        "target_id INTEGER, PRIMARY KEY (id), "
+        "FOREIGN KEY(source_id) REFERENCES concepts (id), "
+        "FOREIGN KEY(target_id) REFERENCES concepts (id))",
+        "INSERT INTO concepts VALUES (1, '', 'dog', 'idea', 0)",
+        "INSERT INTO concepts VALUES (3, '', 'mammal', 'idea', 0)",
+        "INSERT INTO concepts VALUES (4, '', 'Dog', 'idea', 0)",
+        "INSERT INTO connections VALUES (1, 0, 50, 'instance of', 1, 3)",
+        "INSERT INTO connections VALUES (2, 0, 60, 'instance of', 1, 3)",
+        "INSERT INTO connections VALUES (3, 0, 60, 'instance of', 4, 3)",
+        "INSERT INTO connections VALUES (4, 0, 60, 'related', 3, 4)",
+        "INSERT INTO connections VALUES (5, 0, 60, 'related', 4, 1)"
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_upgrade_legacy(self):
+        engine = create_engine("sqlite:///" + join(self.tmp, "legacy.db"))
+        with engine.begin() as connection:
+            for statement in self.legacy_schema:
+                connection.execute(text(statement))
+        self.assertEqual(upgrade(engine), 0)
+        with engine.begin() as connection:
+            self.assertEqual(get_schema_version(connection), SCHEMA_VERSION)
+            indexes = [i["name"] for i in
+                       inspect(connection).get_indexes("concepts")]
+            self.assertIn("ix_concepts_name", indexes)
+            self.assertIn("ix_concepts_last_seen", indexes)
+            self.assertIn("ix_concepts_last_used", indexes)
+            # the migrated schema is the one of a fresh database
+            columns = [c["name"] for c in
+                       inspect(connection).get_columns("concepts")]
+            self.assertEqual(sorted(columns),
+                             sorted(Concept.__table__.c.keys()))
+            # duplicated connections and concepts only differing in case
+            # are collapsed into the oldest one, without self loops
+            rows = connection.execute(text(
+                "SELECT id, source_id, target_id FROM connections")).fetchall()
+            self.assertEqual([tuple(r) for r in rows], [(1, 1, 3), (4, 3, 1)])
+            rows = connection.execute(text(
+                "SELECT key, concept_id FROM aliases ORDER BY id")).fetchall()
+            self.assertEqual([tuple(r) for r in rows], [("dog", 1),
+                                                        ("mammal", 3)])
+            rows = connection.execute(text(
+                "SELECT rowid FROM alias_trigrams WHERE alias_trigrams "
+                "MATCH 'amma'")).fetchall()
+            self.assertEqual(len(rows), 1)
+            connection.execute(text("DELETE FROM concepts WHERE id = 3"))
+            connection.execute(text(
+                "INSERT INTO concepts (name) VALUES ('cat')"))
+            rows = connection.execute(text(
+                "SELECT id, name FROM concepts ORDER BY id")).fetchall()
+        # deleted ids are never handed out again
+        self.assertEqual([tuple(r) for r in rows], [(1, "dog"), (5, "cat")])
+        self.assertEqual(upgrade(engine), SCHEMA_VERSION)
+
+    def test_frozen_steps(self):
+        # a released step gives the schema of its version, not the one of
+        # the current model
+        engine = create_engine("sqlite:///" + join(self.tmp, "legacy.db"))
+        with engine.begin() as connection:
+            for statement in self.legacy_schema:
+                connection.execute(text(statement))
+            MIGRATIONS[0](connection)
+            columns = [c["name"] for c in
+                       inspect(connection).get_columns("concepts")]
+        self.assertEqual(columns, ["id", "description", "name", "type",
+                                   "last_seen"])
+
+
+class TestNeighbourhood(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dbs = [ConceptDatabase(path=join(self.tmp, "concepts.db")),
+                    ConceptDatabase(path=join(self.tmp, "indexed.db"),
+                                    indexed=True)]
+        cons = [("dog", "instance of", "mammal", 90),
+                ("dog", "related", "cat", 40),
+                ("cat", "related", "dog", 30),
+                ("mammal", "instance of", "animal", 80),
+                ("animal", "instance of", "living thing", 70)]
+        for db in self.dbs:
+            db.add_connections_bulk(cons)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_connections(self):
+        for db in self.dbs:
+            cons = db.search_connection_by_concept("dog")
+            self.assertEqual([c.strength for c in cons], [90, 40, 30])
+            cons = db.search_connection_by_concept("dog", direction="out",
+                                                   types=["related"])
+            self.assertEqual([c.target.name for c in cons], ["cat"])
+            cons = db.search_connection_by_concept("dog", min_strength=35,
+                                                   limit=1)
+            self.assertEqual([c.strength for c in cons], [90])
+            cons = list(db.iter_connection_by_concept("dog", direction="in"))
+            self.assertEqual([c.source.name for c in cons], ["cat"])
+            self.assertEqual(db.search_connection_by_concept("invalid"), [])
+
+    def test_connection_statements(self):
+        # the indexed database loads the connections of a node in one
+        # statement, not one per connection
+        db = self.dbs[1]
+        db.add_connections_bulk([("bird", "related", "bird %d" % i, i)
+                                 for i in range(50)])
+        statements = []
+        event.listen(db.db, "before_cursor_execute",
+                     lambda *args: statements.append(args[2]))
+        cons = db.search_connection_by_concept("bird")
+        self.assertEqual([c.strength for c in cons], list(range(49, -1, -1)))
+        self.assertEqual([c.target.name for c in cons][:2],
+                         ["bird 49", "bird 48"])
+        self.assertEqual(len(statements), 1)
+        cons = list(db.iter_connection_by_concept("bird", batch_size=20))
+        self.assertEqual(len(cons), 50)
+        self.assertEqual(len(statements), 4)
+
+    def test_rows(self):
+        # one statement per row query plus the load and the delete of
+        # delete_connections, the index answers the per concept queries and
+        # names never lazy load
+        for db, expected in zip(self.dbs, [6, 3]):
+            statements = []
+            dog = db.first_concept_by_name("dog").id
+            event.listen(db.db, "before_cursor_execute",
+                         lambda *args: statements.append(args[2]))
+            rows = db.search_connection_rows(dog)
+            self.assertEqual([(r.source_name, r.type, r.target_name)
+                              for r in rows],
+                             [("dog", "instance of", "mammal"),
+                              ("dog", "related", "cat"),
+                              ("cat", "related", "dog")])
+            rows = db.search_connection_rows(dog, "in")
+            self.assertEqual([r.source_name for r in rows], ["cat"])
+            rows = db.search_connection_rows_by_type("related")
+            self.assertEqual(len(rows), 2)
+            self.assertEqual(db.delete_connections([rows[0].id]), 1)
+            self.assertEqual(db.search_connection_rows(dog, types=["related"]),
+                             [rows[1]])
+            self.assertEqual(len(statements), expected)
+
+    def test_hops(self):
+        for db in self.dbs:
+            hops = db.search_neighbourhood("dog", hops=2,
+                                           types=["instance of"])
+            names = dict((db.get_concept_by_id(c).name, d)
+                         for c, d in hops.items())
+            self.assertEqual(names, {"dog": 0, "mammal": 1, "animal": 2})
+
+
+class TestTraversal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = ConceptDatabase(path=join(self.tmp, "concepts.db"))
+        self.db.add_connections_bulk([
+            ("dog", "instance of", "mammal", 90),
+            ("cat", "instance of", "mammal", 90),
+            ("mammal", "instance of", "animal", 80),
+            ("bird", "label", "animal", 80),
+            ("dog", "related", "bone", 20),
+            ("bone", "related", "bird", 20),
+            ("dog", "related", "cat", 10)])
+        self.graph = GraphTraversal(self.db)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_path(self):
+        self.assertEqual(self.graph.path("dog", "cat", direction="out"),
+                         [("dog", "related", "cat")])
+        self.assertEqual(len(self.graph.path("dog", "bird")), 2)
+        self.assertIsNone(self.graph.path("dog", "invalid"))
+        self.assertIsNone(self.graph.path("animal", "dog", direction="out"))
+
+    def test_weighted_path(self):
+        cost, path = self.graph.weighted_path("dog", "cat")
+        self.assertEqual(path, [("dog", "instance of", "mammal"),
+                                ("cat", "instance of", "mammal")])
+
+    def test_common(self):
+        common = self.graph.common_ancestors("dog", "cat")
+        self.assertEqual([c[0] for c in common], ["mammal", "animal"])
+        common = self.graph.common_ancestors("dog", "bird")
+        self.assertEqual(common, [("animal", 2, 1)])
+        self.assertEqual(self.graph.expand("dog", 1, types=["related"]),
+                         {"dog": 0, "bone": 1, "cat": 1})
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = ConceptDatabase(path=join(self.tmp, "concepts.db"))
+        self.db.add_connections_bulk([
+            ("dog", "instance of", "mammal", 90),
+            ("cat", "instance of", "mammal", 90),
+            ("mammal", "instance of", "animal", 300),
+            ("dog", "related", "cat", 10)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_save_load(self):
+        path = GraphSnapshot.from_database(self.db).save(
+            join(self.tmp, "graph.snapshot"))
+        for mmap_mode in (True, False):
+            snapshot = GraphSnapshot.load(path, mmap_mode=mmap_mode)
+            self.assertEqual(snapshot.total_concepts(), 4)
+            self.assertEqual(snapshot.total_connections(), 4)
+            self.assertIsNone(snapshot.concept_index("invalid"))
+            mammal = snapshot.concept_index("mammal")
+            self.assertEqual(snapshot.concept_name(mammal), "mammal")
+            targets, strengths, _ = snapshot.neighbours(mammal)
+            self.assertEqual(snapshot.concept_name(targets[0]), "animal")
+            # strengths are stored as uint8
+            self.assertEqual(strengths[0], 255)
+            self.assertEqual(snapshot.expand("dog", 2),
+                             GraphTraversal(self.db).expand("dog", 2))
+
+    def test_load_snapshot(self):
+        snapshot = self.db.load_snapshot()
+        self.assertEqual(snapshot.meta["version"], self.db.graph_version())
+        graph = GraphTraversal(snapshot=snapshot)
+        self.assertEqual(graph.path("dog", "cat", direction="out"),
+                         [("dog", "related", "cat")])
+        self.assertEqual(graph.common_ancestors("dog", "cat")[0][0], "mammal")
+        # concepts are given by database id with either adjacency
+        dog = self.db.first_concept_by_name("dog").id
+        self.assertEqual(graph.expand(dog), GraphTraversal(self.db).expand(dog))
+        # stale snapshots are rebuilt
+        self.db.add_connection("cat", "whiskers", "has")
+        snapshot = self.db.load_snapshot()
+        self.assertEqual(snapshot.total_connections(), 5)
+        # also after changes in place
+        version = self.db.graph_version()
+        self.db.first_concept_by_name("whiskers").type = "body part"
+        self.db.commit()
+        self.assertNotEqual(self.db.graph_version(), version)
+        version = self.db.graph_version()
+        self.db.update_timestamp(dog, 1000)
+        self.assertEqual(self.db.graph_version(), version)
+        snapshot = self.db.load_snapshot()
+        self.assertEqual(snapshot.concept_type(
+            snapshot.concept_index("whiskers")), "body part")
+
+
+class TestMemoryPolicy(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = ConceptDatabase(indexed=True,
+                                  path=join(self.tmp, "concepts.db"))
+        self.db.add_connections_bulk([
+            ("dog", "instance of", "mammal", 90),
+            ("cat", "instance of", "mammal", 90),
+            ("dog", "related", "bone", 8)])
+        self.now = int(time.time())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_decay(self):
+        policy = MemoryPolicy(self.db, half_life=3600, min_strength=5)
+        self.assertAlmostEqual(decayed_strength(80, 100, 100 + 7200, 3600),
+                               20)
+        self.assertEqual(policy.archive_decayed(self.now), 0)
+        # the weak connection falls below min_strength first
+        self.assertEqual(policy.archive_decayed(self.now + 3600), 1)
+        self.assertFalse(self.db.connection_exists("related", "dog", "bone"))
+        self.assertEqual(self.db.total_connections(), 2)
+        # live connections keep their stored strength
+        self.assertEqual(sorted(c.strength for c in self.db.get_connections()),
+                         [90, 90])
+
+    def test_decay_cutoffs(self):
+        # the sql cutoffs archive exactly what decayed_strength says
+        policy = MemoryPolicy(self.db, half_life=3600, min_strength=10)
+        cons = [("n%d" % i, "related", "m%d" % i, i * 7 % 101)
+                for i in range(200)]
+        self.db.add_connections_bulk(cons)
+        for i, con in enumerate(self.db.get_connections()):
+            con.last_seen = self.now - i * 300
+        self.db.commit()
+        now = self.now + 1800
+        weak = set(c.id for c in self.db.get_connections()
+                   if decayed_strength(c.strength, c.last_seen, now,
+                                       3600) < 10)
+        self.assertTrue(0 < len(weak) < 203)
+        self.assertEqual(policy.archive_decayed(now), len(weak))
+        self.assertFalse(weak & set(c.id for c in self.db.get_connections()))
+
+    def test_expire_and_recall(self):
+        policy = MemoryPolicy(self.db, window=60)
+        dog = self.db.first_concept_by_name("dog").id
+        policy.touch([dog], now=self.now - 120)
+        self.assertEqual(policy.expire(self.now), 1)
+        self.assertIsNone(self.db.first_concept_by_name("dog"))
+        self.assertEqual(self.db.total_connections(), 1)
+        restored = policy.recall("dog")
+        self.assertEqual(len(restored), 2)
+        self.assertTrue(self.db.connection_exists("instance of", "dog",
+                                                  "mammal"))
+        self.assertEqual(policy.recall("dog"), [])
+
+    def test_cap(self):
+        policy = MemoryPolicy(self.db, max_concepts=3, eviction="lfu")
+        for name in ("dog", "mammal", "cat"):
+            concept = self.db.first_concept_by_name(name)
+            policy.touch([concept.id], now=self.now)
+        # use is not a crawl, crawlers still pick touched concepts
+        self.assertEqual(self.db.first_concept_by_name("dog").last_seen, 0)
+        self.assertEqual(self.db.first_concept_by_name("dog").last_used,
+                         self.now)
+        self.assertEqual(policy.enforce_cap(self.now), 1)
+        self.assertIsNone(self.db.first_concept_by_name("bone"))
+        self.assertEqual(self.db.total_concepts(), 3)
+        self.assertRaises(ValueError, MemoryPolicy, self.db, eviction="fifo")
+
+    def test_seen_again(self):
+        policy = MemoryPolicy(self.db, half_life=3600, min_strength=5,
+                              interval=60)
+        old = self.now - 7200
+        self.db.session.query(Connection).update({Connection.last_seen: old})
+        self.db.commit()
+        # duplicates are not inserted but refresh last_seen
+        self.assertIsNone(self.db.add_connection("dog", "bone", "related"))
+        self.assertEqual(self.db.add_connections_bulk(
+            [("cat", "instance of", "mammal", 90)]), [])
+        seen = dict(((c.source.name, c.target.name), c.last_seen)
+                    for c in self.db.get_connections())
+        self.assertEqual(seen[("dog", "mammal")], old)
+        self.assertGreaterEqual(seen[("dog", "bone")], self.now)
+        self.assertGreaterEqual(seen[("cat", "mammal")], self.now)
+        # so the weak connection survives decay
+        self.assertEqual(policy.maintain(self.now + 60), {
+            "decayed": 0, "expired": 0, "evicted": 0})
+        self.assertIsNone(policy.maintain(self.now + 90))
+        # the crawler touches what it crawls and only with its own database
+        crawler = BaseCrawler(self.db, max_crawl=1, threaded=False,
+                              policy=policy)
+        crawler.start_crawling(self.db.first_concept_by_name("cat"))
+        self.assertEqual(self.db.first_concept_by_name("cat").hits, 1)
+        other = ConceptDatabase(path=join(self.tmp, "other.db"))
+        self.assertRaises(ValueError, BaseCrawler, other, policy=policy)
+
+
+class TestMutationLog(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = ConceptDatabase(indexed=True,
+                                  path=join(self.tmp, "concepts.db"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_group_commit(self):
+        log = MutationLog(join(self.tmp, "mutations.log"))
+        threads = [threading.Thread(target=lambda: [
+            log.append("concept", name="c", description="", type="idea")
+            for _ in range(50)]) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertTrue(log.wait())
+        log.close()
+        records = read_log(log.path)
+        self.assertEqual([r["seq"] for r in records], list(range(1, 201)))
+        # a torn last line is dropped on reopen
+        with open(log.path, "ab") as f:
+            f.write(b'{"seq": 201, "op"')
+        log = MutationLog(log.path)
+        self.assertEqual(log.last_seq, 200)
+        self.assertEqual(log.append("concept", name="d", description="",
+                                    type="idea"), 201)
+        log.close()
+        self.assertEqual(len(read_log(log.path, after=200)), 1)
+
+    def test_writer(self):
+        writer = LoggedWriter(self.db)
+        writer.add_connection("dog", "mammal", "instance of")
+        writer.add_connections_bulk([("cat", "instance of", "mammal", 90)])
+        writer.add_concept("bird")
+        self.assertTrue(writer.sync(timeout=5))
+        self.assertEqual(self.db.total_connections(), 2)
+        self.assertEqual(self.db.total_concepts(), 4)
+        writer.close()
+        # a replica follows the same log
+        replica = ConceptDatabase(path=join(self.tmp, "replica.db"))
+        reader = LogReader(self.db.log_path)
+        apply_records(replica, reader.read())
+        self.assertTrue(replica.connection_exists("instance of", "cat",
+                                                  "mammal"))
+        # records after the checkpoint are replayed on start
+        log = MutationLog(self.db.log_path)
+        log.append("connections", connections=[["dog", "related", "cat", 10]])
+        log.close()
+        writer = LoggedWriter(self.db)
+        self.assertTrue(self.db.connection_exists("related", "dog", "cat"))
+        writer.close()
+
+    def test_compact(self):
+        writer = LoggedWriter(self.db, fsync=False, apply_batch=7,
+                              compact_size=1)
+        for i in range(20):
+            writer.add_concept("c%d" % i)
+        self.assertTrue(writer.sync(timeout=5))
+        writer.close()
+        self.assertEqual(self.db.total_concepts(), 20)
+        # only the checkpoint is left, numbering continues after it
+        records = [json.loads(line) for line in open(self.db.log_path)]
+        self.assertEqual(records, [{"seq": 20, "time": records[0]["time"],
+                                    "op": "checkpoint"}])
+        self.assertRaises(ValueError, read_log, self.db.log_path)
+        log = MutationLog(self.db.log_path)
+        self.assertEqual(log.append("concept", name="d", description="",
+                                    type="idea"), 21)
+        log.close()
+        # streamed in batches, also across a compaction
+        reader = LogReader(self.db.log_path, after=20)
+        self.assertEqual(len(reader.read(limit=1)), 1)
+        self.assertEqual(reader.read(), [])
+        log = MutationLog(self.db.log_path)
+        for name in ("e", "f", "g"):
+            log.append("concept", name=name, description="", type="idea")
+        self.assertTrue(log.wait())
+        self.assertEqual([r["name"] for r in reader.read(limit=2)],
+                         ["e", "f"])
+        self.assertTrue(log.compact(23))
+        log.close()
+        self.assertEqual([r["name"] for r in reader.read()], ["g"])
+        # a reader behind the checkpoint can not catch up
+        self.assertRaises(ValueError, LogReader(self.db.log_path, 21).read)
+
+    def test_applier_failure(self):
+        writer = LoggedWriter(self.db, fsync=False)
+        writer.log.append("invalid")
+        self.assertRaises(ValueError, writer.sync, 5)
+        self.assertRaises(RuntimeError, writer.add_concept, "dog")
+        self.assertRaises(ValueError, writer.close)
+
+
+class TestShardedStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = ShardedConceptDatabase(shards=3, directory=self.tmp)
+        self.db.add_connections_bulk([
+            ("dog", "instance of", "mammal", 90),
+            ("cat", "instance of", "mammal", 90),
+            ("mammal", "instance of", "animal", 80),
+            ("dog", "related", "cat", 40)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_routing(self):
+        self.assertEqual(self.db.total_concepts(), 4)
+        self.assertEqual(self.db.total_connections(), 4)
+        self.assertEqual(self.db.first_concept_by_name("dog").type, "idea")
+        self.assertTrue(self.db.connection_exists("related", "dog", "cat"))
+        self.assertFalse(self.db.connection_exists("related", "cat", "dog"))
+        # outgoing connections live with their source
+        shard = self.db.shard_for("dog")
+        self.assertEqual(len(shard.search_connection_by_concept(
+            "dog", direction="out")), 2)
+        cons = self.db.search_connection_by_concept("mammal", direction="in")
+        self.assertEqual(sorted(c.source.name for c in cons), ["cat", "dog"])
+        self.assertIsNone(self.db.add_connection("dog", "cat", "related"))
+
+    def test_aliases(self):
+        # an alias hashed away from its concept still finds it
+        alias = next(a for a in ("doggy", "hound", "pooch", "canine", "mutt")
+                     if shard_of(a, 3) != shard_of("dog", 3))
+        self.assertEqual(self.db.add_alias(alias, "dog").name, "dog")
+        self.assertEqual(self.db.first_concept_by_name(alias).type, "idea")
+        self.assertEqual([c.name for c in
+                          self.db.search_concept_by_name(alias)], ["dog"])
+        self.assertTrue(self.db.connection_exists("related", alias, "cat"))
+        self.assertEqual(len(self.db.search_connection_by_concept(
+            alias, direction="out")), 2)
+        self.assertEqual(self.db.total_concepts(), 4)
+
+    def test_self_loop(self):
+        self.db.add_connection("dog", "dog", "related")
+        cons = self.db.search_connection_by_concept("dog")
+        self.assertEqual(len(cons), 3)
+        self.assertEqual(len(set((c.source.name, c.type, c.target.name)
+                                 for c in cons)), 3)
+
+    def test_neighbourhood(self):
+        self.assertEqual(self.db.search_neighbourhood("dog", hops=2,
+                                                      types=["instance of"]),
+                         {"dog": 0, "mammal": 1, "animal": 2})
+        self.assertEqual(self.db.search_neighbourhood("mammal",
+                                                      direction="in"),
+                         {"mammal": 0, "dog": 1, "cat": 1})
+        self.assertEqual(self.db.search_neighbourhood("invalid"), {})
+
+    def test_crawlers(self):
+        self.db.add_connection("bird", "animal", "instance of", None)
+        self.assertEqual(len(self.db.search_connection_by_concept(
+            "animal", direction="in")), 2)
+        crawler = BaseCrawler(self.db, max_crawl=10, threaded=False)
+        crawler.start_crawling(self.db.first_concept_by_name("cat"))
+        # neighbours are found across shards, references are not crawled
+        self.assertEqual(sorted(crawler.crawl_list),
+                         ["animal", "bird", "cat", "dog", "mammal"])
+        self.assertTrue(self.db.first_concept_by_name("animal").last_seen)
+        graph = {"bird": [("related", "wing", 50)],
+                 "wing": [("part of", "bird", 60)]}
+        pool = CrawlerPool(self.db, workers=2, refresh_interval=0,
+                           sources={"graph": lambda n: graph.get(n, [])})
+        pool.start_crawling("bird", threaded=False)
+        pool.close()
+        self.assertEqual(sorted(pool.crawl_list), ["bird", "wing"])
+        self.assertTrue(self.db.connection_exists("part of", "wing", "bird"))
+        self.assertTrue(self.db.first_concept_by_name("wing").last_seen)
+        # fixes go to the home shard of the crawled node
+        self.db.add_connection("cat", "cat", "label")
+        crawler = MaintenanceCrawler(self.db, max_crawl=1, threaded=False,
+                                     refresh_interval=0)
+        crawler.start_crawling(self.db.first_concept_by_name("cat"))
+        self.assertIn("cat", crawler.crawl_list)
+        self.assertFalse(self.db.connection_exists("label", "cat", "cat"))
+        self.assertTrue(self.db.connection_exists("related", "dog", "cat"))
+
+    def test_dbpedia_crawler(self):
+        from lilacs.processing.crawlers.dbpedia_crawler import \
+            DBpediaBaseCrawler
+        self.db.add_connection("puppy", "dog", "label")
+        crawler = DBpediaBaseCrawler(self.db, threaded=False)
+        crawler.start_node = crawler.current_node = \
+            self.db.first_concept_by_name("dog")
+        # incoming labels are followed across shards
+        self.assertEqual(crawler.choose_next_node([]).name, "puppy")
+
+
+class TestExchange(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = ConceptDatabase(path=join(self.tmp, "concepts.db"))
+        self.db.add_concept("elon musk", type="person")
+        self.db.add_connections_bulk([
+            ("elon musk", "label", "person", 90),
+            ("dog", "instance of", "mammal", 70),
+            ("dog", "related", "cat <3", 10)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_round_trip(self):
+        for format, strength in (("nt", 50), ("bin", 70)):
+            path = export_graph(self.db, join(self.tmp, "graph." + format),
+                                format)
+            db = ConceptDatabase(path=join(self.tmp, format + ".db"))
+            self.assertEqual(import_graph(db, path, format, chunk_size=2),
+                             (5, 3))
+            self.assertEqual(db.total_concepts(), 5)
+            self.assertEqual(db.total_connections(), 3)
+            self.assertEqual(db.first_concept_by_name("elon musk").type,
+                             "person")
+            self.assertTrue(db.connection_exists("related", "dog", "cat <3"))
+            con = db.search_connection_by_concept_pair("dog", "mammal")[0]
+            self.assertEqual(con.strength, strength)
+            # importing twice adds nothing
+            import_graph(db, path, format)
+            self.assertEqual(db.total_connections(), 3)
+
+    def test_binary_strengths(self):
+        records = [("connection", "dog", "related", "cat", 62.5),
+                   ("connection", "dog", "related", "bone", 80)]
+        data = b"".join(iter_binary(records))
+        self.assertEqual(list(parse_binary(io.BytesIO(data))), records)
+        self.assertRaises(ValueError, list,
+                          parse_binary(io.BytesIO(b"LILACSX2" + data[8:])))
+
+    def test_turtle(self):
+        turtle = "".join(iter_turtle(iter_records(self.db)))
+        self.assertIn("@prefix c: <urn:lilacs:concept:> .", turtle)
+        self.assertIn("c:elon%20musk a t:person .", turtle)
+        self.assertIn("c:dog r:instance%20of c:mammal ;\n"
+                      "    r:related c:cat%20%3C3 .", turtle)
+        self.db.add_connection("dog", "dr.", "related")
+        turtle = "".join(iter_turtle(iter_records(self.db)))
+        # local names can not end in a dot, full IRIs are written instead
+        self.assertIn("<urn:lilacs:concept:dr.>", turtle)
+        self.assertRaises(ValueError, export_graph, self.db,
+                          join(self.tmp, "graph.xml"), "xml")
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = ConceptDatabase(path=join(self.tmp, "search.db"))
+        self.db.add_concept("elon musk", "founder of spacex and tesla",
+                            type="person")
+        self.db.add_concept("tesla", "electric car maker")
+        self.db.add_concept("nikola tesla", "inventor of alternating current",
+                            type="person")
+        self.db.add_alias("musk", "elon musk")
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp)
+
+    def names(self, concepts):
+        return [c.name for c in concepts]
+
+    def test_words(self):
+        # names outrank descriptions
+        self.assertEqual(self.names(self.db.search_concepts("tesla",
+                                                            fuzzy=False)),
+                         ["tesla", "nikola tesla", "elon musk"])
+        self.assertEqual(self.names(self.db.search_concepts("alternating")),
+                         ["nikola tesla"])
+        # the last word matches as a prefix
+        self.assertEqual(self.names(self.db.search_concepts("nik")),
+                         ["nikola tesla"])
+
+    def test_fuzzy(self):
+        self.assertEqual(self.names(self.db.search_concepts("elon muks")),
+                         ["elon musk"])
+        self.assertEqual(self.names(self.db.search_concepts("nicola tesla",
+                                                            limit=1)),
+                         ["nikola tesla"])
+        self.assertEqual(self.db.search_concepts("zzzz"), [])
+        # renamed concepts are searched under their new name
+        concept = self.db.first_concept_by_name("tesla")
+        concept.name = "tesla motors"
+        self.db.commit()
+        self.assertEqual(self.names(self.db.search_concepts("motors")),
+                         ["tesla motors"])
+
+    def test_complete(self):
+        self.assertEqual(self.names(self.db.complete_concept_name("Mu")),
+                         ["elon musk"])
+        self.assertEqual(self.names(self.db.complete_concept_name("e")),
+                         ["elon musk"])
+        self.assertEqual(self.db.complete_concept_name("x"), [])
+
+    def test_missing_rows(self):
+        # e.g. deleted by another process between the two queries
+        self.db.session.execute(text(
+            "DROP TRIGGER concepts_search_delete"))
+        self.db.session.execute(text(
+            "DELETE FROM concepts WHERE name = 'tesla'"))
+        self.db.commit()
+        self.assertEqual(self.names(self.db.search_concepts("tesla",
+                                                            fuzzy=False)),
+                         ["nikola tesla", "elon musk"])
+
+    def test_created_without_fts(self):
+        self.db.close()
+        self.db.db.dispose()
+        engine = create_engine("sqlite:///" + join(self.tmp, "search.db"))
+        with engine.begin() as connection:
+            for name, in connection.execute(text(
+                    "SELECT name FROM sqlite_master WHERE name LIKE "
+                    "'%search%' AND type = 'trigger'")).fetchall():
+                connection.execute(text("DROP TRIGGER %s" % name))
+            connection.execute(text("DROP TABLE concept_fts"))
+            connection.execute(text("DROP TABLE alias_trigrams"))
+        engine.dispose()
+        # the index is created once sqlite supports FTS5, with the rows
+        # added before
+        self.db = ConceptDatabase(path=join(self.tmp, "search.db"))
+        self.assertEqual(self.names(self.db.search_concepts("alternating")),
+                         ["nikola tesla"])
+
+
+class TestVectors(unittest.TestCase):
+    vectors = {"king": [0.9, 0.3, 0.1], "queen": [0.9, 0.1, 0.3],
+               "man": [0.1, 0.9, 0.1], "woman": [0.1, 0.1, 0.9],
+               "dog": [-0.5, 0.2, 0.2]}
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = ConceptDatabase(path=join(self.tmp, "concepts.db"))
+        for name in ["King", "queen", "man", "woman", "dog", "cat"]:
+            self.db.add_concept(name)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp)
+
+    def test_similar(self):
+        vectors = self.db.build_vectors(
+            lambda name: self.vectors.get(name.lower()))
+        # cat has no vector
+        self.assertEqual(len(vectors), 5)
+        self.assertEqual(self.db.similar_concepts("king", 1)[0][0], "queen")
+        self.assertEqual(vectors.analogy("man", "King", "woman", 1)[0][0],
+                         "queen")
+        self.assertEqual(self.db.similar_concepts("cat"), [])
+        rows, scores = vectors.search([[0.1, 0.9, 0.1], [0.1, 0.1, 0.9]], 2)
+        self.assertEqual([vectors.keys[r] for r in rows[:, 0]],
+                         ["man", "woman"])
+        self.assertAlmostEqual(scores[0, 0], 1.0, places=5)
+        # memory mapped copy answers the same
+        vectors = self.db.load_vectors()
+        self.assertEqual(vectors.analogy("man", "king", "woman", 1)[0][0],
+                         "queen")
+        vectors.add(["cat"], [[-0.5, 0.2, 0.3]])
+        self.assertEqual(vectors.similar("dog", 1)[0][0], "cat")
+
+    def test_new_concepts(self):
+        embed = lambda name: self.vectors.get(name.lower())
+        self.db.build_vectors(embed)
+        self.vectors = dict(self.vectors, puppy=[-0.5, 0.2, 0.21])
+        self.db.add_concept("puppy")
+        # embedded before searching, the saved copy is left alone
+        self.assertEqual(self.db.similar_concepts("dog", 1)[0][0], "puppy")
+        db = ConceptDatabase(path=join(self.tmp, "concepts.db"))
+        self.assertEqual(db.load_vectors(embed=embed).last_concept_id, 6)
+        self.assertEqual(db.similar_concepts("dog", 1)[0][0], "puppy")
+        self.assertNotIn("puppy", VectorIndex.load(db.vectors_path))
+        # saves what was embedded while searching
+        self.assertEqual(db.update_vectors(), 0)
+        self.assertEqual(VectorIndex.load(db.vectors_path).similar(
+            "dog", 1)[0][0], "puppy")
+        self.assertRaises(ValueError, ConceptDatabase(
+            path=join(self.tmp, "other.db")).update_vectors)
+
+    def test_ivf(self):
+        random = __import__("numpy").random.RandomState(1)
+        data = random.normal(size=(2000, 16))
+        names = ["v%d" % i for i in range(len(data))]
+        exact = VectorIndex(16)
+        exact.add(names, data)
+        ivf = VectorIndex(16)
+        ivf.add(names, data)
+        ivf.train(n_lists=20, n_probe=20)
+        # probing every list is exhaustive
+        self.assertEqual(ivf.similar("v7", 5), exact.similar("v7", 5))
+        ivf.n_probe = 4
+        recall = sum(ivf.similar(name, 1)[0][0] == exact.similar(name, 1)[0][0]
+                     for name in names[:100])
+        self.assertGreater(recall, 70)
+        # added after training, still found
+        ivf.add(["new"], [data[3] * 2])
+        self.assertEqual(ivf.similar("v3", 1)[0][0], "new")
+        ivf = VectorIndex.load(ivf.save(join(self.tmp, "ivf.vectors")))
+        self.assertEqual(ivf.similar("v3", 1)[0][0], "new")
+
+
+class TestCrawlerPool(unittest.TestCase):
+    graph = {"dog": [("instance of", "mammal", 60), ("link", "http://dog", 50)],
+             "mammal": [("instance of", "animal", 60),
+                        ("synonym", "mammalian", 50)],
+             "animal": [("related", "dog", 50)]}
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = ConceptDatabase(path=join(self.tmp, "concepts.db"))
+        self.active = 0
+        self.most_active = 0
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp)
+
+    def slow_source(self, name):
+        with self.lock:
+            self.active += 1
+            self.most_active = max(self.most_active, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        return self.graph.get(name, [])
+
+    def broken_source(self, name):
+        raise IOError("offline")
+
+    def test_frontier(self):
+        frontier = Frontier()
+        self.assertTrue(frontier.put("Dog"))
+        self.assertFalse(frontier.put("dog"))
+        self.assertEqual(frontier.get(), "Dog")
+        # a worker is still crawling, it may find more names
+        frontier.put("cat")
+        frontier.task_done()
+        self.assertEqual(frontier.get(), "cat")
+        frontier.task_done()
+        self.assertIsNone(frontier.get())
+
+    def test_crawl(self):
+        pool = CrawlerPool(self.db, workers=4,
+                           sources={"graph": self.slow_source,
+                                    "broken": self.broken_source},
+                           limits={"graph": 2})
+        pool.symmetric_types = ["synonym"]
+        pool.start_crawling(["dog", "mammal", "animal", "cat", "bird"],
+                            threaded=False)
+        pool.close()
+        self.assertEqual(pool.total_steps, 6)
+        self.assertEqual(sorted(pool.crawl_list),
+                         ["animal", "bird", "cat", "dog", "mammal",
+                          "mammalian"])
+        # never more than the limit of concurrent requests per source
+        self.assertEqual(self.most_active, 2)
+        self.assertEqual(pool.errors["broken"], 6)
+        self.assertEqual(self.db.total_connections(), 6)
+        self.assertTrue(self.db.connection_exists("synonym", "mammalian",
+                                                  "mammal"))
+        self.assertTrue(self.db.first_concept_by_name("dog").last_seen)
+        # also nodes nothing was found for
+        self.assertTrue(self.db.first_concept_by_name("bird").last_seen)
+        self.assertEqual(len(pool.failures), 6)
+        self.assertEqual(pool.failures[0][1], "broken")
+        self.assertIsInstance(pool.failures[0][2], IOError)
+        # crawled nodes are not crawled again within the refresh interval
+        pool = CrawlerPool(self.db, sources={"graph": self.slow_source})
+        pool.start_crawling(["dog", "bird"], threaded=False)
+        pool.close()
+        self.assertEqual(pool.total_steps, 0)
+
+
+class TestCrawlScheduler(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = ConceptDatabase(path=join(self.tmp, "concepts.db"))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp)
+
+    def test_priority(self):
+        scheduler = CrawlScheduler(max_depth=2)
+        scheduler.push("dog")
+        self.assertEqual(scheduler.pop(), "dog")
+        scheduler.push("mammal", "dog", 60)
+        scheduler.push("pet", "dog", 90)
+        scheduler.push("wolf", "mammal", 90)
+        # linked from a second crawled node
+        scheduler.push("Mammal", "pet", 50)
+        self.assertFalse(scheduler.push("puppy", "wolf"))
+        self.assertEqual(len(scheduler), 3)
+        self.assertEqual(scheduler.depth("wolf"), 2)
+        self.assertEqual([scheduler.pop() for _ in range(4)],
+                         ["mammal", "pet", "wolf", None])
+        # popped names are never queued again
+        self.assertFalse(scheduler.push("pet", "dog"))
+        self.assertNotIn("pet", scheduler)
+
+    def test_updates(self):
+        scheduler = CrawlScheduler()
+        for i in range(1000):
+            scheduler.push("node %d" % (i % 10), "seed", i % 100)
+        # replaced heap entries do not pile up
+        self.assertLess(len(scheduler._heap), 100)
+        self.assertEqual(len(set(iter(scheduler.pop, None))), 10)
+        # compaction keeps only the names still queued
+        for i in range(200):
+            scheduler.push("other %d" % i, "seed")
+        for _ in range(195):
+            scheduler.pop()
+        for i in range(100):
+            scheduler.push("other %d" % (195 + i % 5), "seed")
+        self.assertEqual(len(scheduler), 5)
+        self.assertLess(len(scheduler._heap), 2 * 5 + 66)
+
+    def test_crawler(self):
+        self.db.add_connections_bulk([
+            ("dog", "instance of", "mammal", 60),
+            ("dog", "related", "pet", 90),
+            ("mammal", "instance of", "animal", 60),
+            ("pet", "related", "cat", 50),
+            ("cat", "instance of", "mammal", 60),
+            ("dog", "link", "http://dog", 50)])
+        self.db.add_concept("stone")
+        crawler = BaseCrawler(self.db, max_crawl=10, threaded=False)
+        crawler.start_crawling(self.db.first_concept_by_name("dog"))
+        # closest and most linked first, the rest of the database last
+        self.assertEqual(crawler.crawl_list,
+                         ["dog", "pet", "mammal", "cat", "animal", "stone"])
+        self.assertEqual(crawler.total_steps, 6)
+        self.assertTrue(self.db.first_concept_by_name("stone").last_seen)
+        self.assertEqual(crawler._crawled, set(crawler.crawl_list))
+        # a new crawl pages through the stale concepts from the start,
+        # not from where the last one stopped
+        crawler._stale_cursors[0] = (int(time.time()), 10 ** 6)
+        self.db.add_concept("moss")
+        crawler.start_crawling(self.db.first_concept_by_name("animal"))
+        self.assertEqual(crawler.crawl_list[-2:], ["animal", "moss"])
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = ResponseCache(join(self.tmp, "responses.db"))
+        self.calls = 0
+
+    def tearDown(self):
+        set_cache(None)
+        self.cache.close()
+        shutil.rmtree(self.tmp)
+
+    def lookup(self, subject):
+        self.calls += 1
+        return {"subject": subject, "cons": [["IsA", "animal"]]}
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get("conceptnet", "dog"))
+        self.cache.set("conceptnet", ["get", "http://x/dog"], {"a": [1, 2]})
+        self.cache.set("conceptnet", request_params("get", "http://x/dog", {}),
+                       {"a": [1, 2]})
+        # whitespace in urls and query parameters does not change the key
+        self.assertEqual(self.cache.get("conceptnet", request_params(
+            "get", " http://x/dog ", {})), {"a": [1, 2]})
+        self.assertEqual(request_params("get", "http://x", {
+            "params": {"q": " a  dog"}, "data": "a  dog"}),
+            ["get", "http://x", {"params": {"q": "a dog"}, "data": "a  dog"}])
+        self.assertNotEqual(self.cache.key("test", [" dog"]),
+                            self.cache.key("test", ["dog"]))
+        self.assertIsNone(self.cache.get("dbpedia", ["get", "http://x/dog"]))
+        stats = self.cache.stats()
+        self.assertEqual(stats["entries"], 2)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["endpoints"]["conceptnet"]["hits"], 1)
+        # entries survive reopening the file
+        self.cache.close()
+        self.cache = ResponseCache(join(self.tmp, "responses.db"))
+        self.assertEqual(self.cache.get("conceptnet", ["get", "http://x/dog"]),
+                         {"a": [1, 2]})
+        self.cache.clear("conceptnet")
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_ttl(self):
+        self.cache.set("wikidata", "dog", [1], ttl=-1)
+        self.cache.set("wikidata", "cat", [2], ttl=None)
+        self.assertIsNone(self.cache.get("wikidata", "dog"))
+        self.assertEqual(self.cache.get("wikidata", "cat"), [2])
+        self.cache.evict()
+        self.assertEqual(self.cache.stats()["entries"], 1)
+
+    def test_lru_eviction(self):
+        self.cache.max_size = 2000
+        for i in range(20):
+            # random text barely compresses
+            self.cache.set("random", i, os.urandom(150).hex())
+            # the first entry stays in use
+            self.cache.get("random", 0)
+        self.assertLessEqual(self.cache.size, 2000)
+        self.assertIsNotNone(self.cache.get("random", 0))
+        self.assertIsNotNone(self.cache.get("random", 19))
+        self.assertIsNone(self.cache.get("random", 1))
+
+    def test_decorator(self):
+        lookup = cached("test")(self.lookup)
+        set_cache(self.cache)
+        self.assertIs(get_cache(), self.cache)
+        self.assertEqual(lookup("dog"), lookup("dog"))
+        self.assertEqual(self.calls, 1)
+        lookup("cat")
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.cache.stats()["endpoints"]["test"],
+                         {"entries": 2, "hits": 1, "misses": 2})
+        # empty results, e.g. of a lookup that swallowed an error, are
+        # asked again
+        empty = cached("empty")(lambda subject: self.lookup(subject) and [])
+        self.assertEqual(empty("dog"), [])
+        self.assertEqual(empty("dog"), [])
+        self.assertEqual(self.calls, 4)
+        empty = cached("empty", cache_empty=True)(empty.__wrapped__)
+        empty("dog")
+        empty("dog")
+        self.assertEqual(self.calls, 5)
+        empty = cached("empty dict", is_empty=lambda d: not any(d.values()))(
+            lambda subject: self.lookup(subject) and {"synonym": []})
+        empty("dog")
+        empty("dog")
+        self.assertEqual(self.calls, 7)
+
+    def test_decorator_defaults(self):
+        set_cache(self.cache)
+
+        def lookup(subject, url="http://host", language="en"):
+            self.calls += 1
+            return [subject, url, language]
+        lookup = cached("test")(lookup)
+        lookup("dog")
+        lookup("dog", "http://host")
+        lookup("dog", language="en")
+        lookup(subject="dog", url="http://host")
+        self.assertEqual(self.calls, 1)
+        lookup("dog", "http://other")
+        self.assertEqual(self.calls, 2)
+
+    def test_memory_tier(self):
+        self.cache.set("conceptnet", "dog", {"edges": [1]})
+        first = self.cache.get("conceptnet", "dog")
+        # callers get their own copy
+        first["edges"].append(2)
+        self.assertEqual(self.cache.get("conceptnet", "dog"), {"edges": [1]})
+        self.assertEqual(len(self.cache._memory), 1)
+        # updates replace the copy in memory
+        self.cache.set("conceptnet", "dog", {"edges": [3]})
+        self.assertEqual(self.cache.get("conceptnet", "dog"), {"edges": [3]})
+        self.cache.delete("conceptnet", "dog")
+        self.assertIsNone(self.cache.get("conceptnet", "dog"))
+        self.cache.memory = 2
+        for name in ("cat", "bird", "fish"):
+            self.cache.set("conceptnet", name, name)
+            self.cache.get("conceptnet", name)
+        self.assertEqual(list(self.cache._memory),
+                         [self.cache.key("conceptnet", "bird"),
+                          self.cache.key("conceptnet", "fish")])
+        self.assertEqual(self.cache.stats()["hits"], 6)
+
+    def test_import_pickle_cache(self):
+        import hashlib
+        import pickle
+        from lilacs.memory.data_sources.dbpedia import cached_query, \
+            cached_ontology_type, import_pickle_cache
+        folder = join(self.tmp, ".dbpedia_cache")
+        os.mkdir(folder)
+        dblink = "http://dbpedia.org/resource/Dog"
+        query = "SELECT ?x WHERE { <http://dbpedia.org/resource/Dog> ?p ?x }"
+        results = [{"x": {"type": "uri", "value": "http://dbpedia.org/Cat"}}]
+        digest = hashlib.sha256(query.encode("utf-8")).hexdigest()
+        with open(join(folder, digest), "wb") as fd:
+            pickle.dump(results, fd)
+        link_digest = hashlib.sha256(dblink.encode("utf-8")).hexdigest()
+        with open(join(folder, link_digest + ".ontologytype"), "wb") as fd:
+            pickle.dump("http://dbpedia.org/ontology/Animal", fd)
+        with open(join(folder, "notes.txt"), "w") as fd:
+            fd.write("not a cache entry")
+        self.assertEqual(import_pickle_cache(folder, self.cache, remove=True),
+                         (2, 1))
+        self.assertEqual(os.listdir(folder), ["notes.txt"])
+        # answered from the cache without a network request
+        self.assertEqual(cached_query(query, self.cache), results)
+        self.assertEqual(cached_ontology_type(dblink, self.cache),
+                         "http://dbpedia.org/ontology/Animal")
+        self.assertIsNone(cached_query("SELECT ?y", self.cache))
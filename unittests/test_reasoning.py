@@ -98,6 +98,11 @@ class TestReasoner(unittest.TestCase):
                                                 parser),
                          ['sleekest', 'sneakiest', 'best-connected'])
 
+        # batches share one matrix product
+        self.assertEqual(LILACSReasoner.analogies(
+            [("man", "king", "woman"), ("walk", "walked", "go")], parser,
+            n=1), [["queen"], ["went"]])
+
 
 if __name__ == "__main__":
     unittest.main()